@@ -0,0 +1,89 @@
+# Description: Cold import time of the ssi_trading modules.
+# Each module is imported in a fresh interpreter with -X importtime, the cumulative time of the module
+# is compared with its budget and the heavy dependencies it loaded are listed.
+# Usage: python benchmarks/import_time.py [--repeat 5]
+# Exit code is 1 when a module is over its budget or loads a heavy dependency it must not load.
+import argparse
+import os
+import subprocess
+import sys
+
+# module -> budget in milliseconds, the median of the runs is checked
+BUDGETS = {
+    "ssi_trading": 30,
+    "ssi_trading.client": 30,
+    "ssi_trading.streamer": 30,
+    "ssi_trading.config": 30,
+    "ssi_trading.server": 120,
+    "ssi_trading.services.paper.futures": 120,
+    "ssi_trading.services.paper.fundamental": 120,
+    "ssi_trading.services.stream.market": 60,
+    "ssi_trading.services.stream.bar": 60,
+    "ssi_trading.services.stream.index": 60,
+    "ssi_trading.services.stream.fr": 60,
+}
+
+# dependencies which must only be loaded by the code paths using them
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "ssi_fc_data", "ssi_fctrading", "requests", "langchain_community"]
+# modules of the 30 ms group must not load any heavy module
+LIGHT_BUDGET = 30
+# heavy modules other modules must not load, the data streams only load pandas and pyarrow on export
+_STREAM_FORBIDDEN = ["pandas", "numpy", "pyarrow", "ssi_fc_data", "ssi_fctrading"]
+FORBIDDEN = {
+    "ssi_trading.services.stream.market": _STREAM_FORBIDDEN,
+    "ssi_trading.services.stream.bar": _STREAM_FORBIDDEN,
+    "ssi_trading.services.stream.index": _STREAM_FORBIDDEN,
+    "ssi_trading.services.stream.fr": _STREAM_FORBIDDEN,
+}
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> (float, list):
+    """
+    :param module:
+    :return: cumulative import time in milliseconds, heavy modules loaded by the import
+    """
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_ROOT, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=env, check=True
+    )
+    # import time: self [us] | cumulative | imported package
+    cumulative = None
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            cumulative = int(parts[1])
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return (cumulative or 0) / 1000, loaded
+
+
+def main() -> int:
+    args_parser = argparse.ArgumentParser(description=__doc__)
+    args_parser.add_argument("--repeat", type=int, default=5, help="runs per module, the median is reported")
+    args = args_parser.parse_args()
+
+    failed = []
+    print(f"{'module':45} {'median ms':>10} {'budget ms':>10}  heavy modules")
+    for module, budget in BUDGETS.items():
+        runs = [measure(module) for _ in range(args.repeat)]
+        times = sorted(elapsed for elapsed, _ in runs)
+        median = times[len(times) // 2]
+        loaded = runs[-1][1]
+        forbidden = HEAVY_MODULES if budget <= LIGHT_BUDGET else FORBIDDEN.get(module, [])
+        heavy = any(name in forbidden for name in loaded)
+        status = ("" if median <= budget else "  OVER BUDGET") + ("  HEAVY IMPORT" if heavy else "")
+        print(f"{module:45} {median:10.1f} {budget:10d}  {', '.join(loaded) or '-'}{status}")
+        if median > budget or heavy:
+            failed.append(module)
+
+    if failed:
+        print(f"{len(failed)} modules over budget or loading heavy modules: {failed}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,11 @@ setup(
         'uvicorn',
         # Add other dependencies as needed
     ],
+    extras_require={
+        'arrow': ['pyarrow'],
+        'gateway': ['msgpack', 'pyzmq'],
+        'yaml': ['pyyaml'],
+    },
     entry_points={
         'console_scripts': [
             'ssi_trading_cli = ssi_trading.cli:main',  # Replace with your CLI entry point
@@ -1,6 +1,23 @@
 import logging
 
+from ssi_trading.lazy import lazy_attributes
+
 logging.basicConfig(
     level=logging.DEBUG,  # Set the minimum log level to output (DEBUG, INFO, WARNING, ERROR, CRITICAL)
     format='%(asctime)s - %(levelname)s - %(message)s'  # Define the log message format
 )
+
+# public names are imported on first access
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "DataServiceConfig": "ssi_trading.config",
+    "TradingServiceConfig": "ssi_trading.config",
+    "SSIServices": "ssi_trading.server",
+    "load_services": "ssi_trading.loader",
+    "ReferenceDataStore": "ssi_trading.reference",
+    "TickArchive": "ssi_trading.archive",
+    "Ledger": "ssi_trading.ledger",
+    "PortfolioEngine": "ssi_trading.portfolio",
+    "AggregatedPortfolio": "ssi_trading.portfolio",
+    "ExecutionScheduler": "ssi_trading.execution",
+    "StopTriggerEngine": "ssi_trading.triggers",
+})
@@ -0,0 +1,180 @@
+# Description: End of day archive of the stream data.
+# Each trading day the stored data of the data streams is written to a hive partitioned parquet dataset:
+#   <root>/date=2024-06-27/channel=X/symbol=VN30F2407/part-0.parquet
+# and read back with partition pruning and predicate pushdown, only the files and row groups of the query are read.
+import datetime
+import logging
+import os
+import threading
+from typing import List, Union, Iterable
+
+from pandas import DataFrame
+
+from ssi_trading.arrow import to_arrow, _require_pyarrow
+from ssi_trading.config import ARCHIVE_DIR, ARCHIVE_CLOSE_TIME
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_ds
+    import pyarrow.parquet as pq
+except ImportError:
+    # TickArchive raises on creation
+    pa = None
+    pa_ds = None
+    pq = None
+
+# repeated string columns are dictionary encoded
+_DICTIONARY_COLUMNS = ["symbol", "name", "trading_time"]
+
+
+def _day(value: Union[str, datetime.date, datetime.datetime, None]) -> str:
+    if value is None:
+        return datetime.date.today().isoformat()
+    if isinstance(value, str):
+        return value
+    return value.strftime("%Y-%m-%d")
+
+
+class TickArchive:
+    def __init__(self, root: str = ARCHIVE_DIR, compression: str = "zstd", compression_level: int = None):
+        """
+        :param root: root directory of the dataset
+        :param compression: zstd, snappy, gzip or none
+        :param compression_level: default level of the codec
+        """
+        _require_pyarrow()
+        self.root = root
+        self.compression = compression
+        self.compression_level = compression_level
+        self._partitioning = pa_ds.partitioning(
+            pa.schema([("date", pa.string()), ("channel", pa.string()), ("symbol", pa.string())]), flavor="hive"
+        )
+        self._stop_event = threading.Event()
+        self._writer_thread: Union[threading.Thread, None] = None
+
+    # region write
+    def write(self, df: DataFrame, channel: str, symbol: str, trading_date=None) -> Union[str, None]:
+        """
+        Write the data of a symbol for a day, an existing partition of the same day is replaced
+        :param df:
+        :param channel: DataChannel
+        :param symbol:
+        :param trading_date: date or yyyy-mm-dd, default today
+        :return: path of the written file, None if df is empty
+        """
+        if df is None or df.empty:
+            return None
+        # partition keys are restored from the path
+        table = to_arrow(df.drop(columns=["symbol"], errors="ignore"))
+        directory = os.path.join(self.root, f"date={_day(trading_date)}", f"channel={channel}", f"symbol={symbol}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "part-0.parquet")
+        tmp_path = f"{path}.tmp"
+        pq.write_table(
+            table, tmp_path,
+            compression=self.compression,
+            compression_level=self.compression_level,
+            use_dictionary=[name for name in _DICTIONARY_COLUMNS if name in table.column_names]
+        )
+        os.replace(tmp_path, path)
+        return path
+
+    def write_stream(self, stream, trading_date=None) -> List[str]:
+        """
+        Write the stored data of every symbol of a data stream
+        :param stream: BaseDataStream
+        :param trading_date: default today
+        :return: written files
+        """
+        paths = []
+        for symbol in stream._names:
+            try:
+                path = self.write(stream.get_dataframe(symbol), stream.channel_name, symbol, trading_date)
+                if path is not None:
+                    paths.append(path)
+            except Exception as ex:
+                logging.exception(f"Error while archiving {stream.channel_name}:{symbol}: {ex}")
+        logging.info(f"Archived {len(paths)} symbols of channel {stream.channel_name}")
+        return paths
+
+    def write_streams(self, streams: Iterable, trading_date=None) -> List[str]:
+        return [path for stream in streams for path in self.write_stream(stream, trading_date)]
+    # endregion
+
+    # region query
+    def dataset(self):
+        return pa_ds.dataset(self.root, format="parquet", partitioning=self._partitioning)
+
+    def read(
+            self, channel: str,
+            start_date=None, end_date=None,
+            symbols: List[str] = None,
+            columns: List[str] = None,
+            filter=None
+    ):
+        """
+        Read archived data, partitions outside the query are never opened
+        :param channel: DataChannel
+        :param start_date: date or yyyy-mm-dd, default today
+        :param end_date: default start_date
+        :param symbols: default all symbols
+        :param columns: default all columns
+        :param filter: extra pyarrow.dataset expression pushed down to the row groups, ex: pa_ds.field("current_price") > 1280
+        :return: pyarrow.Table with date, channel and symbol columns
+        """
+        if not os.path.isdir(self.root):
+            return pa.table({})
+        start_date = _day(start_date)
+        end_date = _day(end_date) if end_date is not None else start_date
+        expression = (
+            (pa_ds.field("channel") == channel)
+            & (pa_ds.field("date") >= start_date)
+            & (pa_ds.field("date") <= end_date)
+        )
+        if symbols is not None:
+            expression = expression & pa_ds.field("symbol").isin(symbols)
+        if filter is not None:
+            expression = expression & filter
+        return self.dataset().to_table(columns=columns, filter=expression)
+
+    def read_dataframe(self, channel: str, start_date=None, end_date=None, symbols: List[str] = None, columns: List[str] = None, filter=None) -> DataFrame:
+        return self.read(channel, start_date, end_date, symbols, columns, filter).to_pandas()
+
+    def dates(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name.split("=", 1)[1] for name in os.listdir(self.root) if name.startswith("date="))
+    # endregion
+
+    # region end of day
+    def _run(self, streams: List, close_time: datetime.time):
+        archived_day = None
+        while not self._stop_event.wait(30):
+            now = datetime.datetime.now()
+            if now.time() >= close_time and archived_day != now.date():
+                self.write_streams(streams, now.date())
+                archived_day = now.date()
+
+    def start(self, streams: Iterable, close_time: str = ARCHIVE_CLOSE_TIME):
+        """
+        Archive the streams every day after the session close
+        :param streams: data streams
+        :param close_time: HH:MM
+        :return:
+        """
+        if self._writer_thread is None or not self._writer_thread.is_alive():
+            self._stop_event.clear()
+            self._writer_thread = threading.Thread(
+                target=self._run,
+                args=(list(streams), datetime.datetime.strptime(close_time, "%H:%M").time()),
+                name="ssi-archive-writer", daemon=True
+            )
+            self._writer_thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._writer_thread is not None:
+            self._writer_thread.join()
+            self._writer_thread = None
+    # endregion
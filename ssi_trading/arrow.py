@@ -0,0 +1,146 @@
+# Description: Apache Arrow and Parquet export of stream and history data.
+# Arrow tables are columnar and can be shared with Polars, DuckDB or another process without copy or parsing.
+# pyarrow is optional: pip install ssi_trading[arrow], it is imported by the first export, not by the data streams
+import dataclasses
+import logging
+import socket
+import threading
+from typing import List, Union, Any, Type, TYPE_CHECKING
+
+from pandas import DataFrame
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+_ARROW_TYPES = {
+    "str": "string",
+    "float": "float64",
+    "int": "int64",
+    "bool": "bool_",
+}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is required for arrow and parquet export: pip install ssi_trading[arrow]") from None
+    return pyarrow
+
+
+def to_arrow(data: Union[DataFrame, List[Any]]) -> "pa.Table":
+    """
+    Convert a DataFrame or a list of dataclass records (OHLCV, StockPrice, CurrentMarket, etc.) to an arrow table
+    :param data:
+    :return:
+    """
+    pa = _require_pyarrow()
+    if isinstance(data, DataFrame):
+        return pa.Table.from_pandas(data, preserve_index=False)
+    records = list(data)
+    if len(records) == 0:
+        return pa.table({})
+    names = [f.name for f in dataclasses.fields(records[0])]
+    # column by column, no intermediate DataFrame
+    return pa.table({name: [getattr(record, name) for record in records] for name in names})
+
+
+def to_parquet(data: Union[DataFrame, List[Any], "pa.Table"], path: str, compression: str = "zstd"):
+    """
+    Write a DataFrame, a list of dataclass records or an arrow table to a parquet file
+    :param data:
+    :param path:
+    :param compression: zstd, snappy, gzip or none
+    :return:
+    """
+    pa = _require_pyarrow()
+    import pyarrow.parquet as pq
+    table = data if isinstance(data, pa.Table) else to_arrow(data)
+    pq.write_table(table, path, compression=compression)
+    return path
+
+
+def schema_of(record_type: Type) -> "pa.Schema":
+    """
+    Arrow schema of a dataclass, fields are mapped from their annotation: str, float, int and bool
+    :param record_type: CurrentMarket, CurrentBar, CurrentIndex, etc.
+    :return:
+    """
+    pa = _require_pyarrow()
+    fields = []
+    for f in dataclasses.fields(record_type):
+        type_name = f.type if isinstance(f.type, str) else getattr(f.type, "__name__", "str")
+        fields.append(pa.field(f.name, getattr(pa, _ARROW_TYPES.get(type_name, "string"))()))
+    return pa.schema(fields)
+
+
+class ArrowTickWriter:
+    def __init__(self, sink: Union[str, socket.socket, Any], record_type: Type, batch_size: int = 1024):
+        """
+        Stream ticks as arrow IPC record batches to a file or a socket, readers open it with pyarrow.ipc.open_stream
+        :param sink: file path, connected socket or writable binary file object
+        :param record_type: dataclass of the records: CurrentMarket, CurrentBar, etc.
+        :param batch_size: rows buffered before a record batch is written
+        """
+        pa = _require_pyarrow()
+        import pyarrow.ipc as pa_ipc
+        self._pa = pa
+        self.record_type = record_type
+        self.schema = schema_of(record_type)
+        self.batch_size = batch_size
+        self._names = self.schema.names
+        self._columns = {name: [] for name in self._names}
+        self._size = 0
+        self._lock = threading.Lock()
+
+        if isinstance(sink, socket.socket):
+            self._file = sink.makefile("wb")
+        elif isinstance(sink, str):
+            self._file = pa.OSFile(sink, "wb")
+        else:
+            self._file = sink
+        self._writer = pa_ipc.new_stream(self._file, self.schema)
+
+    def write(self, record):
+        with self._lock:
+            for name in self._names:
+                self._columns[name].append(getattr(record, name))
+            self._size += 1
+            if self._size >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._size == 0:
+            return
+        pa = self._pa
+        batch = pa.record_batch([pa.array(self._columns[name], type=self.schema.field(name).type) for name in self._names], schema=self.schema)
+        self._writer.write_batch(batch)
+        if hasattr(self._file, "flush"):
+            self._file.flush()
+        self._columns = {name: [] for name in self._names}
+        self._size = 0
+
+    def attach(self, stream):
+        """
+        Write each tick of a data stream
+        :param stream: BaseDataStream
+        :return:
+        """
+        def on_tick(symbol, current):
+            try:
+                self.write(current)
+            except Exception as ex:
+                logging.exception(f"Error while writing tick of {symbol}: {ex}")
+
+        stream.add_listener(on_tick)
+        return self
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._writer.close()
+            self._file.close()
@@ -1,10 +1,17 @@
-from services.client import BaseTradingService, BaseDataService
+from ssi_trading.lazy import lazy_attributes
 
-# market dataservice
-from services.client.data import MarketDataService
+# services are imported on first access, a paper trading job never loads the market data sdk
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "BaseTradingService": "ssi_trading.services.client",
+    "BaseDataService": "ssi_trading.services.client",
 
-# trading services: paper trading and client trading
-from services.paper.futures import PaperFutureTradingService
-from services.paper.fundamental import PaperFundamentalTradingService
-from services.client.futures import FutureTradingService
-from services.client.fundamental import FundamentalTradingService
+    # market dataservice
+    "MarketDataService": "ssi_trading.services.client.data",
+
+    # trading services: paper trading and client trading
+    "PaperFutureTradingService": "ssi_trading.services.paper.futures",
+    "PaperFundamentalTradingService": "ssi_trading.services.paper.fundamental",
+    "LocalPaperTradingService": "ssi_trading.services.paper.local",
+    "FutureTradingService": "ssi_trading.services.client.futures",
+    "FundamentalTradingService": "ssi_trading.services.client.fundamental",
+})
@@ -1,3 +1,64 @@
+import os
+from typing import Dict, List
+
+# batch order requests: number of requests in flight per trading service
+BATCH_MAX_WORKERS = 8
+
+# market data paging: valid page sizes and the last page index of a request series
+PAGE_SIZES = (10, 20, 50, 100, 1000)
+MAX_PAGE_INDEX = 10
+# continuous trading minutes of a day (09:00-11:30, 13:00-14:45 plus ATO and ATC), used to size intraday requests
+TRADING_MINUTES_PER_DAY = 270
+
+# trading stream reconnect backoff in seconds, doubled after each failed attempt
+STREAM_RECONNECT_DELAY = 1.0
+STREAM_RECONNECT_MAX_DELAY = 60.0
+# final filled quantity and value of the terminal orders kept by the trading stream, repeated notifications emit no fill
+STREAM_TERMINAL_ORDERS = 10000
+
+# positions and max buy/sell quantities of the stock service are reused for a few seconds, orders invalidate them
+TRADING_CACHE_TTL = 2.0
+
+# order history pages read by pending_orders and filled_orders
+ORDER_HISTORY_PAGE_SIZE = 50
+ORDER_HISTORY_MAX_PAGES = 20
+
+# execution algorithms
+EXECUTION_SLICE_INTERVAL = 10  # seconds between two slices of a parent order
+EXECUTION_MAX_REJECTS = 3  # consecutive rejected child orders before the parent is stopped
+
+# contract multiplier by trading market: VN stocks, VNFE index futures
+CONTRACT_MULTIPLIERS = {"VN": 1.0, "VNFE": 100000.0}
+
+# client-side rate limit shared by all services of a consumer id
+RATE_LIMIT_PER_SECOND = 5
+RATE_LIMIT_BURST = 10
+
+# access tokens are refreshed in background this many seconds before they expire,
+# the sdk clients refresh inline when a token has less than 1 hour left
+TOKEN_REFRESH_BEFORE_EXPIRY = 2 * 3600
+TOKEN_REFRESH_CHECK_INTERVAL = 60
+
+# reference data (index lists, index components, securities) is cached on disk once per trading day
+REFERENCE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ssi_trading", "reference")
+REFERENCE_REFRESH_CHECK_INTERVAL = 300
+
+# end of day archive of the stream data, partitioned by date/channel/symbol
+ARCHIVE_DIR = os.path.join(os.path.expanduser("~"), ".ssi_trading", "archive")
+ARCHIVE_CLOSE_TIME = "15:05"
+
+# shared memory market data bus, one segment per channel
+BUS_NAME_PREFIX = "ssi_bus"
+BUS_RING_CAPACITY = 4096
+
+# local pub/sub gateway of the stream data
+GATEWAY_SOCKET_PATH = "/tmp/ssi_gateway.sock"
+GATEWAY_ZMQ_ENDPOINT = "ipc:///tmp/ssi_gateway.zmq"
+GATEWAY_QUEUE_SIZE = 10000
+
+# service bootstrap: concurrent client construction and authentication
+BOOTSTRAP_MAX_WORKERS = 8
+BOOTSTRAP_HISTORY_DAYS = 30
 
 # paper trading
 PAPER_BASE_URL = "https://iboard-tapi.ssi.com.vn"
@@ -25,7 +86,8 @@ class _BaseConfig:
         return hash((self.consumer_id, self.consumer_secret, self.secret_key))
 
     def __eq__(self, other):
-        if isinstance(other, DataServiceConfig):
+        # configs are equal when they share the same credentials, symbols and accounts are not compared
+        if isinstance(other, _BaseConfig) and type(self) is type(other):
             return self.__hash__() == other.__hash__()
         return False
 
@@ -76,3 +138,42 @@ class TradingServiceConfig(_BaseConfig):
                 f"consumer_secret={self.ConsumerSecret[:4]}..., "
                 f"account_id={self.account_id}, account_type={self.account_type}, "
                 f"paper_trading={self.paper_trading}, auth_token={self.auth_token[:4]}...)")
+
+
+class BootstrapConfig:
+    def __init__(
+            self,
+            data_service: DataServiceConfig = None,
+            data_streams: Dict[str, DataServiceConfig] = None,
+            trading_services: List[TradingServiceConfig] = None,
+            trading_streams: List[TradingServiceConfig] = None,
+            reference_data: bool = True,
+            history_symbols: List[str] = None,
+            history_days: int = BOOTSTRAP_HISTORY_DAYS,
+            start_streams: bool = False,
+            max_workers: int = BOOTSTRAP_MAX_WORKERS,
+            allow_partial: bool = False,
+    ):
+        """
+        Services built by SSIServices.bootstrap
+        :param data_service: config of the MarketDataService
+        :param data_streams: DataChannel (X, B, MI, R) -> config of the stream, symbols of the config are subscribed
+        :param trading_services: one service per account, the class is chosen by account_type and paper_trading
+        :param trading_streams: one TradingStream per account
+        :param reference_data: load the reference data of today, requires data_service
+        :param history_symbols: daily ohlcv of these symbols is fetched in advance, requires data_service
+        :param history_days: calendar days of daily ohlcv
+        :param start_streams: start data and trading streams once the services are ready
+        :param max_workers: clients authenticated at once
+        :param allow_partial: start with the services which could be built instead of raising BootstrapFailed
+        """
+        self.data_service = data_service
+        self.data_streams = data_streams or dict()
+        self.trading_services = trading_services or []
+        self.trading_streams = trading_streams or []
+        self.reference_data = reference_data
+        self.history_symbols = history_symbols or []
+        self.history_days = history_days
+        self.start_streams = start_streams
+        self.max_workers = max_workers
+        self.allow_partial = allow_partial
@@ -6,3 +6,15 @@ class CreateOrderException(Exception):
 
 class TradingServiceUnavailable(Exception):
     pass
+
+
+class RiskCheckFailed(CreateOrderException):
+    pass
+
+
+class InvalidConfig(Exception):
+    pass
+
+
+class BootstrapFailed(Exception):
+    pass
@@ -0,0 +1,464 @@
+# Description: Execution algorithms.
+# A parent order is worked by LO child orders sliced over time: TWAP evenly over the duration, VWAP along a volume
+# profile, POV as a share of the volume traded since the start. Children are priced at the top of book of the
+# market data stream, limited by the parent limit and the price band, rounded to the tick and sized in lots.
+# Child state comes from on_order_update, fed by the trading stream or by LocalMatchingEngine.add_listener.
+# Children are correlated by the order id or, until the trading stream reports it, by the request id of create_order.
+# All parents run on one asyncio event loop, blocking order calls run in the executor of the loop.
+import asyncio
+import copy
+import functools
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, List, Union, Callable, Tuple, TYPE_CHECKING
+
+from ssi_trading.config import EXECUTION_SLICE_INTERVAL, EXECUTION_MAX_REJECTS
+from ssi_trading.models.data import CurrentMarket
+from ssi_trading.models.definitions import (
+    OrderSide, OrderType, OrderStatus, SecurityMarket, ExecutionAlgo, ExecutionStatus
+)
+from ssi_trading.models.trading import CreatedOrder, ParentOrder
+from ssi_trading.utils import lot_size, round_to_tick
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+# updates of children not registered yet, ex: the local engine notifies before create_order returns
+_MAX_ORPHANS = 1000
+
+
+def _profile_fraction(weights: List[float], fraction: float) -> float:
+    # share of the volume profile elapsed at a fraction of the duration, linear inside a bucket
+    total = sum(weights)
+    if total <= 0:
+        return fraction
+    position = fraction * len(weights)
+    full = min(int(position), len(weights))
+    elapsed = sum(weights[:full])
+    if full < len(weights):
+        elapsed += weights[full] * (position - full)
+    return elapsed / total
+
+
+def volume_profile(frame: "DataFrame", buckets: int = 10, start: str = None, end: str = None) -> List[float]:
+    """
+    Average intraday volume of a history in equal buckets, for ParentOrder.volume_profile
+    :param frame: intraday OHLCV of one symbol with trading_time and volume, ex: a symbol of BulkOHLCV.data
+    :param buckets:
+    :param start: first minute of the execution window, ex: "09:15", default the first minute of the history
+    :param end: last minute of the execution window, ex: "11:30"
+    :return: volume by bucket, oldest first
+    """
+    import numpy as np
+    import pandas as pd
+    times = pd.to_datetime(frame["trading_time"])
+    minutes = (times.dt.hour * 60 + times.dt.minute).to_numpy()
+    mask = np.ones(len(minutes), dtype=bool)
+    if start is not None:
+        hour, minute = map(int, start.split(":"))
+        mask &= minutes >= hour * 60 + minute
+    if end is not None:
+        hour, minute = map(int, end.split(":"))
+        mask &= minutes <= hour * 60 + minute
+    by_minute = pd.Series(frame["volume"].to_numpy()[mask]).groupby(minutes[mask]).mean().sort_index()
+    if by_minute.empty:
+        return []
+    return [float(chunk.sum()) for chunk in np.array_split(by_minute.to_numpy(), buckets)]
+
+
+class _ParentState:
+    def __init__(self, parent: ParentOrder, start_volume: Union[float, None]):
+        self.parent = parent
+        self.start = time.monotonic()
+        self.end = self.start + parent.duration
+        self.start_volume = start_volume
+        # working children by child id (first id known, order id or request id), their filled quantity and value
+        self.children: Dict[str, CreatedOrder] = dict()
+        self.filled: Dict[str, int] = dict()
+        self.value: Dict[str, float] = dict()
+        self.cancelling = set()
+        # (account id, order id) and (account id, request id) of the children, dropped with the parent
+        self.keys = set()
+        self.rejects = 0
+        self.final_sent = False
+        self.wake = asyncio.Event()
+
+    def working_qty(self) -> int:
+        return sum(child.order_qty - self.filled.get(order_id, 0) for order_id, child in self.children.items())
+
+
+class ExecutionScheduler:
+    def __init__(
+            self,
+            services,
+            stream=None,
+            market: str = SecurityMarket.HOSE,
+            markets: Dict[str, str] = None,
+            interval: float = EXECUTION_SLICE_INTERVAL
+    ):
+        """
+        Work parent orders with child orders, see ParentOrder
+        :param services: SSIServices, orders are checked by its risk engines, or a trading service
+        :param stream: MarketDataStream of the traded symbols, see attach
+        :param market: default SecurityMarket of symbols, used for tick and lot sizes
+        :param markets: SecurityMarket by symbol
+        :param interval: seconds between two slices
+        """
+        self._services = services
+        self.market = market
+        self._markets: Dict[str, str] = dict(markets or {})
+        self.interval = interval
+
+        self._quotes: Dict[str, CurrentMarket] = dict()
+        self._parent_ids = itertools.count(1)
+        # all state below is only changed on the loop thread
+        self._parents: Dict[str, _ParentState] = dict()
+        # (account id, order id) or (account id, request id) -> (parent state, child id)
+        self._children: Dict[Tuple[str, str], Tuple[_ParentState, str]] = dict()
+        self._requests: Dict[Tuple[str, str], Tuple[_ParentState, str]] = dict()
+        self._orphans: Dict[Tuple[str, str], CreatedOrder] = dict()
+        self._listeners: List[Callable[[ParentOrder], None]] = []
+
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+        self._thread: Union[threading.Thread, None] = None
+        if stream is not None:
+            self.attach(stream)
+
+    # region setup
+    def attach(self, stream):
+        """
+        Price and pace children from the quotes of a MarketDataStream
+        :param stream:
+        :return:
+        """
+        stream.add_listener(self.on_market)
+        return self
+
+    def add_listener(self, callback: Callable[[ParentOrder], None]):
+        """
+        Register a callback called with a copy of the parent after each fill or status change, on the loop thread
+        :param callback:
+        :return:
+        """
+        self._listeners.append(callback)
+        return self
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """
+        :param loop: running event loop of the application, default a loop on a dedicated thread
+        :return:
+        """
+        if self._loop is not None:
+            logging.warning("Execution scheduler is already started.")
+            return self
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=loop.run_forever, name="ssi-execution", daemon=True)
+            self._thread.start()
+        self._loop = loop
+        return self
+
+    def stop(self, cancel: bool = True):
+        """
+        :param cancel: cancel the working parents and their children first
+        :return:
+        """
+        if self._loop is None:
+            return
+        if cancel:
+            future = asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop)
+            future.result()
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._thread = None
+        self._loop = None
+
+    def market_of(self, symbol: str) -> str:
+        return self._markets.get(symbol, self.market)
+    # endregion
+
+    # region parents
+    def submit(self, parent: ParentOrder) -> Union[ParentOrder, None]:
+        """
+        Start working a parent order, the parent is updated in place by the scheduler
+        :param parent:
+        :return: the parent with its parent id, None when the parent is invalid
+        """
+        if self._loop is None:
+            raise RuntimeError("Execution scheduler is not started.")
+        lot = lot_size(self.market_of(parent.symbol))
+        if parent.order_qty <= 0 or parent.order_qty % lot != 0:
+            logging.error(f"Parent order quantity {parent.order_qty} of {parent.symbol} is not a multiple of {lot}.")
+            return None
+        if parent.algo not in (ExecutionAlgo.TWAP, ExecutionAlgo.VWAP, ExecutionAlgo.POV):
+            logging.error(f"Execution algo {parent.algo} is not supported.")
+            return None
+        if parent.algo == ExecutionAlgo.POV and not 0 < parent.participation <= 1:
+            logging.error(f"Participation {parent.participation} must be in (0, 1].")
+            return None
+        parent.parent_id = str(next(self._parent_ids))
+        parent.status = ExecutionStatus.WORKING
+        parent.filled_qty = 0
+        parent.avg_price = 0
+        parent.child_ids = []
+        self._loop.call_soon_threadsafe(self._launch, parent)
+        return parent
+
+    def cancel(self, parent_id: str) -> bool:
+        """
+        Stop a parent and cancel its working children
+        :param parent_id:
+        :return: False when the parent is unknown or not working
+        """
+        state = self._parents.get(parent_id)
+        if state is None or state.parent.status != ExecutionStatus.WORKING:
+            return False
+        asyncio.run_coroutine_threadsafe(self._stop_parent(state, ExecutionStatus.CANCELLED), self._loop)
+        return True
+
+    def parents(self) -> List[ParentOrder]:
+        """
+        Copies of the working parents, stopped parents are dropped once their children are done, see add_listener
+        """
+        return [copy.copy(state.parent) for state in list(self._parents.values())]
+
+    def _launch(self, parent: ParentOrder):
+        quote = self._quotes.get(parent.symbol)
+        state = _ParentState(parent, quote.total_volume if quote is not None else None)
+        self._parents[parent.parent_id] = state
+        self._loop.create_task(self._run(state))
+        logging.info(f"Execution {parent.parent_id}: {parent.algo} {parent.order_side} {parent.order_qty} {parent.symbol}")
+
+    async def _run(self, state: _ParentState):
+        parent = state.parent
+        while parent.status == ExecutionStatus.WORKING:
+            if time.monotonic() < state.end:
+                await self._slice(state)
+            elif not state.final_sent and parent.algo != ExecutionAlgo.POV:
+                # catch up at the end of the duration, the children get one more interval to fill
+                state.final_sent = True
+                await self._slice(state, final=True)
+            else:
+                await self._stop_parent(state, ExecutionStatus.EXPIRED)
+                break
+            try:
+                await asyncio.wait_for(state.wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            state.wake.clear()
+
+    async def _stop_parent(self, state: _ParentState, status: str):
+        if state.parent.status == ExecutionStatus.WORKING:
+            self._set_status(state, status)
+        for child_id in list(state.children.keys()):
+            await self._cancel_child(state, child_id)
+        self._release(state)
+
+    async def _cancel_all(self):
+        for state in list(self._parents.values()):
+            if state.parent.status == ExecutionStatus.WORKING:
+                await self._stop_parent(state, ExecutionStatus.CANCELLED)
+
+    def _set_status(self, state: _ParentState, status: str):
+        state.parent.status = status
+        state.wake.set()
+        logging.info(f"Execution {state.parent.parent_id} {status}: {state.parent.filled_qty}/{state.parent.order_qty} filled")
+        self._notify(state.parent)
+
+    def _release(self, state: _ParentState):
+        # a stopped parent without working children gets no more updates, its last state was notified
+        if state.parent.status == ExecutionStatus.WORKING or state.children:
+            return
+        if self._parents.get(state.parent.parent_id) is state:
+            del self._parents[state.parent.parent_id]
+        for key in state.keys:
+            for index in (self._children, self._requests):
+                if key in index and index[key][0] is state:
+                    del index[key]
+        state.keys.clear()
+
+    def _notify(self, parent: ParentOrder):
+        result = copy.copy(parent)
+        for callback in self._listeners:
+            try:
+                callback(result)
+            except Exception as ex:
+                logging.exception(f"Error in execution listener {callback}: {ex}")
+    # endregion
+
+    # region slicing
+    def _target(self, state: _ParentState, quote: CurrentMarket) -> float:
+        # quantity which should be done by now
+        parent = state.parent
+        if parent.algo == ExecutionAlgo.POV:
+            if state.start_volume is None:
+                state.start_volume = quote.total_volume
+            return parent.participation * max(0.0, quote.total_volume - state.start_volume)
+        fraction = min(1.0, (time.monotonic() - state.start) / parent.duration) if parent.duration > 0 else 1.0
+        if parent.algo == ExecutionAlgo.VWAP and parent.volume_profile:
+            fraction = _profile_fraction(parent.volume_profile, fraction)
+        return parent.order_qty * fraction
+
+    def _child_price(self, parent: ParentOrder, quote: CurrentMarket) -> float:
+        # take the top of book, never through the parent limit or the price band
+        buy = parent.order_side == OrderSide.BUY
+        price = (quote.ask_price_01 if buy else quote.bid_price_01) or quote.current_price
+        if not price:
+            return 0.0
+        if parent.limit_price:
+            price = min(price, parent.limit_price) if buy else max(price, parent.limit_price)
+        if quote.floor_price and quote.ceiling_price:
+            price = min(max(price, quote.floor_price), quote.ceiling_price)
+        return round_to_tick(price, self.market_of(parent.symbol), "down" if buy else "up")
+
+    async def _slice(self, state: _ParentState, final: bool = False):
+        parent = state.parent
+        quote = self._quotes.get(parent.symbol)
+        if quote is None:
+            return
+        price = self._child_price(parent, quote)
+        if not price:
+            return
+
+        # children left behind by the market are cancelled, their rest is sliced again once cancelled
+        for child_id, child in list(state.children.items()):
+            if child.order_price != price:
+                await self._cancel_child(state, child_id)
+
+        lot = lot_size(self.market_of(parent.symbol))
+        target = parent.order_qty if final else min(self._target(state, quote), parent.order_qty)
+        qty = int((target - parent.filled_qty - state.working_qty()) // lot * lot)
+        if qty <= 0 or parent.status != ExecutionStatus.WORKING:
+            return
+
+        child = CreatedOrder(
+            symbol=parent.symbol,
+            market_id=parent.market_id,
+            account_id=parent.account_id,
+            order_side=parent.order_side,
+            order_type=OrderType.LIMIT,
+            order_price=price,
+            order_qty=qty
+        )
+        try:
+            result = await self._call(self._services.create_order, child)
+        except Exception as ex:
+            logging.error(f"Execution {parent.parent_id}: child order failed: {ex}")
+            result = None
+        if result is None:
+            state.rejects += 1
+            if state.rejects >= EXECUTION_MAX_REJECTS:
+                await self._stop_parent(state, ExecutionStatus.REJECTED)
+            return
+        state.rejects = 0
+        if result.order_id is None and result.request_id is None:
+            # the child is working but its updates can't be matched, slicing again would over execute
+            logging.error(f"Execution {parent.parent_id}: child order of {parent.symbol} sent without order or request id.")
+            await self._stop_parent(state, ExecutionStatus.REJECTED)
+            return
+
+        result = copy.copy(result)
+        child_id = result.order_id or result.request_id
+        state.children[child_id] = result
+        if result.request_id is not None:
+            self._requests[(parent.account_id, result.request_id)] = (state, child_id)
+            state.keys.add((parent.account_id, result.request_id))
+        if result.order_id is not None:
+            self._bind(state, child_id, result.order_id)
+        self._apply(state, child_id, result)
+        for key in ((parent.account_id, result.request_id), (parent.account_id, result.order_id)):
+            orphan = self._orphans.pop(key, None)
+            if orphan is not None:
+                self._on_update(orphan)
+
+    def _bind(self, state: _ParentState, child_id: str, order_id: str):
+        # the order id of a child is known, from create_order or from its first update
+        self._children[(state.parent.account_id, order_id)] = (state, child_id)
+        state.keys.add((state.parent.account_id, order_id))
+        child = state.children.get(child_id)
+        if child is not None:
+            child.order_id = order_id
+        if order_id not in state.parent.child_ids:
+            state.parent.child_ids.append(order_id)
+
+    async def _cancel_child(self, state: _ParentState, child_id: str):
+        child = state.children.get(child_id)
+        # a child without order id is cancelled once its first update reports the id
+        if child is None or child.order_id is None or child_id in state.cancelling:
+            return
+        state.cancelling.add(child_id)
+        try:
+            result = await self._call(self._services.cancel_order, copy.copy(child))
+        except Exception as ex:
+            logging.error(f"Execution {state.parent.parent_id}: cancel of child {child.order_id} failed: {ex}")
+            result = None
+        if result is not None:
+            self._apply(state, child_id, result)
+        else:
+            # filled or already gone, the order update removes it
+            state.cancelling.discard(child_id)
+
+    async def _call(self, fn, *args):
+        return await self._loop.run_in_executor(None, functools.partial(fn, *args))
+    # endregion
+
+    # region updates
+    def on_market(self, symbol: str, current: CurrentMarket):
+        if isinstance(current, CurrentMarket):
+            self._quotes[symbol] = current
+
+    def on_order_update(self, order: CreatedOrder):
+        """
+        Child order update from the trading stream or the local matching engine, thread safe
+        :param order:
+        :return:
+        """
+        if self._loop is not None and (order.order_id is not None or order.request_id is not None):
+            self._loop.call_soon_threadsafe(self._on_update, copy.copy(order))
+
+    def _on_update(self, order: CreatedOrder):
+        child = self._children.get((order.account_id, order.order_id)) if order.order_id is not None else None
+        if child is None and order.request_id is not None:
+            child = self._requests.get((order.account_id, order.request_id))
+            if child is not None and order.order_id is not None:
+                self._bind(child[0], child[1], order.order_id)
+        if child is None:
+            self._orphans[(order.account_id, order.order_id or order.request_id)] = order
+            if len(self._orphans) > _MAX_ORPHANS:
+                self._orphans.pop(next(iter(self._orphans)))
+            return
+        state, child_id = child
+        self._apply(state, child_id, order)
+        # children of a stopped parent which had no order id yet are cancelled now
+        if state.parent.status != ExecutionStatus.WORKING and child_id in state.children:
+            self._loop.create_task(self._cancel_child(state, child_id))
+
+    def _apply(self, state: _ParentState, child_id: str, order: CreatedOrder):
+        # updates carry the cumulative filled quantity and average price of the child
+        parent = state.parent
+        changed = False
+        filled = int(order.filled_qty or 0)
+        delta = filled - state.filled.get(child_id, 0)
+        if delta > 0:
+            value = (order.avg_price or order.order_price) * filled
+            delta_value = value - state.value.get(child_id, 0.0)
+            parent.avg_price = (parent.avg_price * parent.filled_qty + delta_value) / (parent.filled_qty + delta)
+            parent.filled_qty += delta
+            state.filled[child_id] = filled
+            state.value[child_id] = value
+            changed = True
+        if order.order_status is not None and order.order_status not in OrderStatus.WORKING_ORDERS:
+            if state.children.pop(child_id, None) is not None:
+                changed = True
+            state.cancelling.discard(child_id)
+
+        if parent.status == ExecutionStatus.WORKING and parent.filled_qty >= parent.order_qty:
+            self._set_status(state, ExecutionStatus.DONE)
+        elif changed:
+            self._notify(parent)
+        self._release(state)
+    # endregion
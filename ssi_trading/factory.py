@@ -1,12 +1,45 @@
 import logging
 from functools import lru_cache
+from typing import TYPE_CHECKING
 
-from ssi_fc_data.fc_md_client import MarketDataClient
+from ssi_trading.config import DataServiceConfig, TradingServiceConfig, RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST
+from ssi_trading.limiter import RateLimiter
+from ssi_trading.session import credential_manager
 
-from ssi_trading.config import DataServiceConfig
+if TYPE_CHECKING:
+    from ssi_fc_data.fc_md_client import MarketDataClient
+    from ssi_fctrading import FCTradingClient
+
+
+def create_market_data_client(cfg: DataServiceConfig) -> "MarketDataClient":
+    # one authenticated client per consumer, shared by all data services and streams
+    return credential_manager().market_data_client(cfg)
+
+
+def create_trading_client(cfg: TradingServiceConfig) -> "FCTradingClient":
+    # one authenticated client per consumer, shared by all trading services and streams
+    return credential_manager().trading_client(cfg)
+
+
+def trading_request_lock(cfg: TradingServiceConfig):
+    # requests of the shared trading client are sent one at a time
+    return credential_manager().trading_request_lock(cfg)
 
 
 @lru_cache(maxsize=1024)
-def create_market_data_client(cfg: DataServiceConfig) -> MarketDataClient:
-    logging.info(f"Creating market data client: {cfg}")
-    return MarketDataClient(cfg)
+def create_rate_limiter(consumer_id: str) -> RateLimiter:
+    logging.info(f"Creating rate limiter for consumer: {consumer_id[:4]}...")
+    return RateLimiter(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+
+
+@lru_cache(maxsize=1)
+def device_id() -> str:
+    # network interfaces are enumerated once per process, not once per trading service
+    from ssi_fctrading import FCTradingClient
+    return FCTradingClient.get_deviceid()
+
+
+@lru_cache(maxsize=1)
+def user_agent() -> str:
+    from ssi_fctrading import FCTradingClient
+    return FCTradingClient.get_user_agent()
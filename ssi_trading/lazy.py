@@ -0,0 +1,29 @@
+# Description: Lazy attributes of the ssi_trading modules.
+# Public names of a package are mapped to the module defining them, the module is imported on first access,
+# so importing ssi_trading or one of its packages never loads the SDKs, pandas or the optional dependencies.
+import importlib
+from typing import Dict, Callable, List, Tuple
+
+
+def lazy_attributes(module_name: str, attributes: Dict[str, str]) -> Tuple[Callable[[str], object], Callable[[], List[str]]]:
+    """
+    Build the module level __getattr__ and __dir__ of a module
+    :param module_name: __name__ of the module
+    :param attributes: public name -> module defining it, ex: {"SSIServices": "ssi_trading.server"}
+    :return: (__getattr__, __dir__)
+    """
+    module = importlib.import_module(module_name)
+
+    def __getattr__(name: str):
+        source = attributes.get(name)
+        if source is None:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(source), name)
+        # cached, __getattr__ is only called once per name
+        setattr(module, name, value)
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted(set(vars(module)) | set(attributes))
+
+    return __getattr__, __dir__
@@ -0,0 +1,100 @@
+# Description: Cash and position accounting shared by the simulated trading services.
+from typing import Dict, Callable, Tuple
+
+from ssi_trading.models.definitions import OrderSide
+
+
+class Ledger:
+    def __init__(self, initial_cash: float = 0.0, multiplier: float = 1.0, margin_rate: float = 1.0, fee_rate: float = 0.0):
+        """
+        :param initial_cash:
+        :param multiplier: contract multiplier, 1 for stocks, 100000 for VN30F
+        :param margin_rate: part of the position value locked from buying power, 1 for cash stocks
+        :param fee_rate: fee on traded value
+        """
+        self.multiplier = multiplier
+        self.margin_rate = margin_rate
+        self.fee_rate = fee_rate
+        self.cash = float(initial_cash)
+        self._positions: Dict[str, float] = dict()
+        self._avg_prices: Dict[str, float] = dict()
+        self._realized: Dict[str, float] = dict()
+
+    def apply_fill(self, symbol: str, order_side: str, qty: float, price: float) -> Tuple[float, float]:
+        """
+        Update position, average price, realized pnl and cash from a fill
+        :param symbol:
+        :param order_side:
+        :param qty: filled quantity, positive
+        :param price:
+        :return: (realized pnl net of fee, cash delta)
+        """
+        qty, price = float(qty), float(price)
+        signed_qty = qty if order_side == OrderSide.BUY else -qty
+        position = self._positions.get(symbol, 0.0)
+        avg_price = self._avg_prices.get(symbol, 0.0)
+
+        realized = 0.0
+        if position == 0 or (position > 0) == (signed_qty > 0):
+            avg_price = (avg_price * abs(position) + price * qty) / (abs(position) + qty)
+        else:
+            closed = min(qty, abs(position))
+            realized = closed * (price - avg_price) * (1 if position > 0 else -1) * self.multiplier
+            if qty > abs(position):
+                avg_price = price
+            elif qty == abs(position):
+                avg_price = 0.0
+        fee = qty * price * self.multiplier * self.fee_rate
+        cash_delta = -signed_qty * price * self.multiplier - fee
+
+        self._positions[symbol] = position + signed_qty
+        self._avg_prices[symbol] = avg_price
+        self._realized[symbol] = self._realized.get(symbol, 0.0) + realized - fee
+        self.cash += cash_delta
+        return realized - fee, cash_delta
+
+    def set_position(self, symbol: str, position: float, avg_price: float):
+        """
+        Set a position from a broker snapshot, cash and realized pnl are not changed
+        :param symbol:
+        :param position: signed quantity
+        :param avg_price:
+        :return:
+        """
+        self._positions[symbol] = float(position)
+        self._avg_prices[symbol] = float(avg_price) if position else 0.0
+
+    def position(self, symbol: str) -> float:
+        return self._positions.get(symbol, 0.0)
+
+    def positions(self) -> Dict[str, float]:
+        return dict(self._positions)
+
+    def avg_price(self, symbol: str) -> float:
+        return self._avg_prices.get(symbol, 0.0)
+
+    def realized_pnl(self, symbol: str = None) -> float:
+        if symbol is not None:
+            return self._realized.get(symbol, 0.0)
+        return sum(self._realized.values())
+
+    def floating_pnl(self, last_price: Callable[[str], float], symbol: str = None) -> float:
+        symbols = [symbol] if symbol is not None else list(self._positions.keys())
+        return sum(
+            (last_price(name) - self._avg_prices.get(name, 0.0)) * self._positions.get(name, 0.0) * self.multiplier
+            for name in symbols if self._positions.get(name, 0.0) != 0
+        )
+
+    def equity(self, last_price: Callable[[str], float]) -> float:
+        return self.cash + sum(
+            position * last_price(symbol) * self.multiplier for symbol, position in self._positions.items() if position != 0
+        )
+
+    def margin_used(self, last_price: Callable[[str], float]) -> float:
+        return sum(
+            abs(position) * last_price(symbol) * self.multiplier * self.margin_rate
+            for symbol, position in self._positions.items() if position != 0
+        )
+
+    def buying_power(self, last_price: Callable[[str], float]) -> float:
+        return self.equity(last_price) - self.margin_used(last_price)
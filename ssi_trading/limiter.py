@@ -0,0 +1,96 @@
+# Description: Client-side token bucket shared by all services of a consumer.
+# SSI FastConnect limits requests per consumer, the limiter queues requests by priority
+# so order placement is served before account queries and history backfills.
+import functools
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict
+
+from ssi_trading.models.definitions import RequestPriority
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: number of requests refilled per second
+        :param burst: max number of requests that can be sent at once
+        """
+        self._rate = float(rate)
+        self._burst = max(1, int(burst))
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+
+        self._cond = threading.Condition()
+        self._waiters = []  # heap of (priority, seq), head is the next request to be served
+        self._seq = itertools.count()
+        self._stats: Dict[int, Dict[str, float]] = dict()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, priority: int = RequestPriority.NORMAL) -> float:
+        """
+        Block until a request of this priority can be sent, low priority requests queue instead of failing.
+        :param priority: RequestPriority, lower value is served first
+        :return: seconds waited
+        """
+        start = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            while True:
+                self._refill()
+                if self._waiters[0] == ticket:
+                    if self._tokens >= 1:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        break
+                    # head of queue, sleep until the next token is available
+                    self._cond.wait((1 - self._tokens) / self._rate)
+                else:
+                    self._cond.wait()
+            # wake up the next request in the queue
+            self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            stats = self._stats.setdefault(priority, {"count": 0, "total_wait": 0.0, "max_wait": 0.0})
+            stats["count"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+        return waited
+
+    def queue_size(self) -> int:
+        with self._cond:
+            return len(self._waiters)
+
+    def stats(self) -> Dict[int, Dict[str, float]]:
+        """
+        Wait time metrics per priority: count, total_wait, avg_wait, max_wait (seconds)
+        :return:
+        """
+        with self._cond:
+            return {
+                priority: dict(stats, avg_wait=stats["total_wait"] / stats["count"] if stats["count"] else 0.0)
+                for priority, stats in self._stats.items()
+            }
+
+
+def rate_limited(priority: int):
+    """
+    Decorate a service method, the request waits on the service limiter (self._limiter) before it is sent
+    :param priority: RequestPriority
+    :return:
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            limiter = getattr(self, "_limiter", None)
+            if limiter is not None:
+                limiter.acquire(priority)
+            return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
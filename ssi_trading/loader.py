@@ -0,0 +1,171 @@
+# Description: Declarative services config.
+# One YAML or TOML file declares the credentials, the symbol sets, the data channels and the accounts,
+# the loader builds one config per channel and per account and bootstraps the SSIServices graph.
+# Credentials are declared once and referenced by name, configs of the same consumer share one authenticated
+# client, a channel declared many times is merged into one stream, so one connection is opened per channel.
+#
+# credentials:
+#   data: {consumer_id: "${DATA_CONSUMER_ID}", consumer_secret: "${DATA_CONSUMER_SECRET}"}
+#   trading: {consumer_id: "${TRADING_CONSUMER_ID}", consumer_secret: "${TRADING_CONSUMER_SECRET}"}
+# symbol_sets:
+#   futures: [VN30F2407]
+#   indexes: [VN30]
+# data_service: {credentials: data}
+# channels:
+#   - {channel: X, credentials: data, symbols: [futures, HPG]}
+#   - {channel: MI, credentials: data, symbols: indexes}
+# accounts:
+#   - {account_id: "${ACCOUNT_ID}", account_type: future, credentials: trading, paper_trading: true, stream: false}
+# bootstrap: {reference_data: true, history_symbols: futures, history_days: 30, start_streams: true}
+import os
+import re
+from typing import Dict, List, Union, Any
+
+from ssi_trading.config import (
+    BootstrapConfig, DataServiceConfig, TradingServiceConfig,
+    BOOTSTRAP_HISTORY_DAYS, BOOTSTRAP_MAX_WORKERS,
+)
+from ssi_trading.exceptions import InvalidConfig
+
+_ENV_PATTERN = re.compile(r"\$\{(\w+)\}")
+
+
+def _read(path: str) -> dict:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            # python < 3.11
+            import tomli as tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("pyyaml is required for yaml configs: pip install ssi_trading[yaml]")
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f) or dict()
+    raise InvalidConfig(f"Config {path} is not a .toml, .yaml or .yml file.")
+
+
+def _expand(value: Any) -> Any:
+    """
+    Replace ${NAME} by the environment variable NAME, secrets are never written in the file
+    """
+    if isinstance(value, str):
+        def _env(match):
+            name = match.group(1)
+            if name not in os.environ:
+                raise InvalidConfig(f"Environment variable {name} is not set.")
+            return os.environ[name]
+        return _ENV_PATTERN.sub(_env, value)
+    if isinstance(value, dict):
+        return {key: _expand(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    return value
+
+
+def _symbols(value: Union[str, List[str], None], symbol_sets: Dict[str, List[str]]) -> List[str]:
+    # a name of symbol_sets is replaced by its symbols, order is kept and duplicates are removed
+    if value is None:
+        return []
+    symbols = []
+    for item in [value] if isinstance(value, str) else value:
+        symbols.extend(symbol_sets.get(item, [item]))
+    return list(dict.fromkeys(symbols))
+
+
+def _credentials(declared: Dict[str, dict], name: str, owner: str) -> dict:
+    if name not in declared:
+        raise InvalidConfig(f"Credentials {name} of {owner} are not declared.")
+    item = declared[name]
+    if not item.get("consumer_id") or not item.get("consumer_secret"):
+        raise InvalidConfig(f"Credentials {name} require consumer_id and consumer_secret.")
+    return item
+
+
+def parse_config(raw: dict) -> BootstrapConfig:
+    """
+    Build the bootstrap config of a parsed config file
+    :param raw: content of the file
+    :return:
+    """
+    raw = _expand(raw)
+    credentials = raw.get("credentials") or dict()
+    symbol_sets = {name: list(symbols) for name, symbols in (raw.get("symbol_sets") or dict()).items()}
+
+    def data_config(owner: str, item: dict, symbols: List[str]) -> DataServiceConfig:
+        cred = _credentials(credentials, item.get("credentials"), owner)
+        return DataServiceConfig(consumer_id=cred["consumer_id"], consumer_secret=cred["consumer_secret"], symbols=symbols)
+
+    data_service = None
+    if raw.get("data_service") is not None:
+        data_service = data_config("data_service", raw["data_service"], [])
+
+    # channels declared many times are merged, one stream and one connection per channel
+    channels: Dict[str, dict] = dict()
+    for item in raw.get("channels") or []:
+        channel = item.get("channel")
+        if not channel:
+            raise InvalidConfig(f"Channel name is missing in {item}.")
+        merged = channels.setdefault(channel, {"credentials": item.get("credentials"), "symbols": []})
+        if merged["credentials"] != item.get("credentials"):
+            raise InvalidConfig(f"Channel {channel} is declared with different credentials.")
+        merged["symbols"] = list(dict.fromkeys(merged["symbols"] + _symbols(item.get("symbols"), symbol_sets)))
+    data_streams = {
+        channel: data_config(f"channel {channel}", item, item["symbols"]) for channel, item in channels.items()
+    }
+
+    trading_services, trading_streams = [], []
+    for item in raw.get("accounts") or []:
+        if not item.get("account_id") or item.get("account_type") not in ("future", "fundamental"):
+            raise InvalidConfig(f"Account {item} requires account_id and account_type future or fundamental.")
+        cred = _credentials(credentials, item.get("credentials"), f"account {item['account_id']}")
+        config = TradingServiceConfig(
+            consumer_id=cred["consumer_id"],
+            consumer_secret=cred["consumer_secret"],
+            account_id=item["account_id"],
+            account_type=item["account_type"],
+            auth_token=item.get("auth_token", ""),
+            private_key=cred.get("private_key", ""),
+            paper_trading=bool(item.get("paper_trading", False)),
+            two_fa_type=int(item.get("two_fa_type", 0)),
+            notify_id=int(item.get("notify_id", -1)),
+        )
+        trading_services.append(config)
+        if item.get("stream", not config.paper_trading):
+            trading_streams.append(config)
+
+    bootstrap = raw.get("bootstrap") or dict()
+    return BootstrapConfig(
+        data_service=data_service,
+        data_streams=data_streams,
+        trading_services=trading_services,
+        trading_streams=trading_streams,
+        reference_data=bool(bootstrap.get("reference_data", data_service is not None)),
+        history_symbols=_symbols(bootstrap.get("history_symbols"), symbol_sets),
+        history_days=int(bootstrap.get("history_days", BOOTSTRAP_HISTORY_DAYS)),
+        start_streams=bool(bootstrap.get("start_streams", False)),
+        max_workers=int(bootstrap.get("max_workers", BOOTSTRAP_MAX_WORKERS)),
+    )
+
+
+def load_config(path: str) -> BootstrapConfig:
+    """
+    :param path: .toml, .yaml or .yml file
+    :return:
+    """
+    return parse_config(_read(path))
+
+
+def load_services(path: str):
+    """
+    Build and bootstrap the services declared in a config file
+    :param path: .toml, .yaml or .yml file
+    :return: SSIServices
+    """
+    from ssi_trading.server import SSIServices
+    return SSIServices.bootstrap(load_config(path))
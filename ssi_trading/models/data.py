@@ -1,6 +1,15 @@
 import datetime
 from dataclasses import dataclass, field
-from typing import List
+from typing import List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+
+def _empty_frame() -> "DataFrame":
+    # pandas is imported by the first bulk result, not by the models
+    from pandas import DataFrame
+    return DataFrame()
 
 
 @dataclass
@@ -23,6 +32,19 @@ class CurrentMarket:
     bid_volume_01: float = 0.0
     ask_price_01: float = 0.0
     ask_volume_01: float = 0.0
+    trading_session: str = ""
+
+
+@dataclass
+class MarketDepth:
+    symbol: str = ""
+    trading_time: str = ""
+    exchange: str = ""
+    # best first, up to 10 levels, empty levels are dropped
+    bid_prices: List[float] = field(default_factory=list)
+    bid_volumes: List[float] = field(default_factory=list)
+    ask_prices: List[float] = field(default_factory=list)
+    ask_volumes: List[float] = field(default_factory=list)
 
 
 @dataclass
@@ -67,6 +89,10 @@ class SecurityInfo:
     symbol: str
     stock_name: str
     stock_en_name: str
+    # price board of the trading day
+    ref_price: float = 0.0
+    ceiling_price: float = 0.0
+    floor_price: float = 0.0
 
 
 @dataclass
@@ -81,6 +107,33 @@ class OHLCV:
     value: float
 
 
+@dataclass
+class BulkOHLCV:
+    # long format: symbol, trading_time, open, high, low, close, volume, value
+    data: "DataFrame" = field(default_factory=_empty_frame)
+    # symbols whose history could not be fetched
+    failed: List[str] = field(default_factory=list)
+
+    def panel(self, column: str = "close") -> "DataFrame":
+        """
+        Wide format, one column per symbol indexed by trading time
+        :param column: open, high, low, close, volume or value
+        :return:
+        """
+        if self.data.empty:
+            return _empty_frame()
+        return self.data.pivot(index="trading_time", columns="symbol", values=column)
+
+    def to_arrow(self):
+        # requires pyarrow
+        from ssi_trading.arrow import to_arrow
+        return to_arrow(self.data)
+
+    def to_parquet(self, path: str, compression: str = "zstd"):
+        from ssi_trading.arrow import to_parquet
+        return to_parquet(self.data, path, compression)
+
+
 @dataclass
 class DailyIndex:
     index_id: str
@@ -61,6 +61,66 @@ class OrderSide:
     SELL = "S"
 
 
+@dataclass
+class RequestPriority:
+    # lower value is served first by the rate limiter
+    ORDER = 0
+    ACCOUNT = 1
+    NORMAL = 2
+    HISTORY = 3
+
+
+@dataclass
+class StreamEvent:
+    # classified by the sequencer of the data streams
+    TRADE = "trade"  # cumulative volume changed
+    QUOTE = "quote"  # same volume, book or values changed
+    DUPLICATE = "duplicate"
+
+
+@dataclass
+class TradingEvent:
+    # decoded by the trading stream
+    ORDER = "orderEvent"  # order status or filled quantity changed
+    FILL = "fill"  # derived from the filled quantity of order events
+    ORDER_ERROR = "orderError"
+    POSITION = "clientPortfolioEvent"
+
+
+@dataclass
+class ConflationMode:
+    # rows stored by the data streams, the current data is always updated
+    ALL = "all"
+    INTERVAL = "interval"  # latest state at most once per interval
+    ON_CHANGE = "on_change"  # only when price or volume changed
+
+
+@dataclass
+class PortfolioMetric:
+    # marked to market by the portfolio engine, watched by thresholds
+    FLOATING_PL = "floating_pl"
+    EXPOSURE = "exposure"  # gross market value
+    MARGIN = "margin"
+    EQUITY = "equity"
+    ACCOUNT_RATIO = "account_ratio"  # margin / equity
+
+
+@dataclass
+class ExecutionAlgo:
+    TWAP = "twap"  # even slices over the duration
+    VWAP = "vwap"  # slices follow a volume profile
+    POV = "pov"  # a share of the market volume
+
+
+@dataclass
+class ExecutionStatus:
+    WORKING = "working"
+    DONE = "done"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"  # duration elapsed before the quantity was filled
+    REJECTED = "rejected"
+
+
 @dataclass
 class SecurityMarket:
     HOSE = "HOSE"
@@ -71,6 +131,23 @@ class SecurityMarket:
     DEFAULT = None
 
 
+@dataclass
+class PriceBand:
+    # daily price limit from the reference price
+    HOSE = 0.07
+    HNX = 0.1
+    UPCOM = 0.15
+    DER = 0.07
+
+
+@dataclass
+class LotSize:
+    HOSE = 100
+    HNX = 100
+    UPCOM = 100
+    DER = 1
+
+
 @dataclass
 class TradingMarket:
     STOCK = "VN"
@@ -1,7 +1,9 @@
-from dataclasses import dataclass
-from typing import Union, Optional
+from dataclasses import dataclass, field
+from typing import Union, Optional, List, ClassVar
 
-from ssi_trading.models.definitions import OrderSide, OrderType, StopOrderType
+from ssi_trading.models.definitions import (
+    OrderSide, OrderType, StopOrderType, ExecutionAlgo, ExecutionStatus, TradingEvent
+)
 
 
 @dataclass
@@ -16,6 +18,8 @@ class CreatedOrder:
     # response should be added
     order_id: Optional[str] = None
     order_status: Optional[None] = None
+    # request id of the new order, the order id is only known from the trading stream or the order history
+    request_id: Optional[str] = None
     # stop order for futures
     stop_order: Optional[bool] = False
     stop_price: Optional[float] = 0
@@ -65,3 +69,82 @@ class MaxBuySellQty:
     max_qty: str
     power: Optional[float] = None
 
+
+
+@dataclass
+class PositionMark:
+    account_id: str
+    symbol: str
+    position: float
+    avg_price: float
+    market_price: float
+    floating_pl: float
+    exposure: float
+    margin: float
+
+
+@dataclass
+class PortfolioMark:
+    account_id: str
+    floating_pl: float
+    realized_pl: float
+    exposure: float
+    net_exposure: float
+    margin: float
+    equity: float
+    account_ratio: float
+
+
+@dataclass
+class ParentOrder:
+    account_id: str
+    symbol: str
+    order_side: str
+    order_qty: int
+    algo: str = ExecutionAlgo.TWAP
+    duration: float = 3600  # seconds
+    participation: float = 0.1  # POV, share of the market volume
+    limit_price: float = 0  # 0 means no limit
+    volume_profile: Optional[List[float]] = None  # VWAP, volume weights of equal buckets of the duration
+    market_id: str = ""
+    # set by the execution scheduler
+    parent_id: Optional[str] = None
+    status: str = ExecutionStatus.WORKING
+    filled_qty: int = 0
+    avg_price: float = 0
+    child_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class OrderEvent:
+    EVENT_TYPE: ClassVar[str] = TradingEvent.ORDER
+    order: CreatedOrder
+    notify_id: int = -1
+
+
+@dataclass
+class FillEvent:
+    EVENT_TYPE: ClassVar[str] = TradingEvent.FILL
+    account_id: str
+    order_id: str
+    symbol: str
+    order_side: str
+    qty: float  # quantity of this fill
+    price: float
+    notify_id: int = -1
+
+
+@dataclass
+class OrderErrorEvent:
+    EVENT_TYPE: ClassVar[str] = TradingEvent.ORDER_ERROR
+    account_id: str
+    order_id: Optional[str]
+    message: str
+    notify_id: int = -1
+
+
+@dataclass
+class PositionEvent:
+    EVENT_TYPE: ClassVar[str] = TradingEvent.POSITION
+    position: StockPosition
+    notify_id: int = -1
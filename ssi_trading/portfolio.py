@@ -0,0 +1,444 @@
+# Description: Real time portfolio marks.
+# Positions are taken once from a REST snapshot (StockPosition, AccountBalance) and marked to market from the
+# ticks of a MarketDataStream, account totals are updated by the change of the ticked symbol only,
+# fills update the positions in memory, so no REST call is made between two reconciliations.
+# AggregatedPortfolio keeps the positions of many accounts in account x symbol numpy matrices for firm wide rollups.
+import logging
+import threading
+from typing import Dict, List, Union, Callable, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from ssi_trading.config import BATCH_MAX_WORKERS, CONTRACT_MULTIPLIERS
+from ssi_trading.ledger import Ledger
+from ssi_trading.models.data import CurrentMarket
+from ssi_trading.models.definitions import PortfolioMetric, StreamEvent
+from ssi_trading.models.trading import StockPosition, AccountBalance, PositionMark, PortfolioMark
+from ssi_trading.utils import run_concurrently
+
+if TYPE_CHECKING:
+    from pandas import DataFrame, Series
+    from ssi_trading.services.client import BaseTradingService
+
+_ACCOUNT_METRICS = (
+    PortfolioMetric.FLOATING_PL, PortfolioMetric.EXPOSURE, PortfolioMetric.MARGIN,
+    PortfolioMetric.EQUITY, PortfolioMetric.ACCOUNT_RATIO,
+)
+# position metric -> index in the marks
+_POSITION_METRICS = {PortfolioMetric.FLOATING_PL: 1, PortfolioMetric.EXPOSURE: 2, PortfolioMetric.MARGIN: 4}
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _Threshold:
+    def __init__(self, metric: str, level: float, callback: Callable, symbol: Union[str, None], above: bool):
+        self.metric = metric
+        self.level = level
+        self.callback = callback
+        self.symbol = symbol
+        self.above = above
+        # fires once when crossed, re-armed when the value is back
+        self.armed = True
+
+    def crossed(self, value: float) -> bool:
+        breached = value > self.level if self.above else value < self.level
+        if breached and self.armed:
+            self.armed = False
+            return True
+        if not breached:
+            self.armed = True
+        return False
+
+
+class PortfolioEngine:
+    def __init__(self, account_id: str, multiplier: float = 1.0, margin_rate: float = 1.0):
+        """
+        :param account_id:
+        :param multiplier: contract multiplier, 1 for stocks, 100000 for VN30F
+        :param margin_rate: part of the position value locked as margin, 1 for cash stocks
+        """
+        self.account_id = account_id.__str__().upper()
+        self._ledger = Ledger(multiplier=multiplier, margin_rate=margin_rate)
+        self._multiplier = multiplier
+        self._margin_rate = margin_rate
+
+        # symbol -> (market price, floating pl, exposure, net exposure, margin)
+        self._marks: Dict[str, Tuple[float, float, float, float, float]] = dict()
+        self._floating_pl = 0.0
+        self._exposure = 0.0
+        self._net_exposure = 0.0
+        self._margin = 0.0
+        # equity of the snapshot, moved by the floating and realized pnl since the snapshot
+        self._base_equity = 0.0
+        self._base_floating_pl = 0.0
+
+        self._thresholds: Dict[Union[str, None], List[_Threshold]] = dict()
+        self._lock = threading.Lock()
+
+    # region snapshot
+    def reconcile(self, positions: Dict[str, StockPosition], balance: AccountBalance = None):
+        """
+        Replace the positions and the equity by a REST snapshot
+        :param positions: result of current_positions
+        :param balance: result of account_balance, nav is the equity of the snapshot
+        :return:
+        """
+        with self._lock:
+            self._ledger = Ledger(multiplier=self._multiplier, margin_rate=self._margin_rate)
+            self._marks = dict()
+            self._floating_pl = self._exposure = self._net_exposure = self._margin = 0.0
+            for symbol, position in (positions or dict()).items():
+                qty = _to_float(position.position)
+                if qty == 0:
+                    continue
+                self._ledger.set_position(symbol, qty, _to_float(position.avg_price))
+                self._mark(symbol, _to_float(position.market_price) or _to_float(position.avg_price))
+            self._base_floating_pl = self._floating_pl
+            if balance is not None:
+                self._base_equity = _to_float(balance.nav)
+        logging.info(f"Portfolio {self.account_id} reconciled: {len(self._marks)} positions")
+        self._check(None)
+        return self
+
+    def reconcile_from(self, service):
+        """
+        Reconcile from a trading service, the only REST calls of the engine
+        :param service: BaseTradingService of the account
+        :return:
+        """
+        positions = service.current_positions()
+        if positions is None:
+            logging.error(f"Error while reconciling portfolio {self.account_id}, the marks are kept.")
+            return self
+        return self.reconcile(positions, service.account_balance())
+    # endregion
+
+    # region updates
+    def attach(self, stream):
+        """
+        Mark positions to market on each trade of a MarketDataStream
+        :param stream:
+        :return:
+        """
+        stream.add_listener(self.on_market, [StreamEvent.TRADE])
+        return self
+
+    def on_market(self, symbol: str, current: CurrentMarket):
+        if symbol not in self._marks or not current.current_price:
+            return
+        with self._lock:
+            if symbol not in self._marks:
+                return
+            self._mark(symbol, current.current_price)
+        self._check(symbol)
+
+    def on_fill(self, symbol: str, order_side: str, qty: float, price: float):
+        """
+        Update a position from a fill until the next reconciliation
+        :param symbol:
+        :param order_side:
+        :param qty: filled quantity of this fill
+        :param price: fill price
+        :return:
+        """
+        with self._lock:
+            self._ledger.apply_fill(symbol, order_side, qty, price)
+            mark = self._marks.get(symbol)
+            self._mark(symbol, mark[0] if mark is not None else float(price))
+        self._check(symbol)
+
+    def _mark(self, symbol: str, price: float):
+        # only the change of one symbol is applied to the totals
+        position = self._ledger.position(symbol)
+        value = position * price * self._multiplier
+        floating_pl = (price - self._ledger.avg_price(symbol)) * position * self._multiplier
+        exposure = abs(value)
+        margin = exposure * self._margin_rate
+
+        old = self._marks.get(symbol)
+        if old is not None:
+            self._floating_pl -= old[1]
+            self._exposure -= old[2]
+            self._net_exposure -= old[3]
+            self._margin -= old[4]
+        self._floating_pl += floating_pl
+        self._exposure += exposure
+        self._net_exposure += value
+        self._margin += margin
+        self._marks[symbol] = (price, floating_pl, exposure, value, margin)
+    # endregion
+
+    # region marks
+    def _equity(self) -> float:
+        return self._base_equity + self._floating_pl - self._base_floating_pl + self._ledger.realized_pnl()
+
+    def _account_value(self, metric: str) -> float:
+        if metric == PortfolioMetric.FLOATING_PL:
+            return self._floating_pl
+        if metric == PortfolioMetric.EXPOSURE:
+            return self._exposure
+        if metric == PortfolioMetric.MARGIN:
+            return self._margin
+        equity = self._equity()
+        if metric == PortfolioMetric.EQUITY:
+            return equity
+        if equity <= 0:
+            return float("inf") if self._margin else 0.0
+        return self._margin / equity
+
+    def position(self, symbol: str) -> Union[PositionMark, None]:
+        mark = self._marks.get(symbol)
+        if mark is None:
+            return None
+        price, floating_pl, exposure, _, margin = mark
+        return PositionMark(
+            account_id=self.account_id, symbol=symbol,
+            position=self._ledger.position(symbol), avg_price=self._ledger.avg_price(symbol),
+            market_price=price, floating_pl=floating_pl, exposure=exposure, margin=margin
+        )
+
+    def positions(self) -> Dict[str, PositionMark]:
+        return {symbol: self.position(symbol) for symbol in list(self._marks.keys())}
+
+    def portfolio(self) -> PortfolioMark:
+        with self._lock:
+            return PortfolioMark(
+                account_id=self.account_id,
+                floating_pl=self._floating_pl,
+                realized_pl=float(self._ledger.realized_pnl()),
+                exposure=self._exposure,
+                net_exposure=self._net_exposure,
+                margin=self._margin,
+                equity=self._equity(),
+                account_ratio=self._account_value(PortfolioMetric.ACCOUNT_RATIO),
+            )
+    # endregion
+
+    # region thresholds
+    def add_threshold(
+            self, metric: str, level: float,
+            callback: Callable[[str, Union[str, None], float], None],
+            symbol: str = None, above: bool = True
+    ):
+        """
+        Call back once when a metric crosses a level, again after it went back
+        :param metric: PortfolioMetric, only FLOATING_PL, EXPOSURE and MARGIN for a symbol
+        :param level:
+        :param callback: called with (metric, symbol, value), symbol is None for account metrics
+        :param symbol: default the account
+        :param above: True to watch value > level, False to watch value < level, ex: floating pl below a loss
+        :return:
+        """
+        allowed = _POSITION_METRICS if symbol is not None else _ACCOUNT_METRICS
+        if metric not in allowed:
+            raise ValueError(f"Metric {metric} is not supported for {'symbol' if symbol else 'account'} thresholds.")
+        self._thresholds.setdefault(symbol, []).append(_Threshold(metric, level, callback, symbol, above))
+        return self
+
+    def _check(self, symbol: Union[str, None]):
+        fired = []
+        with self._lock:
+            for threshold in self._thresholds.get(None, []):
+                value = self._account_value(threshold.metric)
+                if threshold.crossed(value):
+                    fired.append((threshold, value))
+            mark = self._marks.get(symbol) if symbol is not None else None
+            for threshold in self._thresholds.get(symbol, []) if mark is not None else []:
+                value = mark[_POSITION_METRICS[threshold.metric]]
+                if threshold.crossed(value):
+                    fired.append((threshold, value))
+        for threshold, value in fired:
+            try:
+                threshold.callback(threshold.metric, threshold.symbol, value)
+            except Exception as ex:
+                logging.exception(f"Error in portfolio threshold {threshold.metric} of {self.account_id}: {ex}")
+    # endregion
+
+
+class AggregatedPortfolio:
+    def __init__(self, services: Dict[str, "BaseTradingService"], multipliers: Dict[str, float] = None, max_workers: int = BATCH_MAX_WORKERS):
+        """
+        Positions and balances of many accounts in account x symbol matrices, rollups are vectorized
+        :param services: account id -> trading service, ex: SSIServices._trading_services
+        :param multipliers: market id -> contract multiplier, default CONTRACT_MULTIPLIERS
+        :param max_workers: accounts fetched at once
+        """
+        self._services = services
+        self._multipliers = multipliers or CONTRACT_MULTIPLIERS
+        self._max_workers = max_workers
+
+        self.accounts: List[str] = []
+        self.symbols: List[str] = []
+        self._account_index: Dict[str, int] = dict()
+        self._symbol_index: Dict[str, int] = dict()
+        # account x symbol
+        self._position = np.zeros((0, 0))
+        self._avg_price = np.zeros((0, 0))
+        # symbol, the last price is shared by all accounts
+        self._price = np.zeros(0)
+        # account
+        self._multiplier = np.zeros(0)
+        self._nav = np.zeros(0)
+        self.failed: List[str] = []
+        self._lock = threading.Lock()
+
+    # region refresh
+    def refresh(self, account_ids: List[str] = None) -> List[str]:
+        """
+        Fetch positions and balances concurrently, rows of other accounts are kept
+        :param account_ids: default all accounts of the services
+        :return: accounts which could not be fetched, their previous rows are kept
+        """
+        account_ids = list(account_ids or self._services.keys())
+
+        def fetch(account_id):
+            service = self._services[account_id]
+            positions = service.current_positions()
+            if positions is None:
+                return None
+            return positions, service.account_balance()
+
+        results = run_concurrently(fetch, account_ids, self._max_workers)
+        failed = [account_id for account_id, result in zip(account_ids, results) if result is None]
+        if failed:
+            logging.error(f"Error while refreshing positions of {len(failed)}/{len(account_ids)} accounts: {failed}")
+
+        with self._lock:
+            for account_id, result in zip(account_ids, results):
+                if result is not None:
+                    self._set_account(account_id, *result)
+            self.failed = failed
+        return failed
+
+    def _set_account(self, account_id: str, positions: Dict[str, StockPosition], balance: Union[AccountBalance, None]):
+        self._grow(account_id, positions.keys())
+        row = self._account_index[account_id]
+        self._position[row, :] = 0.0
+        self._avg_price[row, :] = 0.0
+        market_id = getattr(self._services.get(account_id), "_market_id", None)
+        self._multiplier[row] = self._multipliers.get(market_id, 1.0)
+        for symbol, position in positions.items():
+            col = self._symbol_index[symbol]
+            self._position[row, col] = _to_float(position.position)
+            self._avg_price[row, col] = _to_float(position.avg_price)
+            market_price = _to_float(position.market_price)
+            if market_price:
+                self._price[col] = market_price
+        if balance is not None:
+            self._nav[row] = _to_float(balance.nav)
+
+    def _grow(self, account_id: str, symbols):
+        # new accounts and symbols append rows and columns, existing cells are kept
+        if account_id not in self._account_index:
+            self._account_index[account_id] = len(self.accounts)
+            self.accounts.append(account_id)
+            self._position = np.vstack([self._position, np.zeros((1, len(self.symbols)))])
+            self._avg_price = np.vstack([self._avg_price, np.zeros((1, len(self.symbols)))])
+            self._multiplier = np.append(self._multiplier, 1.0)
+            self._nav = np.append(self._nav, 0.0)
+        new_symbols = [symbol for symbol in symbols if symbol not in self._symbol_index]
+        if new_symbols:
+            for symbol in new_symbols:
+                self._symbol_index[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            padding = np.zeros((len(self.accounts), len(new_symbols)))
+            self._position = np.hstack([self._position, padding])
+            self._avg_price = np.hstack([self._avg_price, padding])
+            self._price = np.append(self._price, np.zeros(len(new_symbols)))
+
+    def update_price(self, symbol: str, price: float):
+        col = self._symbol_index.get(symbol)
+        if col is not None and price:
+            self._price[col] = price
+
+    def attach(self, stream):
+        """
+        Mark all accounts to market on each trade of a MarketDataStream
+        :param stream:
+        :return:
+        """
+        stream.add_listener(lambda symbol, current: self.update_price(symbol, current.current_price), [StreamEvent.TRADE])
+        return self
+    # endregion
+
+    # region rollups
+    def _values(self) -> Tuple[np.ndarray, np.ndarray]:
+        # signed market value and floating pnl, account x symbol
+        scale = self._price[None, :] * self._multiplier[:, None]
+        value = self._position * scale
+        floating_pl = value - self._position * self._avg_price * self._multiplier[:, None]
+        return value, floating_pl
+
+    def matrix(self, field: str = "position") -> "DataFrame":
+        """
+        :param field: position, avg_price, value or floating_pl
+        :return: account x symbol DataFrame
+        """
+        from pandas import DataFrame
+        with self._lock:
+            if field == "position":
+                data = self._position.copy()
+            elif field == "avg_price":
+                data = self._avg_price.copy()
+            else:
+                value, floating_pl = self._values()
+                data = value if field == "value" else floating_pl
+            return DataFrame(data, index=list(self.accounts), columns=list(self.symbols))
+
+    def net_position(self) -> "Series":
+        # by symbol, long and short accounts offset
+        from pandas import Series
+        with self._lock:
+            return Series(self._position.sum(axis=0), index=list(self.symbols))
+
+    def gross_exposure(self, by: str = "symbol") -> "Series":
+        """
+        :param by: symbol or account
+        :return:
+        """
+        with self._lock:
+            value, _ = self._values()
+            return self._rollup(np.abs(value), by)
+
+    def net_exposure(self, by: str = "symbol") -> "Series":
+        with self._lock:
+            value, _ = self._values()
+            return self._rollup(value, by)
+
+    def floating_pnl(self, by: str = "symbol") -> "Series":
+        with self._lock:
+            _, floating_pl = self._values()
+            return self._rollup(floating_pl, by)
+
+    def _rollup(self, data: np.ndarray, by: str) -> "Series":
+        from pandas import Series
+        if by == "symbol":
+            return Series(data.sum(axis=0), index=list(self.symbols))
+        if by == "account":
+            return Series(data.sum(axis=1), index=list(self.accounts))
+        raise ValueError(f"Rollup by {by} is not supported, use symbol or account.")
+
+    def summary(self) -> "DataFrame":
+        """
+        One row per account: nav, gross and net exposure, floating pnl and leverage (gross exposure / nav)
+        :return:
+        """
+        from pandas import DataFrame
+        with self._lock:
+            value, floating_pl = self._values()
+            gross = np.abs(value).sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                leverage = np.where(self._nav > 0, gross / self._nav, np.nan)
+            return DataFrame({
+                "nav": self._nav,
+                "gross_exposure": gross,
+                "net_exposure": value.sum(axis=1),
+                "floating_pl": floating_pl.sum(axis=1),
+                "leverage": leverage,
+            }, index=list(self.accounts))
+    # endregion
@@ -0,0 +1,254 @@
+# Description: Reference data store.
+# Index lists, index components, securities and the daily price board change at most once a day,
+# they are fetched once per trading day, persisted to disk and served from memory.
+import datetime
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Tuple, Union, Callable
+
+from ssi_trading.config import REFERENCE_CACHE_DIR, REFERENCE_REFRESH_CHECK_INTERVAL, PAGE_SIZES, MAX_PAGE_INDEX
+from ssi_trading.models.data import SecurityInfo
+from ssi_trading.models.definitions import SecurityMarket
+from ssi_trading.services.client import BaseDataService
+from ssi_trading.utils import run_concurrently, lot_size, tick_size, DEFAULT_DATE_FORMAT
+
+
+def _fetch_pages(fetch: Callable[[int, int], Union[list, None]], page_size: int = PAGE_SIZES[-1], max_pages: int = MAX_PAGE_INDEX) -> Union[list, None]:
+    rows = []
+    for page in range(1, max_pages + 1):
+        page_rows = fetch(page, page_size)
+        if page_rows is None:
+            return None if page == 1 else rows
+        rows.extend(page_rows)
+        if len(page_rows) < page_size:
+            break
+    return rows
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ReferenceDataStore:
+    def __init__(
+            self,
+            service: BaseDataService,
+            cache_dir: str = REFERENCE_CACHE_DIR,
+            check_interval: float = REFERENCE_REFRESH_CHECK_INTERVAL,
+            markets: List[str] = None
+    ):
+        """
+        :param service: data service used to fetch the reference data
+        :param cache_dir: one json file is kept per trading day
+        :param check_interval: seconds between two checks of the refresher thread
+        :param markets: markets of the securities, default HOSE, HNX, UPCOM and DER
+        """
+        self._service = service
+        self._cache_dir = cache_dir
+        self._check_interval = check_interval
+        self._markets = markets or [SecurityMarket.HOSE, SecurityMarket.HNX, SecurityMarket.UPCOM, SecurityMarket.DER]
+
+        # snapshot is replaced at once, readers never see a partial load
+        self._trading_date: Union[datetime.date, None] = None
+        self._index_names: List[str] = []
+        self._index_components: Dict[str, List[str]] = dict()
+        self._securities: Dict[str, SecurityInfo] = dict()
+        self._symbol_indexes: Dict[str, List[str]] = dict()
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresher: Union[threading.Thread, None] = None
+
+    # region load
+    def cache_path(self, trading_date: datetime.date) -> str:
+        return os.path.join(self._cache_dir, f"reference_{trading_date:%Y%m%d}.json")
+
+    def load(self, trading_date: datetime.date = None, force: bool = False) -> bool:
+        """
+        Load reference data of a trading day from the disk cache, fetch it from the api on a cache miss
+        :param trading_date: default today
+        :param force: ignore the disk cache
+        :return: True if the store holds the data of trading_date
+        """
+        trading_date = trading_date or datetime.date.today()
+        with self._lock:
+            if not force and self._trading_date == trading_date:
+                return True
+            snapshot = None if force else self._read(trading_date)
+            if snapshot is None:
+                snapshot = self._fetch(trading_date)
+                if snapshot is None:
+                    return False
+                self._write(trading_date, snapshot)
+            self._apply(trading_date, snapshot)
+        return True
+
+    def _read(self, trading_date: datetime.date) -> Union[dict, None]:
+        path = self.cache_path(trading_date)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as ex:
+            logging.exception(f"Error while reading reference data cache {path}: {ex}")
+            return None
+
+    def _write(self, trading_date: datetime.date, snapshot: dict):
+        path = self.cache_path(trading_date)
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            # write then rename, a crash never leaves a truncated cache
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as ex:
+            logging.exception(f"Error while writing reference data cache {path}: {ex}")
+
+    def _fetch(self, trading_date: datetime.date) -> Union[dict, None]:
+        service = self._service
+        day = trading_date.strftime(DEFAULT_DATE_FORMAT)
+
+        index_names = _fetch_pages(lambda page, size: service.list_index_names(None, page, size))
+        securities = run_concurrently(
+            lambda market: _fetch_pages(lambda page, size: service.list_securities(market, page, size)),
+            self._markets, len(self._markets)
+        )
+        if not index_names or not any(securities):
+            logging.error(f"Error while loading reference data of {day}, the previous data is kept.")
+            return None
+
+        components = run_concurrently(
+            lambda index_id: service.list_index_components(index_id, 1, 1000), index_names
+        )
+        # price board of the day, empty on holidays
+        boards = run_concurrently(
+            lambda market: _fetch_pages(lambda page, size: service.stock_price("", day, day, page, size, market)),
+            self._markets, len(self._markets)
+        )
+
+        rows = dict()
+        for market, market_securities in zip(self._markets, securities):
+            if market_securities is None:
+                logging.error(f"Error while loading securities of {market}.")
+            for security in market_securities or []:
+                rows[security.symbol] = {
+                    "market": security.market or market,
+                    "symbol": security.symbol,
+                    "stock_name": security.stock_name,
+                    "stock_en_name": security.stock_en_name,
+                }
+        for board in boards:
+            for price in board or []:
+                if price.symbol in rows:
+                    rows[price.symbol]["ref_price"] = _to_float(price.ref_price)
+                    rows[price.symbol]["ceiling_price"] = _to_float(price.ceiling_price)
+                    rows[price.symbol]["floor_price"] = _to_float(price.floor_price)
+
+        return {
+            "trading_date": trading_date.isoformat(),
+            "index_names": index_names,
+            "index_components": {
+                index_id: symbols for index_id, symbols in zip(index_names, components) if symbols is not None
+            },
+            "securities": list(rows.values()),
+        }
+
+    def _apply(self, trading_date: datetime.date, snapshot: dict):
+        securities = {row["symbol"]: SecurityInfo(**row) for row in snapshot.get("securities", [])}
+        index_components = snapshot.get("index_components", {})
+        symbol_indexes: Dict[str, List[str]] = dict()
+        for index_id, symbols in index_components.items():
+            for symbol in symbols:
+                symbol_indexes.setdefault(symbol, []).append(index_id)
+
+        self._index_names = list(snapshot.get("index_names", []))
+        self._index_components = index_components
+        self._securities = securities
+        self._symbol_indexes = symbol_indexes
+        self._trading_date = trading_date
+        logging.info(f"Loaded reference data of {trading_date}: {len(securities)} securities, {len(self._index_names)} indexes")
+    # endregion
+
+    # region lookup
+    @property
+    def trading_date(self) -> Union[datetime.date, None]:
+        return self._trading_date
+
+    def index_names(self) -> List[str]:
+        return list(self._index_names)
+
+    def index_components(self, index_id: str) -> Union[List[str], None]:
+        components = self._index_components.get(index_id)
+        return list(components) if components is not None else None
+
+    def indexes_of(self, symbol: str) -> List[str]:
+        return list(self._symbol_indexes.get(symbol, []))
+
+    def security(self, symbol: str) -> Union[SecurityInfo, None]:
+        return self._securities.get(symbol)
+
+    def symbols(self, market: str = None) -> List[str]:
+        return [symbol for symbol, security in self._securities.items() if market is None or security.market == market]
+
+    def exchange(self, symbol: str) -> Union[str, None]:
+        security = self._securities.get(symbol)
+        return security.market if security is not None else None
+
+    def lot_size(self, symbol: str) -> int:
+        return lot_size(self.exchange(symbol))
+
+    def tick_size(self, symbol: str, price: float = None) -> float:
+        """
+        :param symbol:
+        :param price: default reference price, HOSE tick size depends on the price
+        :return:
+        """
+        security = self._securities.get(symbol)
+        if security is None:
+            return tick_size(price or 0.0)
+        return tick_size(price if price is not None else security.ref_price, security.market)
+
+    def price_band(self, symbol: str) -> Union[Tuple[float, float], None]:
+        """
+        :param symbol:
+        :return: (floor, ceiling) of the trading day, None if the price board is not loaded
+        """
+        security = self._securities.get(symbol)
+        if security is None or not security.ceiling_price:
+            return None
+        return security.floor_price, security.ceiling_price
+    # endregion
+
+    # region refresher
+    def _run(self):
+        while not self._stop_event.wait(self._check_interval):
+            try:
+                self.load()
+            except Exception as ex:
+                logging.exception(f"Error while refreshing reference data: {ex}")
+
+    def start(self):
+        """
+        Load the data of today then reload it in background when the day changes
+        :return:
+        """
+        self.load()
+        if self._refresher is None or not self._refresher.is_alive():
+            self._stop_event.clear()
+            self._refresher = threading.Thread(target=self._run, name="ssi-reference-refresher", daemon=True)
+            self._refresher.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+    # endregion
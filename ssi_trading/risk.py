@@ -0,0 +1,274 @@
+# Description: Local pre-trade risk checks.
+# The engine is seeded once from REST (AccountBalance, MaxBuySellQty, StockPosition) and kept current from
+# fills and stream prices, so checks run in memory before create_order calls the network.
+# Accepted orders reserve their quantity and cost until they are filled, cancelled or rejected, so orders checked
+# before the first fill (ex: a batch of create_orders) are checked against each other.
+# The quantity of an order increasing the absolute position consumes buying power, value * margin rate, the quantity
+# reducing it releases buying power: buys and sells of cash stocks, and both sides of futures which can open shorts.
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Union, Tuple
+
+from ssi_trading.exceptions import RiskCheckFailed
+from ssi_trading.models.data import CurrentMarket
+from ssi_trading.models.definitions import OrderSide, OrderType, OrderStatus
+from ssi_trading.models.trading import CreatedOrder, AccountBalance, StockPosition, MaxBuySellQty
+
+
+@dataclass
+class RiskLimits:
+    max_order_qty: float = 0  # 0 means no limit
+    max_order_value: float = 0
+    max_position: float = 0
+    fat_finger_pct: float = 0  # max distance from last price, example 0.05 is 5%
+    check_price_band: bool = True
+    check_buying_power: bool = True
+
+
+def _split_qty(position: float, order_side: str, qty: float) -> Tuple[float, float]:
+    # (closing qty, opening qty) of an order on a position
+    closing = 0.0
+    if (order_side == OrderSide.BUY and position < 0) or (order_side != OrderSide.BUY and position > 0):
+        closing = min(qty, abs(position))
+    return closing, qty - closing
+
+
+class PreTradeRiskEngine:
+    def __init__(self, account_id: str, limits: RiskLimits = None, multiplier: float = 1.0, margin_rate: float = 1.0):
+        """
+        :param account_id:
+        :param limits: RiskLimits
+        :param multiplier: contract multiplier, 1 for stocks, 100000 for VN30F
+        :param margin_rate: part of the value increasing the absolute position consumed from buying power,
+            1 for cash stocks
+        """
+        self.account_id = account_id.__str__().upper()
+        self._limits = limits or RiskLimits()
+        self._multiplier = multiplier
+        self._margin_rate = margin_rate
+
+        self._buying_power: Union[float, None] = None
+        self._max_qty: Dict[Tuple[str, str], float] = dict()
+        self._positions: Dict[str, float] = dict()
+        # symbol -> (floor, ceiling, last price)
+        self._bands: Dict[str, Tuple[float, float, float]] = dict()
+        # id of the accepted order -> [order, symbol, order side, open qty, cost per unit]
+        self._reservations: Dict[int, list] = dict()
+        # order id or request id returned by the trading service -> id of the accepted order
+        self._reservation_ids: Dict[str, int] = dict()
+        self._reserved_qty: Dict[Tuple[str, str], float] = dict()
+        self._reserved_cost = 0.0
+        self._lock = threading.Lock()
+
+    # region seed and update
+    def seed(
+            self,
+            balance: AccountBalance = None,
+            positions: Dict[str, StockPosition] = None,
+            max_qtys: List[MaxBuySellQty] = None,
+            order_side: str = OrderSide.BUY
+    ):
+        """
+        Seed the engine from REST snapshots, call again to reconcile
+        :param balance:
+        :param positions:
+        :param max_qtys: results of max_buy_sell_qty, all queried with order_side
+        :param order_side:
+        :return:
+        """
+        with self._lock:
+            if balance is not None and balance.ee is not None:
+                self._buying_power = float(balance.ee)
+            for max_qty in max_qtys or []:
+                if max_qty is None:
+                    continue
+                self._max_qty[(max_qty.symbol, order_side)] = float(max_qty.max_qty or 0)
+                if max_qty.power is not None:
+                    self._buying_power = float(max_qty.power)
+            if positions is not None:
+                self._positions = {symbol: float(position.position or 0) for symbol, position in positions.items()}
+        return self
+
+    def update_market(self, market: CurrentMarket):
+        if market is None or not market.symbol:
+            return
+        self._bands[market.symbol] = (
+            market.floor_price, market.ceiling_price, market.current_price or market.ref_price
+        )
+
+    def on_fill(self, symbol: str, order_side: str, qty: float, price: float, order_id: str = None):
+        """
+        Update position, buying power and remaining max qty from a fill
+        :param symbol:
+        :param order_side:
+        :param qty: filled quantity of this fill
+        :param price: fill price
+        :param order_id: the filled quantity is released from the reservation of this order
+        :return:
+        """
+        signed_qty = qty if order_side == OrderSide.BUY else -qty
+        unit_cost = price * self._multiplier * self._margin_rate
+        with self._lock:
+            key = self._reservation_ids.get(order_id) if order_id is not None else None
+            if key is not None:
+                self._unreserve(key, qty)
+            position = self._positions.get(symbol, 0)
+            self._positions[symbol] = position + signed_qty
+            if self._buying_power is not None:
+                closing, opening = _split_qty(position, order_side, qty)
+                self._buying_power += (closing - opening) * unit_cost
+            key = (symbol, order_side)
+            if key in self._max_qty:
+                self._max_qty[key] = max(0.0, self._max_qty[key] - qty)
+
+    def position(self, symbol: str) -> float:
+        return self._positions.get(symbol, 0)
+
+    def buying_power(self) -> Union[float, None]:
+        return self._buying_power
+
+    def reserved_cost(self) -> float:
+        return self._reserved_cost
+    # endregion
+
+    # region reservations
+    def on_sent(self, order: CreatedOrder, result: Union[CreatedOrder, None]):
+        """
+        Correlate the reservation of a checked order with the ids returned by the trading service
+        :param order: order passed to check
+        :param result: result of create_order, None releases the reservation
+        :return:
+        """
+        with self._lock:
+            key = id(order)
+            if key not in self._reservations:
+                return
+            if result is None or result.order_status in OrderStatus.REJECT_ORDERS:
+                self._unreserve(key)
+                return
+            for order_id in (result.order_id, result.request_id):
+                if order_id is not None:
+                    self._reservation_ids[str(order_id)] = key
+            # filled when sent, the fill is applied by on_fill
+            if result.order_status is not None and result.order_status not in OrderStatus.WORKING_ORDERS:
+                self._unreserve(key)
+
+    def on_order_update(self, order: CreatedOrder):
+        """
+        Order update from the trading stream, cancelled, rejected and filled orders release their reservation
+        :param order:
+        :return:
+        """
+        with self._lock:
+            key = self._find(order)
+            if key is None:
+                return
+            if order.order_id is not None:
+                self._reservation_ids[str(order.order_id)] = key
+            if order.order_status is not None and order.order_status not in OrderStatus.WORKING_ORDERS:
+                self._unreserve(key)
+
+    def release(self, order: CreatedOrder):
+        """
+        Release the reservation of an order, ex: after a successful cancel
+        :param order:
+        :return:
+        """
+        with self._lock:
+            key = self._find(order)
+            if key is not None:
+                self._unreserve(key)
+
+    def _find(self, order: CreatedOrder) -> Union[int, None]:
+        if id(order) in self._reservations:
+            return id(order)
+        for order_id in (order.order_id, order.request_id):
+            if order_id is not None and str(order_id) in self._reservation_ids:
+                return self._reservation_ids[str(order_id)]
+        return None
+
+    def _reserve(self, order: CreatedOrder, qty: float, unit_cost: float):
+        # an order checked again replaces its reservation
+        self._unreserve(id(order))
+        key = (order.symbol, order.order_side)
+        self._reservations[id(order)] = [order, order.symbol, order.order_side, qty, unit_cost]
+        self._reserved_qty[key] = self._reserved_qty.get(key, 0) + qty
+        self._reserved_cost += qty * unit_cost
+
+    def _unreserve(self, key: int, qty: float = None):
+        # release qty of the reservation, all of it by default
+        reservation = self._reservations.get(key)
+        if reservation is None:
+            return
+        order, symbol, order_side, open_qty, unit_cost = reservation
+        qty = open_qty if qty is None else min(qty, open_qty)
+        reservation[3] = open_qty - qty
+        side_key = (symbol, order_side)
+        self._reserved_qty[side_key] = max(0.0, self._reserved_qty.get(side_key, 0) - qty)
+        self._reserved_cost = max(0.0, self._reserved_cost - qty * unit_cost)
+        if reservation[3] <= 0:
+            del self._reservations[key]
+            for order_id in (order.order_id, order.request_id):
+                if order_id is not None and self._reservation_ids.get(str(order_id)) == key:
+                    del self._reservation_ids[str(order_id)]
+    # endregion
+
+    def check(self, order: CreatedOrder) -> CreatedOrder:
+        """
+        Validate an order against the local limits, raise RiskCheckFailed if any limit is breached,
+        an accepted order is reserved until on_sent, on_fill, on_order_update or release frees it
+        :param order:
+        :return: the order
+        """
+        limits = self._limits
+        qty = order.order_qty
+        if qty is None or qty <= 0:
+            raise RiskCheckFailed(f"Invalid quantity {qty} for {order.symbol}.")
+        if limits.max_order_qty and qty > limits.max_order_qty:
+            raise RiskCheckFailed(f"Order qty {qty} of {order.symbol} exceeds max order qty {limits.max_order_qty}.")
+
+        floor, ceiling, last = self._bands.get(order.symbol, (0.0, 0.0, 0.0))
+        is_limit_order = order.order_type == OrderType.LIMIT
+        if is_limit_order:
+            price = order.order_price
+            if limits.check_price_band and floor and ceiling and not floor <= price <= ceiling:
+                raise RiskCheckFailed(f"Order price {price} of {order.symbol} is out of band [{floor}, {ceiling}].")
+            if limits.fat_finger_pct and last and abs(price - last) / last > limits.fat_finger_pct:
+                raise RiskCheckFailed(
+                    f"Order price {price} of {order.symbol} is more than {limits.fat_finger_pct:.2%} away from {last}."
+                )
+        else:
+            # market orders are priced at the worst price of the band
+            price = (ceiling if order.order_side == OrderSide.BUY else floor) or last or order.order_price
+
+        value = qty * price * self._multiplier
+        if limits.max_order_value and value > limits.max_order_value:
+            raise RiskCheckFailed(f"Order value {value} of {order.symbol} exceeds max order value {limits.max_order_value}.")
+
+        with self._lock:
+            # open quantities of the accepted orders count as filled
+            pending = self._reserved_qty.get((order.symbol, order.order_side), 0)
+            sign = 1 if order.order_side == OrderSide.BUY else -1
+            position = self._positions.get(order.symbol, 0) + sign * pending
+            new_position = position + sign * qty
+            if limits.max_position and abs(new_position) > limits.max_position:
+                raise RiskCheckFailed(
+                    f"Position {new_position} of {order.symbol} after order exceeds max position {limits.max_position}."
+                )
+
+            # only the quantity increasing the absolute position consumes buying power
+            _, opening = _split_qty(position, order.order_side, qty)
+            cost = opening * price * self._multiplier * self._margin_rate
+            if limits.check_buying_power:
+                max_qty = self._max_qty.get((order.symbol, order.order_side))
+                if max_qty is not None and qty + pending > max_qty:
+                    raise RiskCheckFailed(
+                        f"Order qty {qty} of {order.symbol} with {pending} pending exceeds max {order.order_side} qty {max_qty}."
+                    )
+                if cost > 0 and self._buying_power is not None:
+                    available = self._buying_power - self._reserved_cost
+                    if cost > available:
+                        raise RiskCheckFailed(f"Order cost {cost} of {order.symbol} exceeds available buying power {available}.")
+
+            self._reserve(order, qty, cost / qty)
+        return order
@@ -1,24 +1,50 @@
+import datetime
 import logging
-from typing import TypeVar, Generic, Dict, Union, List
+import time
+from typing import TypeVar, Generic, Dict, Union, List, TYPE_CHECKING
 
-from pandas import DataFrame
-
-from ssi_trading.exceptions import TradingServiceUnavailable
+from ssi_trading.config import BootstrapConfig
+from ssi_trading.exceptions import TradingServiceUnavailable, RiskCheckFailed, BootstrapFailed
 from ssi_trading.models.data import (
     CurrentBar, CurrentIndex, CurrentMarket, CurrentForeignRoom,
-    OHLCV, DailyIndex, StockPrice
+    OHLCV, DailyIndex, StockPrice, BulkOHLCV
 )
 from ssi_trading.models.definitions import DataChannel
-from ssi_trading.models.trading import CreatedOrder, AccountBalance, StockPosition, MaxBuySellQty
+from ssi_trading.models.trading import (
+    CreatedOrder, AccountBalance, StockPosition, MaxBuySellQty, OrderEvent, FillEvent
+)
+from ssi_trading.reference import ReferenceDataStore
+from ssi_trading.risk import PreTradeRiskEngine
+from ssi_trading.session import credential_manager
 from ssi_trading.services.client import BaseTradingService, BaseDataService
-from ssi_trading.services.stream import BaseDataStream, BaseTradingStream
+from ssi_trading.factory import device_id, user_agent
+from ssi_trading.utils import run_concurrently, DEFAULT_DATE_FORMAT, trading_days, page_size_for
+
+if TYPE_CHECKING:
+    # streams and pandas are imported by the caller which creates the streams
+    from pandas import DataFrame
+    from ssi_trading.services.stream import BaseDataStream, BaseTradingStream
 
 
-TDataStream = TypeVar('TDataStream', bound=BaseDataStream)
+TDataStream = TypeVar('TDataStream', bound='BaseDataStream')
 TDataService = TypeVar('TDataService', bound=BaseDataService)
 
 TTradingService = TypeVar('TTradingService', bound=BaseTradingService)
-TTradingStream = TypeVar('TTradingStream', bound=BaseTradingStream)
+TTradingStream = TypeVar('TTradingStream', bound='BaseTradingStream')
+
+# classes built by bootstrap, resolved lazily from ssi_trading.client and ssi_trading.streamer
+_TRADING_SERVICE_CLASSES = {
+    ("future", False): "FutureTradingService",
+    ("future", True): "PaperFutureTradingService",
+    ("fundamental", False): "FundamentalTradingService",
+    ("fundamental", True): "PaperFundamentalTradingService",
+}
+_DATA_STREAM_CLASSES = {
+    DataChannel.MARKET_DATA: "MarketDataStream",
+    DataChannel.BAR_DATA: "BarDataStream",
+    DataChannel.INDEX_DATA: "IndexDataStream",
+    DataChannel.FR_ROOM_DATA: "ForeignRoomDataStream",
+}
 
 
 class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataService]):
@@ -28,6 +54,15 @@ class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataSer
 
         self._trading_streams: Dict[str, TTradingStream] = dict()
         self._trading_services: Dict[str, TTradingService] = dict()
+        self._risk_engines: Dict[str, PreTradeRiskEngine] = dict()
+        # (handler, account id or None) fed by the trading streams
+        self._trading_handlers: List[tuple] = []
+        self._reference: Union[ReferenceDataStore, None] = None
+        self._history: Union[BulkOHLCV, None] = None
+        # symbols and (first, last) trading time of the history
+        self._history_symbols: frozenset = frozenset()
+        self._history_range: Union[tuple, None] = None
+        self._startup_timings: Dict[str, float] = dict()
 
     # region setup stream, services
     #
@@ -37,8 +72,44 @@ class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataSer
 
     def add_trading_steam(self, stream: TTradingStream):
         self._trading_streams[stream.account_id] = stream
+        # fills and order updates reach the risk engines and the trading handlers
+        stream.add_listener(self._on_trading_event)
+        return self
+
+    def add_trading_handler(self, handler, account_id: str = None):
+        """
+        Feed the events of the trading streams to a handler:
+        on_order_update(order) of ExecutionScheduler and StopTriggerEngine, on_fill(symbol, order_side, qty, price) of PortfolioEngine
+        :param handler:
+        :param account_id: only events of this account, default all accounts
+        :return:
+        """
+        self._trading_handlers.append((handler, account_id.__str__().upper() if account_id is not None else None))
         return self
 
+    def _on_trading_event(self, event):
+        event_account = event.order.account_id if isinstance(event, OrderEvent) else getattr(event, "account_id", None)
+        # a failing risk engine or handler must not keep the event from the others
+        engine = self._risk_engines.get(event_account)
+        if engine is not None:
+            try:
+                if isinstance(event, OrderEvent):
+                    engine.on_order_update(event.order)
+                elif isinstance(event, FillEvent):
+                    engine.on_fill(event.symbol, event.order_side, event.qty, event.price, order_id=event.order_id)
+            except Exception as ex:
+                logging.exception(f"Error in risk engine of {event_account} on {type(event).__name__}: {ex}")
+        for handler, account_id in self._trading_handlers:
+            if account_id is not None and account_id != event_account:
+                continue
+            try:
+                if isinstance(event, OrderEvent) and hasattr(handler, "on_order_update"):
+                    handler.on_order_update(event.order)
+                elif isinstance(event, FillEvent) and hasattr(handler, "on_fill"):
+                    handler.on_fill(event.symbol, event.order_side, event.qty, event.price)
+            except Exception as ex:
+                logging.exception(f"Error in trading handler {handler} on {type(event).__name__}: {ex}")
+
     def add_trading_service(self, service: TTradingService):
         self._trading_services[service.account_id] = service
         return self
@@ -47,12 +118,49 @@ class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataSer
         self._data_service = service
         return self
 
+    def add_risk_engine(self, engine: PreTradeRiskEngine, seed: bool = True):
+        """
+        Add a pre-trade risk engine for an account, orders of the account are checked locally before being sent
+        :param engine:
+        :param seed: seed balance and positions from the trading service once
+        :return:
+        """
+        if seed:
+            if engine.account_id not in self._trading_services:
+                raise TradingServiceUnavailable(f"Account ID {engine.account_id} is not available.")
+            service = self._trading_services[engine.account_id]
+            engine.seed(balance=service.account_balance(), positions=service.current_positions())
+        self._risk_engines[engine.account_id] = engine
+        return self
+
+    def add_reference_data(self, store: ReferenceDataStore):
+        """
+        Serve index lists and index components from a reference data store instead of the api
+        :param store:
+        :return:
+        """
+        self._reference = store
+        return self
+
+    @property
+    def reference(self) -> Union[ReferenceDataStore, None]:
+        return self._reference
+
     def start_data_stream(self):
         for stream in self._data_streams.values():
             logging.debug(f"Start data stream: {stream}")
             stream.start_stream()
         return self
 
+    def archive_data_streams(self, archive, trading_date=None) -> List[str]:
+        """
+        Write the data of all data streams to an end of day archive
+        :param archive: TickArchive
+        :param trading_date: default today
+        :return: written files
+        """
+        return archive.write_streams(self._data_streams.values(), trading_date)
+
     def start_trading_stream(self):
         for stream in self._trading_streams.values():
             logging.debug(f"Start trading stream: {stream}")
@@ -60,18 +168,252 @@ class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataSer
         return self
     # endregion
 
+    # region bootstrap
+    @classmethod
+    def bootstrap(cls, config: BootstrapConfig) -> "SSIServices":
+        """
+        Build the services of a config, slow steps run concurrently:
+        every consumer is authenticated at once, then the services are built,
+        then reference data and daily history are loaded side by side,
+        daily_ohlcv of the history symbols is served from the history afterwards
+        :param config:
+        :return: SSIServices, seconds spent per stage in startup_timings
+        :raise BootstrapFailed: a service or stream could not be built and config.allow_partial is False
+        """
+        services = cls()
+        started_at = time.perf_counter()
+        services._run_stage("authenticate", services._authenticate, config)
+        services._run_stage("services", services._build_services, config)
+
+        warm_ups = []
+        if config.reference_data:
+            warm_ups.append(("reference", services._load_reference))
+        if config.history_symbols:
+            warm_ups.append(("history", services._load_history))
+        run_concurrently(lambda stage: services._run_stage(stage[0], stage[1], config), warm_ups, len(warm_ups))
+
+        if config.start_streams:
+            services._run_stage("streams", lambda _: services.start_data_stream().start_trading_stream(), config)
+        services._startup_timings["total"] = time.perf_counter() - started_at
+        logging.info("Bootstrap done: " + ", ".join(f"{name} {elapsed:.2f}s" for name, elapsed in services._startup_timings.items()))
+        return services
+
+    @property
+    def startup_timings(self) -> Dict[str, float]:
+        return dict(self._startup_timings)
+
+    @property
+    def history(self) -> Union[BulkOHLCV, None]:
+        # daily ohlcv of the bootstrap history symbols
+        return self._history
+
+    def _run_stage(self, name: str, fn, config: BootstrapConfig):
+        started_at = time.perf_counter()
+        try:
+            return fn(config)
+        finally:
+            self._startup_timings[name] = time.perf_counter() - started_at
+            logging.debug(f"Bootstrap stage {name} done in {self._startup_timings[name]:.2f}s")
+
+    def _authenticate(self, config: BootstrapConfig):
+        manager = credential_manager()
+        data_configs = [config.data_service] + list(config.data_streams.values())
+        trading_configs = config.trading_services + config.trading_streams
+        # configs are equal when they share credentials, each consumer is authenticated once
+        tasks = [device_id, user_agent]
+        tasks += [lambda cfg=cfg: manager.market_data_client(cfg) for cfg in dict.fromkeys(c for c in data_configs if c is not None)]
+        tasks += [lambda cfg=cfg: manager.trading_client(cfg) for cfg in dict.fromkeys(c for c in trading_configs if not c.paper_trading)]
+        results = run_concurrently(lambda task: task(), tasks, config.max_workers)
+        failed = sum(1 for result in results if result is None)
+        if failed:
+            logging.error(f"Bootstrap: {failed}/{len(tasks)} clients could not be created.")
+
+    def _build_services(self, config: BootstrapConfig):
+        from ssi_trading import client, streamer
+
+        # (description, builder), builders return self
+        builders = []
+        failed = []
+        if config.data_service is not None:
+            builders.append(("data service", lambda: self.add_data_service(client.MarketDataService(config.data_service))))
+        for cfg in config.trading_services:
+            name = _TRADING_SERVICE_CLASSES.get((cfg.account_type, cfg.paper_trading))
+            if name is None:
+                failed.append(f"trading service {cfg.account_id}: account type {cfg.account_type} is not supported")
+                continue
+            builders.append((
+                f"trading service {cfg.account_id}",
+                lambda cfg=cfg, name=name: self.add_trading_service(getattr(client, name)(cfg))
+            ))
+        for channel, cfg in config.data_streams.items():
+            name = _DATA_STREAM_CLASSES.get(channel)
+            if name is None:
+                failed.append(f"data stream {channel}: channel is not supported")
+                continue
+            builders.append((
+                f"data stream {channel}", lambda cfg=cfg, name=name: self.add_data_stream(getattr(streamer, name)(cfg))
+            ))
+        for cfg in config.trading_streams:
+            builders.append((
+                f"trading stream {cfg.account_id}", lambda cfg=cfg: self.add_trading_steam(streamer.TradingStream(cfg))
+            ))
+        # clients are authenticated, constructors only read the shared sessions, failed constructors return None
+        results = run_concurrently(lambda builder: builder[1](), builders, config.max_workers)
+        failed += [name for (name, _), result in zip(builders, results) if result is None]
+        if failed:
+            if not config.allow_partial:
+                raise BootstrapFailed(f"Bootstrap: {len(failed)} services could not be built: {failed}")
+            logging.error(f"Bootstrap: {len(failed)} services could not be built, started without them: {failed}")
+
+    def _load_reference(self, config: BootstrapConfig):
+        if self._data_service is None:
+            logging.warning("Bootstrap: reference data requires a data service, skipped.")
+            return
+        store = ReferenceDataStore(self._data_service)
+        store.start()
+        self.add_reference_data(store)
+
+    def _load_history(self, config: BootstrapConfig):
+        if self._data_service is None:
+            logging.warning("Bootstrap: history requires a data service, skipped.")
+            return
+        end_date = datetime.date.today()
+        start_date = end_date - datetime.timedelta(days=config.history_days)
+        history = self._data_service.bulk_daily_ohlcv(
+            config.history_symbols, start_date.strftime(DEFAULT_DATE_FORMAT), end_date.strftime(DEFAULT_DATE_FORMAT)
+        )
+        self._history_symbols = frozenset(config.history_symbols) - frozenset(history.failed)
+        self._history_range = (
+            datetime.datetime.combine(start_date, datetime.time.min), datetime.datetime.combine(end_date, datetime.time.min)
+        )
+        self._history = history
+
+    def _history_ohlcv(self, symbol, start_date, end_date, page_index: int = 1, page_size: int = None,
+                       ascending: bool = False) -> Union[List[OHLCV], None]:
+        # daily ohlcv of the bootstrap history, None when the range is not inside the loaded one,
+        # paged and ordered like the daily ohlcv api: newest first, default page size holding the range
+        if self._history is None or symbol not in self._history_symbols:
+            return None
+        try:
+            start = datetime.datetime.strptime(start_date, DEFAULT_DATE_FORMAT)
+            end = datetime.datetime.strptime(end_date, DEFAULT_DATE_FORMAT)
+        except (TypeError, ValueError):
+            return None
+        first, last = self._history_range
+        if start < first or end > last:
+            return None
+        data = self._history.data
+        rows = data[(data["symbol"] == symbol) & (data["trading_time"] >= start) & (data["trading_time"] <= end)]
+        rows = rows.sort_values("trading_time", ascending=ascending)
+        page_size = page_size or page_size_for(trading_days(start_date, end_date))
+        rows = rows.iloc[(page_index - 1) * page_size:page_index * page_size]
+        return [OHLCV(**row) for row in rows.to_dict("records")]
+    # endregion
+
     # region trading services
-    # create, cancel, modify, account_balance, current_positions,
+    # verify_code, create, cancel, modify, account_balance, current_positions,
     # closed_positions, max_buy_sell_qty, order_history, etc.
+    def verify_code(self, account_id, code: str) -> str:
+        """
+        Get the writer token required to place orders, the token is shared by all services of the consumer
+        :param account_id:
+        :param code: PIN or OTP
+        :return:
+        """
+        if account_id not in self._trading_services:
+            raise TradingServiceUnavailable(f"Account ID {account_id} is not available.")
+        return credential_manager().verify_code(self._trading_services[account_id]._config, code)
+
     def create_order(self, order: CreatedOrder) -> Union[CreatedOrder, None]:
         if order.account_id not in self._trading_services:
             raise TradingServiceUnavailable(f"Account ID {order.account_id} is not available.")
-        return self._trading_services[order.account_id].create_order(order)
+        self._check_risk(order)
+        try:
+            result = self._trading_services[order.account_id].create_order(order)
+        except Exception:
+            self._on_sent(order, None)
+            raise
+        self._on_sent(order, result)
+        return result
 
     def cancel_order(self, order) -> Union[CreatedOrder, None]:
         if order.account_id not in self._trading_services:
             raise TradingServiceUnavailable(f"Account ID {order.account_id} is not available.")
-        return self._trading_services[order.account_id].cancel_order(order)
+        return self._on_cancelled(self._trading_services[order.account_id].cancel_order(order))
+
+    def create_orders(self, orders: List[CreatedOrder]) -> List[Union[CreatedOrder, None]]:
+        # accounts are checked before the risk engines reserve anything
+        for order in orders:
+            if order.account_id not in self._trading_services:
+                raise TradingServiceUnavailable(f"Account ID {order.account_id} is not available.")
+
+        # orders rejected by the risk engine are not sent, their result is None
+        passed = []
+        for i, order in enumerate(orders):
+            try:
+                self._check_risk(order)
+                passed.append(i)
+            except RiskCheckFailed as ex:
+                logging.error(f"Risk check failed: {ex}")
+
+        results: List[Union[CreatedOrder, None]] = [None] * len(orders)
+        try:
+            batch = self._run_batch(
+                [orders[i] for i in passed], lambda service, account_orders: service.create_orders(account_orders)
+            )
+        except Exception:
+            for i in passed:
+                self._on_sent(orders[i], None)
+            raise
+        for i, result in zip(passed, batch):
+            results[i] = result
+            self._on_sent(orders[i], result)
+        return results
+
+    def cancel_orders(self, orders: List[CreatedOrder]) -> List[Union[CreatedOrder, None]]:
+        results = self._run_batch(orders, lambda service, account_orders: service.cancel_orders(account_orders))
+        return [self._on_cancelled(result) for result in results]
+
+    def cancel_all(self, account_id, symbol: str = None) -> List[Union[CreatedOrder, None]]:
+        if account_id not in self._trading_services:
+            raise TradingServiceUnavailable(f"Account ID {account_id} is not available.")
+        return [self._on_cancelled(result) for result in self._trading_services[account_id].cancel_all(symbol)]
+
+    def _check_risk(self, order: CreatedOrder):
+        engine = self._risk_engines.get(order.account_id)
+        if engine is not None:
+            if DataChannel.MARKET_DATA in self._data_streams:
+                engine.update_market(self._data_streams[DataChannel.MARKET_DATA].get_current(order.symbol))
+            engine.check(order)
+
+    def _on_sent(self, order: CreatedOrder, result: Union[CreatedOrder, None]):
+        # orders which were not sent release their reservation
+        engine = self._risk_engines.get(order.account_id)
+        if engine is not None:
+            engine.on_sent(order, result)
+
+    def _on_cancelled(self, result: Union[CreatedOrder, None]) -> Union[CreatedOrder, None]:
+        engine = self._risk_engines.get(result.account_id) if result is not None else None
+        if engine is not None:
+            engine.release(result)
+        return result
+
+    def _run_batch(self, orders: List[CreatedOrder], fn) -> List[Union[CreatedOrder, None]]:
+        # group orders by account, each account runs its own batch concurrently
+        groups: Dict[str, List[int]] = dict()
+        for i, order in enumerate(orders):
+            if order.account_id not in self._trading_services:
+                raise TradingServiceUnavailable(f"Account ID {order.account_id} is not available.")
+            groups.setdefault(order.account_id, []).append(i)
+
+        def _run_group(account_id):
+            return fn(self._trading_services[account_id], [orders[i] for i in groups[account_id]])
+
+        results: List[Union[CreatedOrder, None]] = [None] * len(orders)
+        for account_id, group_results in zip(groups.keys(), run_concurrently(_run_group, groups.keys(), len(groups))):
+            for i, result in zip(groups[account_id], group_results or []):
+                results[i] = result
+        return results
 
     def modify_order(self, order: CreatedOrder, new_qty: int = 0, new_price: float = 0) -> CreatedOrder:
         if order.account_id not in self._trading_services:
@@ -128,13 +470,25 @@ class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataSer
             raise TradingServiceUnavailable(f"Account ID {account_id} is not available.")
         return self._trading_services[account_id].view_portfolio()
 
+    def aggregated_portfolio(self, refresh: bool = True):
+        """
+        Positions of all trading accounts in one view, rollups by symbol or account
+        :param refresh: fetch the positions and balances of all accounts
+        :return: AggregatedPortfolio
+        """
+        from ssi_trading.portfolio import AggregatedPortfolio
+        portfolio = AggregatedPortfolio(self._trading_services)
+        if refresh:
+            portfolio.refresh()
+        return portfolio
+
     # endregion
 
     # region data stream services
     # get_dataframe, get_current, get_current_bar_from_stream, get_df_bar_from_stream, etc.
     # if channel has not been added, raise ValueError
     #
-    def get_df_bar_from_stream(self, symbol) -> DataFrame:
+    def get_df_bar_from_stream(self, symbol) -> "DataFrame":
         if DataChannel.BAR_DATA not in self._data_streams:
             raise ValueError("Bar data stream is not available.")
         return self._data_streams[DataChannel.BAR_DATA].get_dataframe(symbol)
@@ -144,7 +498,7 @@ class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataSer
             raise ValueError("Bar data stream is not available.")
         return self._data_streams[DataChannel.BAR_DATA].get_current(symbol)
 
-    def get_df_foreign_from_stream(self, symbol) -> DataFrame:
+    def get_df_foreign_from_stream(self, symbol) -> "DataFrame":
         if DataChannel.FR_ROOM_DATA not in self._data_streams:
             raise ValueError("Foreign data stream is not available.")
         return self._data_streams[DataChannel.FR_ROOM_DATA].get_dataframe(symbol)
@@ -154,7 +508,7 @@ class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataSer
             raise ValueError("Foreign data stream is not available.")
         return self._data_streams[DataChannel.FR_ROOM_DATA].get_current(symbol)
 
-    def get_df_index_from_stream(self, symbol) -> DataFrame:
+    def get_df_index_from_stream(self, symbol) -> "DataFrame":
         if DataChannel.INDEX_DATA not in self._data_streams:
             raise ValueError("Index data stream is not available.")
         return self._data_streams[DataChannel.INDEX_DATA].get_dataframe(symbol)
@@ -164,7 +518,7 @@ class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataSer
             raise ValueError("Index data stream is not available.")
         return self._data_streams[DataChannel.INDEX_DATA].get_current(symbol)
 
-    def get_df_market_from_stream(self, symbol) -> DataFrame:
+    def get_df_market_from_stream(self, symbol) -> "DataFrame":
         if DataChannel.MARKET_DATA not in self._data_streams:
             raise ValueError("Market data stream is not available.")
         return self._data_streams[DataChannel.MARKET_DATA].get_dataframe(symbol)
@@ -180,16 +534,27 @@ class SSIServices(Generic[TDataStream, TTradingStream, TTradingService, TDataSer
     def daily_index(self, index_name, start_date, end_date) -> Union[List[DailyIndex], None]:
         return self._data_service.daily_index(index_name, start_date, end_date)
 
-    def daily_ohlcv(self, symbol, start_date, end_date) -> Union[List[OHLCV], None]:
-        return self._data_service.daily_ohlcv(symbol, start_date, end_date)
+    def daily_ohlcv(self, symbol, start_date, end_date, page_index: int = 1, page_size: int = None,
+                    ascending: bool = False) -> Union[List[OHLCV], None]:
+        history = self._history_ohlcv(symbol, start_date, end_date, page_index, page_size, ascending)
+        if history is not None:
+            return history
+        return self._data_service.daily_ohlcv(symbol, start_date, end_date, page_index, page_size, ascending)
 
     def intraday_ohlcv(self, symbol, start_date, end_date) -> Union[List[OHLCV], None]:
         return self._data_service.intraday_ohlcv(symbol, start_date, end_date)
 
     def list_index_components(self, index_name) -> Union[List[str], None]:
+        if self._reference is not None and self._reference.trading_date is not None:
+            components = self._reference.index_components(index_name)
+            if components is not None:
+                return components
         return self._data_service.list_index_components(index_name)
 
     def list_index_names(self, exchange) -> Union[List[str], None]:
+        # the store keeps the indexes of all exchanges
+        if exchange is None and self._reference is not None and self._reference.trading_date is not None:
+            return self._reference.index_names()
         return self._data_service.list_index_names(exchange)
 
     def stock_price(self, symbol, start_date, end_date) -> Union[List[StockPrice], None]:
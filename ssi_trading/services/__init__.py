@@ -0,0 +1,9 @@
+from ssi_trading.lazy import lazy_attributes
+
+# sub packages are imported on first access: ssi_trading.services.client, stream, paper, backtest and bus
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    "BaseDataService": "ssi_trading.services.client",
+    "BaseTradingService": "ssi_trading.services.client",
+    "BaseDataStream": "ssi_trading.services.stream",
+    "BaseTradingStream": "ssi_trading.services.stream",
+})
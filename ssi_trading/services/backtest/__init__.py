@@ -0,0 +1,507 @@
+# Description: Event-driven backtest engine over OHLCV arrays.
+# Fills are found with vectorized lookahead searches on the bar arrays when an order is submitted,
+# so the event loop only pops scheduled fills instead of re-checking every working order on every bar.
+import copy
+import datetime
+import heapq
+import itertools
+from dataclasses import dataclass, field
+from typing import Dict, List, Union, Callable, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ssi_trading.ledger import Ledger
+from ssi_trading.models.data import OHLCV
+from ssi_trading.models.definitions import OrderType, OrderSide, OrderStatus, SecurityMarket
+from ssi_trading.models.trading import CreatedOrder
+from ssi_trading.utils import price_band, tick_size, lot_size
+
+# search window of the vectorized fill lookahead, grows x4 each time nothing is found
+_SEARCH_CHUNK = 256
+
+# event kinds of the engine queue, fills are processed before expiries at the same time
+_EVENT_FILL = 0
+_EVENT_EXPIRE = 1
+
+
+@dataclass
+class BacktestResult:
+    timeline: np.ndarray  # datetime64[ns]
+    equity: np.ndarray
+    positions: DataFrame  # timeline x symbols
+    trades: DataFrame
+    stats: Dict[str, float] = field(default_factory=dict)
+
+
+def performance_stats(equity: np.ndarray, trade_pnl: np.ndarray, periods_per_year: int = 0, fees: float = 0.0) -> Dict[str, float]:
+    """
+    :param equity: equity curve
+    :param trade_pnl: realized pnl before fees of each fill closing quantity
+    :param periods_per_year: annualize sharpe ratio if provided, example 252 for daily bars
+    :param fees: total fees, already included in the equity curve
+    :return: total_pnl, return_pct, max_drawdown, max_drawdown_pct, sharpe, n_trades, win_rate, fees
+    """
+    equity = np.asarray(equity, dtype=float)
+    trade_pnl = np.asarray(trade_pnl, dtype=float)
+    if equity.size == 0:
+        return dict(total_pnl=0.0, return_pct=0.0, max_drawdown=0.0, max_drawdown_pct=0.0,
+                    sharpe=0.0, n_trades=0, win_rate=0.0, fees=float(fees))
+
+    peak = np.maximum.accumulate(equity)
+    drawdown = equity - peak
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown_pct = np.where(peak != 0, drawdown / peak, 0.0)
+        returns = np.diff(equity) / equity[:-1]
+    returns = returns[np.isfinite(returns)]
+    std = returns.std() if returns.size > 1 else 0.0
+    sharpe = returns.mean() / std if std > 0 else 0.0
+    if periods_per_year:
+        sharpe *= np.sqrt(periods_per_year)
+
+    return dict(
+        total_pnl=float(equity[-1] - equity[0]),
+        return_pct=float((equity[-1] - equity[0]) / equity[0]) if equity[0] else 0.0,
+        max_drawdown=float(drawdown.min()),
+        max_drawdown_pct=float(drawdown_pct.min()),
+        sharpe=float(sharpe),
+        n_trades=int(trade_pnl.size),
+        win_rate=float((trade_pnl > 0).mean()) if trade_pnl.size else 0.0,
+        fees=float(fees),
+    )
+
+
+# realized_pnl is net of the fee of the fill, closed_qty is the quantity of the fill reducing the position
+_TRADE_COLUMNS = ["trading_time", "symbol", "order_side", "qty", "price", "order_id", "realized_pnl", "closed_qty", "fee"]
+
+
+def _closed_qty(position: float, signed_qty: float) -> float:
+    if position == 0 or (position > 0) == (signed_qty > 0):
+        return 0.0
+    return min(abs(signed_qty), abs(position))
+
+
+def _trade_stats(equity: np.ndarray, trades: DataFrame, periods_per_year: int) -> Dict[str, float]:
+    # a trade is a fill closing quantity, opening fills only cost their fee
+    closing = trades[trades["closed_qty"] > 0]
+    trade_pnl = (closing["realized_pnl"] + closing["fee"]).to_numpy(dtype=float)
+    return performance_stats(equity, trade_pnl, periods_per_year, fees=float(trades["fee"].sum()))
+
+
+class _SymbolData:
+    def __init__(self, symbol: str, market: str, time, open_, high, low, close, volume):
+        time = np.asarray(time)
+        if time.dtype != np.int64:
+            time = time.astype("datetime64[ns]").astype(np.int64)
+        if time.size > 1 and not np.all(time[1:] >= time[:-1]):
+            order = np.argsort(time, kind="stable")
+            time, open_, high, low, close, volume = (
+                np.asarray(values)[order] for values in (time, open_, high, low, close, volume)
+            )
+        # sorted float64 arrays are used without copy, example views on shared memory
+        self.symbol = symbol
+        self.market = market
+        self.time = time
+        self.open = np.asarray(open_, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        self.low = np.asarray(low, dtype=float)
+        self.close = np.asarray(close, dtype=float)
+        self.volume = np.asarray(volume, dtype=float)
+
+        # sessions: reference price is the last close of the previous session
+        day = self.time.astype("datetime64[ns]").astype("datetime64[D]")
+        self.new_day = np.r_[True, day[1:] != day[:-1]]
+        self.last_of_day = np.r_[self.new_day[1:], True]
+        self.day_id = np.cumsum(self.new_day) - 1
+        self.day_end = np.flatnonzero(self.last_of_day)  # last bar index of each session
+        ref_per_day = np.r_[self.open[0], self.close[self.last_of_day][:-1]]
+        self.ref = ref_per_day[self.day_id]
+        self.floor, self.ceiling = price_band(self.ref, market)
+
+        # running session values for stream replay
+        frame = pd.DataFrame({"day": self.day_id, "high": self.high, "low": self.low, "volume": self.volume})
+        grouped = frame.groupby("day")
+        self.day_open = self.open[self.new_day][self.day_id]
+        self.day_high = grouped["high"].cummax().to_numpy()
+        self.day_low = grouped["low"].cummin().to_numpy()
+        self.day_volume = grouped["volume"].cumsum().to_numpy()
+
+    def __len__(self):
+        return self.time.size
+
+    def first_index(self, mask_fn: Callable[[int, int], np.ndarray], start: int, stop: int) -> int:
+        """
+        First bar index in [start, stop) where mask_fn is True, -1 if none
+        :param mask_fn: vectorized condition over the slice [s, e)
+        :param start:
+        :param stop:
+        :return:
+        """
+        chunk = _SEARCH_CHUNK
+        while start < stop:
+            end = min(stop, start + chunk)
+            hits = np.flatnonzero(mask_fn(start, end))
+            if hits.size:
+                return start + int(hits[0])
+            start = end
+            chunk *= 4
+        return -1
+
+
+class BacktestEngine:
+    def __init__(
+            self,
+            initial_cash: float = 1e9,
+            multiplier: float = 1.0,
+            margin_rate: float = 1.0,
+            fee_rate: float = 0.0,
+            market: str = SecurityMarket.DER
+    ):
+        """
+        :param initial_cash:
+        :param multiplier: contract multiplier, 1 for stocks, 100000 for VN30F
+        :param margin_rate: part of the position value locked from buying power, 1 for cash stocks
+        :param fee_rate: fee on traded value
+        :param market: default SecurityMarket of loaded symbols, used for tick size, lot size and price band
+        """
+        self.initial_cash = initial_cash
+        self.multiplier = multiplier
+        self.margin_rate = margin_rate
+        self.fee_rate = fee_rate
+        self.market = market
+
+        self._data: Dict[str, _SymbolData] = dict()
+        self._streams = []
+        self._reset()
+
+    def _reset(self):
+        self._timeline = np.empty(0, dtype=np.int64)
+        self._step = -1
+        self._now = np.iinfo(np.int64).min
+        self._ledger = Ledger(self.initial_cash, self.multiplier, self.margin_rate, self.fee_rate)
+        self._orders: Dict[str, CreatedOrder] = dict()
+        self._events = []
+        self._seq = itertools.count()
+        self._order_ids = itertools.count(1)
+        self._fills: List[Tuple] = []
+        self._changes: List[Tuple[int, str, float, float]] = []  # step, symbol, position delta, cash delta
+
+    # region load data
+    def load_arrays(self, symbol: str, time, open, high, low, close, volume, market: str = None):
+        """
+        Load OHLCV (or tick data with open=high=low=close) arrays of a symbol
+        """
+        self._data[symbol] = _SymbolData(symbol, market or self.market, time, open, high, low, close, volume)
+        return self
+
+    def load_dataframe(self, df: DataFrame, symbol: str = None, market: str = None):
+        """
+        :param df: columns trading_time, open, high, low, close, volume (and symbol if symbol is None)
+        :param symbol:
+        :param market:
+        :return:
+        """
+        groups = [(symbol, df)] if symbol is not None else df.groupby("symbol")
+        for name, frame in groups:
+            self.load_arrays(
+                name, pd.to_datetime(frame["trading_time"]).to_numpy(),
+                frame["open"].to_numpy(), frame["high"].to_numpy(), frame["low"].to_numpy(),
+                frame["close"].to_numpy(), frame["volume"].to_numpy(), market
+            )
+        return self
+
+    def load_ohlcv(self, records: List[OHLCV], market: str = None):
+        """
+        Load results of MarketDataService.daily_ohlcv or intraday_ohlcv
+        """
+        return self.load_dataframe(DataFrame(records), market=market)
+
+    def add_stream(self, stream):
+        self._streams.append(stream)
+        return self
+
+    def symbols(self) -> List[str]:
+        return list(self._data.keys())
+
+    def bars(self, symbol: str) -> _SymbolData:
+        return self._data[symbol]
+    # endregion
+
+    # region clock
+    def now(self) -> datetime.datetime:
+        return pd.Timestamp(self._now).to_pydatetime()
+
+    def current_index(self, symbol: str) -> int:
+        """
+        Index of the last bar of symbol at or before the current time, -1 if no bar yet
+        """
+        return int(np.searchsorted(self._data[symbol].time, self._now, side="right")) - 1
+
+    def last_price(self, symbol: str) -> float:
+        index = self.current_index(symbol)
+        return float(self._data[symbol].close[index]) if index >= 0 else 0.0
+    # endregion
+
+    # region orders
+    def submit(self, order: CreatedOrder, order_id: str = None) -> CreatedOrder:
+        """
+        Validate an order and schedule its fill from a vectorized search of the next bars
+        :param order:
+        :param order_id: keep an existing order id, used by modify
+        :return: a copy of the order with order id and status
+        """
+        order = copy.copy(order)
+        order.order_id = order_id or str(next(self._order_ids))
+        order.os_qty = order.order_qty
+        order.filled_qty = 0
+        self._orders[order.order_id] = order
+
+        data = self._data.get(order.symbol)
+        if data is None:
+            return self._reject(order)
+        start = int(np.searchsorted(data.time, self._now, side="right"))
+        if start >= len(data):
+            return self._reject(order)
+
+        market = data.market
+        if order.order_qty <= 0 or order.order_qty % lot_size(market) != 0:
+            return self._reject(order)
+        # day orders, session of the next bar
+        stop = int(data.day_end[data.day_id[start]]) + 1
+
+        if order.order_type == OrderType.LIMIT:
+            price = order.order_price
+            floor, ceiling = data.floor[start], data.ceiling[start]
+            ticks = tick_size(price, market)
+            if not floor <= price <= ceiling or abs(price / ticks - round(price / ticks)) > 1e-6:
+                return self._reject(order)
+            if order.order_side == OrderSide.BUY:
+                index = data.first_index(lambda s, e: (data.low[s:e] <= price) & (data.volume[s:e] > 0), start, stop)
+                fill_price = min(price, data.open[index]) if index >= 0 else 0.0
+            else:
+                index = data.first_index(lambda s, e: (data.high[s:e] >= price) & (data.volume[s:e] > 0), start, stop)
+                fill_price = max(price, data.open[index]) if index >= 0 else 0.0
+        elif order.order_type == OrderType.ATO:
+            index = data.first_index(lambda s, e: data.new_day[s:e], start, len(data))
+            fill_price = data.open[index] if index >= 0 else 0.0
+        elif order.order_type == OrderType.ATC:
+            index = data.first_index(lambda s, e: data.last_of_day[s:e], start, stop)
+            fill_price = data.close[index] if index >= 0 else 0.0
+        else:
+            # market order, filled at the open of the next traded bar
+            index = data.first_index(lambda s, e: data.volume[s:e] > 0, start, stop)
+            fill_price = data.open[index] if index >= 0 else 0.0
+
+        order.order_status = OrderStatus._QUEUE_IN_EXCH
+        if index >= 0:
+            self._push(data.time[index], _EVENT_FILL, order, float(fill_price))
+        else:
+            self._push(data.time[stop - 1], _EVENT_EXPIRE, order, 0.0)
+        return order
+
+    def cancel(self, order_id: str) -> Union[CreatedOrder, None]:
+        order = self._orders.get(order_id)
+        if order is None or order.order_status not in OrderStatus.WORKING_ORDERS:
+            return None
+        # the scheduled fill is skipped when it is popped
+        order.order_status = OrderStatus._CANCELLED
+        return order
+
+    def modify(self, order_id: str, new_qty: int = 0, new_price: float = 0) -> Union[CreatedOrder, None]:
+        order = self.cancel(order_id)
+        if order is None:
+            return None
+        new_order = copy.copy(order)
+        new_order.order_qty = new_qty or order.order_qty
+        new_order.order_price = new_price or order.order_price
+        return self.submit(new_order, order_id)
+
+    def orders(self) -> List[CreatedOrder]:
+        return list(self._orders.values())
+
+    def _reject(self, order: CreatedOrder) -> CreatedOrder:
+        order.order_status = OrderStatus._REJECTED
+        return order
+
+    def _push(self, time: int, kind: int, order: CreatedOrder, price: float):
+        heapq.heappush(self._events, (int(time), kind, next(self._seq), order, price))
+
+    def _process_events(self, now: int):
+        while self._events and self._events[0][0] <= now:
+            _, kind, _, order, price = heapq.heappop(self._events)
+            # cancelled or replaced orders are skipped
+            if order.order_status != OrderStatus._QUEUE_IN_EXCH:
+                continue
+            if kind == _EVENT_EXPIRE:
+                order.order_status = OrderStatus._EXPIRED
+            else:
+                self._fill(order, price)
+
+    def _fill(self, order: CreatedOrder, price: float):
+        qty = order.os_qty
+        signed_qty = qty if order.order_side == OrderSide.BUY else -qty
+        closed = _closed_qty(self._ledger.position(order.symbol), signed_qty)
+        realized, cash_delta = self._ledger.apply_fill(order.symbol, order.order_side, qty, price)
+        fee = qty * price * self._ledger.multiplier * self._ledger.fee_rate
+        self._changes.append((self._step, order.symbol, signed_qty, cash_delta))
+        self._fills.append((self._now, order.symbol, order.order_side, qty, price, order.order_id, realized, closed, fee))
+
+        order.filled_qty = order.order_qty
+        order.os_qty = 0
+        order.avg_price = price
+        order.order_status = OrderStatus._FULLY_FILLED
+    # endregion
+
+    # region account
+    def cash(self) -> float:
+        return self._ledger.cash
+
+    def position(self, symbol: str) -> float:
+        return self._ledger.position(symbol)
+
+    def positions(self) -> Dict[str, float]:
+        return self._ledger.positions()
+
+    def avg_price(self, symbol: str) -> float:
+        return self._ledger.avg_price(symbol)
+
+    def realized_pnl(self, symbol: str = None) -> float:
+        return self._ledger.realized_pnl(symbol)
+
+    def floating_pnl(self, symbol: str = None) -> float:
+        return self._ledger.floating_pnl(self.last_price, symbol)
+
+    def equity(self) -> float:
+        return self._ledger.equity(self.last_price)
+
+    def margin_used(self) -> float:
+        return self._ledger.margin_used(self.last_price)
+
+    def buying_power(self) -> float:
+        return self._ledger.buying_power(self.last_price)
+    # endregion
+
+    # region run
+    def _build_timeline(self):
+        if len(self._data) == 0:
+            raise ValueError("No data is loaded.")
+        self._timeline = np.unique(np.concatenate([data.time for data in self._data.values()]))
+
+    def run(self, on_bar: Callable[["BacktestEngine"], None] = None, periods_per_year: int = 0) -> BacktestResult:
+        """
+        Replay all bars in time order: process scheduled fills, update attached streams, then call on_bar
+        :param on_bar: strategy callback, called once per timestamp
+        :param periods_per_year: annualize sharpe ratio
+        :return:
+        """
+        self._reset()
+        self._build_timeline()
+        symbols = self.symbols()
+        # bar index of every symbol at each timestamp, -1 if no bar at this timestamp
+        bar_indexes = np.full((self._timeline.size, len(symbols)), -1, dtype=np.int64)
+        for j, symbol in enumerate(symbols):
+            data = self._data[symbol]
+            bar_indexes[np.searchsorted(self._timeline, data.time), j] = np.arange(len(data))
+
+        for step, now in enumerate(self._timeline):
+            self._step = step
+            self._now = int(now)
+            self._process_events(self._now)
+            if self._streams:
+                for j in np.flatnonzero(bar_indexes[step] >= 0):
+                    for stream in self._streams:
+                        stream.replay(symbols[j], int(bar_indexes[step, j]))
+            if on_bar is not None:
+                on_bar(self)
+
+        return self.result(periods_per_year)
+
+    def result(self, periods_per_year: int = 0) -> BacktestResult:
+        """
+        Build equity curve and positions from recorded fills, all in vectorized operations
+        """
+        symbols = self.symbols()
+        n_steps = self._timeline.size
+        columns = {symbol: j for j, symbol in enumerate(symbols)}
+        position_deltas = np.zeros((n_steps, len(symbols)))
+        cash_deltas = np.zeros(n_steps)
+        if self._changes:
+            steps, names, qtys, cash = zip(*self._changes)
+            np.add.at(position_deltas, (np.asarray(steps), np.asarray([columns[name] for name in names])), qtys)
+            np.add.at(cash_deltas, np.asarray(steps), cash)
+        positions = np.cumsum(position_deltas, axis=0)
+        cash = self.initial_cash + np.cumsum(cash_deltas)
+
+        closes = np.zeros((n_steps, len(symbols)))
+        for j, symbol in enumerate(symbols):
+            data = self._data[symbol]
+            index = np.searchsorted(data.time, self._timeline, side="right") - 1
+            closes[:, j] = np.where(index >= 0, data.close[np.maximum(index, 0)], 0.0)
+        equity = cash + (positions * closes).sum(axis=1) * self.multiplier
+
+        trades = DataFrame(self._fills, columns=_TRADE_COLUMNS)
+        trades["trading_time"] = pd.to_datetime(trades["trading_time"])
+        timeline = self._timeline.astype("datetime64[ns]")
+        return BacktestResult(
+            timeline=timeline,
+            equity=equity,
+            positions=DataFrame(positions, index=timeline, columns=symbols),
+            trades=trades,
+            stats=_trade_stats(equity, trades, periods_per_year)
+        )
+
+    def run_signals(self, symbol: str, target_positions, periods_per_year: int = 0) -> BacktestResult:
+        """
+        Fully vectorized backtest of a target position per bar, the change of target is traded at the next bar open.
+        Orders are not validated against bands and lots, use run for order level simulation.
+        :param symbol:
+        :param target_positions: array with one target position per bar of symbol
+        :param periods_per_year:
+        :return:
+        """
+        data = self._data[symbol]
+        target = np.asarray(target_positions, dtype=float)
+        if target.size != len(data):
+            raise ValueError(f"Expected {len(data)} target positions, got {target.size}.")
+
+        # position held during bar i is the target decided at bar i - 1
+        positions = np.r_[0.0, target[:-1]]
+        trades = np.diff(np.r_[0.0, positions])
+        traded_value = trades * data.open * self.multiplier
+        fees = np.abs(traded_value) * self.fee_rate
+        cash = self.initial_cash - np.cumsum(traded_value + fees)
+        equity = cash + positions * data.close * self.multiplier
+
+        # realized pnl of each reduction of the position, with average cost accounting
+        trade_index = np.flatnonzero(trades)
+        fills = []
+        position, avg_price = 0.0, 0.0
+        for i in trade_index:
+            qty, price = trades[i], data.open[i]
+            realized = 0.0
+            if position == 0 or np.sign(position) == np.sign(qty):
+                avg_price = (avg_price * abs(position) + price * abs(qty)) / (abs(position) + abs(qty))
+            else:
+                closed = min(abs(qty), abs(position))
+                realized = float(closed * (price - avg_price) * np.sign(position) * self.multiplier)
+                if abs(qty) > abs(position):
+                    avg_price = price
+                elif abs(qty) == abs(position):
+                    avg_price = 0.0
+            closed = _closed_qty(position, qty)
+            position += qty
+            fills.append((data.time[i], symbol, OrderSide.BUY if qty > 0 else OrderSide.SELL, abs(qty), price, "",
+                          realized - fees[i], closed, fees[i]))
+
+        trades_df = DataFrame(fills, columns=_TRADE_COLUMNS)
+        trades_df["trading_time"] = pd.to_datetime(trades_df["trading_time"])
+        timeline = data.time.astype("datetime64[ns]")
+        return BacktestResult(
+            timeline=timeline,
+            equity=equity,
+            positions=DataFrame({symbol: positions}, index=timeline),
+            trades=trades_df,
+            stats=_trade_stats(equity, trades_df, periods_per_year)
+        )
+    # endregion
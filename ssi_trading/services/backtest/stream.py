@@ -0,0 +1,90 @@
+# Description: Backtest data stream, replays engine bars through the BaseDataStream interface.
+import logging
+from typing import Dict, List
+
+import pandas as pd
+from pandas import DataFrame
+
+from ssi_trading.config import DataServiceConfig
+from ssi_trading.models.data import CurrentMarket, CurrentBar
+from ssi_trading.models.definitions import DataChannel
+from ssi_trading.services.backtest import BacktestEngine
+from ssi_trading.services.stream import BaseDataStream
+
+
+class BacktestDataStream(BaseDataStream):
+    def __init__(self, engine: BacktestEngine, channel_name: str = DataChannel.MARKET_DATA, symbols: List[str] = None):
+        """
+        :param engine: BacktestEngine, the stream is updated on each replayed bar
+        :param channel_name: DataChannel.MARKET_DATA (CurrentMarket) or DataChannel.BAR_DATA (CurrentBar)
+        :param symbols: default all symbols loaded in the engine
+        """
+        if channel_name not in (DataChannel.MARKET_DATA, DataChannel.BAR_DATA):
+            raise ValueError(f"Channel {channel_name} is not supported by backtest stream.")
+        self._channel_name = channel_name
+        symbols = symbols or engine.symbols()
+        super().__init__(DataServiceConfig("backtest", "backtest", symbols), symbols, channel_name)
+        self._engine = engine
+        self._index: Dict[str, int] = {symbol: -1 for symbol in self._names}
+        engine.add_stream(self)
+
+    def create_instance(self):
+        return CurrentMarket() if self._channel_name == DataChannel.MARKET_DATA else CurrentBar()
+
+    def replay(self, symbol: str, index: int):
+        if symbol not in self._index:
+            return
+        self._index[symbol] = index
+        bars = self._engine.bars(symbol)
+        trading_time = pd.Timestamp(int(bars.time[index])).strftime("%H:%M:%S")
+        if self.channel_name == DataChannel.MARKET_DATA:
+            close = bars.close[index]
+            self._current[symbol] = CurrentMarket(
+                trading_time=trading_time,
+                symbol=symbol,
+                current_price=close,
+                current_volume=bars.volume[index],
+                total_volume=bars.day_volume[index],
+                price_change=close - bars.ref[index],
+                change_percent=round((close - bars.ref[index]) / bars.ref[index] * 100, 2) if bars.ref[index] else 0.0,
+                ref_price=bars.ref[index],
+                ceiling_price=bars.ceiling[index],
+                floor_price=bars.floor[index],
+                open_price=bars.day_open[index],
+                high_price=bars.day_high[index],
+                low_price=bars.day_low[index],
+                bid_price_01=close,
+                ask_price_01=close,
+            )
+        else:
+            self._current[symbol] = CurrentBar(
+                symbol=symbol,
+                trading_time=trading_time,
+                open=bars.open[index],
+                high=bars.high[index],
+                low=bars.low[index],
+                close=bars.close[index],
+                volume=bars.volume[index],
+            )
+        self._notify(symbol, self._current[symbol])
+
+    def get_dataframe(self, symbol) -> DataFrame:
+        # bars up to the replayed bar, sliced from the engine arrays
+        index = self._index.get(symbol, -1)
+        if index < 0:
+            return DataFrame()
+        bars = self._engine.bars(symbol)
+        end = index + 1
+        return DataFrame({
+            "trading_time": pd.to_datetime(bars.time[:end]),
+            "symbol": symbol,
+            "open": bars.open[:end],
+            "high": bars.high[:end],
+            "low": bars.low[:end],
+            "close": bars.close[:end],
+            "volume": bars.volume[:end],
+        })
+
+    def start_stream(self):
+        logging.info(f"Backtest stream {self.channel_name} is replayed by the engine.")
+        return self
@@ -0,0 +1,128 @@
+# Description: Parallel parameter sweep over a process pool.
+# History is copied once into shared memory, workers attach to it without copying and build one engine
+# per process, then each task only runs a vectorized backtest of one parameter set on one symbol.
+import itertools
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Tuple, Union, Any
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from ssi_trading.services.backtest import BacktestEngine
+
+_VALUE_FIELDS = ("open", "high", "low", "close", "volume")
+
+# worker process state, set by _init_worker
+_worker_engine: Union[BacktestEngine, None] = None
+_worker_signal_fn = None
+_worker_shms: List[shared_memory.SharedMemory] = []
+
+
+def _init_worker(layout: Dict[str, Tuple[int, int, str]], time_name: str, value_name: str, total: int,
+                 engine_kwargs: Dict[str, Any], signal_fn):
+    global _worker_engine, _worker_signal_fn, _worker_shms
+    # pool workers share the resource tracker of the parent, which owns and unlinks the segments
+    time_shm = shared_memory.SharedMemory(name=time_name)
+    value_shm = shared_memory.SharedMemory(name=value_name)
+    _worker_shms = [time_shm, value_shm]
+    times = np.ndarray((total,), dtype=np.int64, buffer=time_shm.buf)
+    values = np.ndarray((len(_VALUE_FIELDS), total), dtype=np.float64, buffer=value_shm.buf)
+
+    _worker_engine = BacktestEngine(**engine_kwargs)
+    for symbol, (start, end, market) in layout.items():
+        _worker_engine.load_arrays(symbol, times[start:end], *values[:, start:end], market=market)
+    _worker_signal_fn = signal_fn
+
+
+def _run_task(task: Tuple[str, Dict[str, Any], int]) -> Dict[str, Any]:
+    symbol, params, periods_per_year = task
+    row = dict(symbol=symbol, **params)
+    try:
+        bars = _worker_engine.bars(symbol)
+        target = _worker_signal_fn(params, bars)
+        row.update(_worker_engine.run_signals(symbol, target, periods_per_year).stats)
+        row["error"] = None
+    except Exception as ex:
+        row["error"] = repr(ex)
+    return row
+
+
+class ParameterSweep:
+    def __init__(
+            self,
+            signal_fn: Callable[[Dict[str, Any], Any], np.ndarray],
+            engine_kwargs: Dict[str, Any] = None,
+            max_workers: int = None,
+            periods_per_year: int = 0
+    ):
+        """
+        :param signal_fn: module level function (params, bars) -> target position per bar,
+            bars has numpy arrays time, open, high, low, close, volume, ref, ceiling, floor
+        :param engine_kwargs: BacktestEngine arguments: initial_cash, multiplier, fee_rate, etc.
+        :param max_workers: default os.cpu_count()
+        :param periods_per_year: annualize sharpe ratio
+        """
+        self._signal_fn = signal_fn
+        self._engine_kwargs = engine_kwargs or dict()
+        self._max_workers = max_workers or os.cpu_count()
+        self._periods_per_year = periods_per_year
+
+    @staticmethod
+    def grid(**params: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Cartesian product of parameter values, example grid(fast=[5, 10], slow=[20, 50])
+        """
+        names = list(params.keys())
+        return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+    def run(self, data: Dict[str, DataFrame], param_sets: List[Dict[str, Any]], market: str = None) -> DataFrame:
+        """
+        :param data: symbol -> DataFrame with columns trading_time, open, high, low, close, volume
+        :param param_sets: list of parameter dicts, see grid
+        :param market: SecurityMarket of all symbols, default engine market
+        :return: one row per (symbol, parameter set) with pnl, drawdown, fees and trade statistics,
+            n_trades and win_rate count the fills closing quantity with their pnl before fees
+        """
+        market = market or self._engine_kwargs.get("market")
+        symbols = list(data.keys())
+        sizes = [len(data[symbol]) for symbol in symbols]
+        total = int(sum(sizes))
+        if total == 0:
+            raise ValueError("No history to sweep.")
+
+        time_shm = shared_memory.SharedMemory(create=True, size=total * 8)
+        value_shm = shared_memory.SharedMemory(create=True, size=total * 8 * len(_VALUE_FIELDS))
+        try:
+            times = np.ndarray((total,), dtype=np.int64, buffer=time_shm.buf)
+            values = np.ndarray((len(_VALUE_FIELDS), total), dtype=np.float64, buffer=value_shm.buf)
+            layout = dict()
+            start = 0
+            for symbol, size in zip(symbols, sizes):
+                frame = data[symbol].sort_values("trading_time")
+                end = start + size
+                times[start:end] = pd.to_datetime(frame["trading_time"]).to_numpy().astype("datetime64[ns]").astype(np.int64)
+                for i, name in enumerate(_VALUE_FIELDS):
+                    values[i, start:end] = frame[name].to_numpy(dtype=float)
+                layout[symbol] = (start, end, market)
+                start = end
+            del times, values
+
+            tasks = [(symbol, params, self._periods_per_year) for symbol in symbols for params in param_sets]
+            logging.info(f"Sweep {len(tasks)} tasks on {self._max_workers} workers")
+            with ProcessPoolExecutor(
+                    max_workers=self._max_workers,
+                    initializer=_init_worker,
+                    initargs=(layout, time_shm.name, value_shm.name, total, self._engine_kwargs, self._signal_fn)
+            ) as executor:
+                chunksize = max(1, len(tasks) // (self._max_workers * 4))
+                rows = list(executor.map(_run_task, tasks, chunksize=chunksize))
+        finally:
+            for shm in (time_shm, value_shm):
+                shm.close()
+                shm.unlink()
+
+        return DataFrame(rows)
@@ -0,0 +1,119 @@
+# Description: Backtest trading service, drop-in replacement of the live and paper trading services.
+import copy
+from typing import Union, Dict, List
+
+from ssi_trading.config import TradingServiceConfig
+from ssi_trading.models.definitions import TradingMarket, OrderSide, OrderStatus
+from ssi_trading.models.trading import CreatedOrder, AccountBalance, StockPosition, MaxBuySellQty
+from ssi_trading.services.backtest import BacktestEngine
+from ssi_trading.services.client import BaseTradingService
+
+
+class BacktestTradingService(BaseTradingService):
+    def __init__(self, engine: BacktestEngine, account_id: str = "BACKTEST", account_type: str = "future"):
+        # paper trading config, the service never calls the network
+        super().__init__(TradingServiceConfig(
+            consumer_id="backtest",
+            consumer_secret="backtest",
+            account_id=account_id,
+            account_type=account_type,
+            paper_trading=True
+        ))
+        self._engine = engine
+        self._market_id = TradingMarket.FUTURE if account_type == "future" else TradingMarket.STOCK
+
+    def create_order(self, order: CreatedOrder) -> Union[CreatedOrder, None]:
+        order.market_id = self._market_id
+        order.account_id = self.account_id
+        created = self._engine.submit(order)
+        order.order_id = created.order_id
+        order.order_status = created.order_status
+        return order if created.order_status not in OrderStatus.REJECT_ORDERS else None
+
+    def cancel_order(self, order) -> Union[CreatedOrder, None]:
+        cancelled = self._engine.cancel(order.order_id)
+        if cancelled is None:
+            return None
+        order.order_status = cancelled.order_status
+        return order
+
+    def modify_order(self, order: CreatedOrder, new_qty: int = 0, new_price: float = 0) -> Union[CreatedOrder, None]:
+        modified = self._engine.modify(order.order_id, new_qty, new_price)
+        if modified is None or modified.order_status in OrderStatus.REJECT_ORDERS:
+            return None
+        order.order_qty = modified.order_qty
+        order.order_price = modified.order_price
+        order.order_status = modified.order_status
+        return order
+
+    def account_balance(self) -> Union[AccountBalance, None]:
+        engine = self._engine
+        trading_pl = engine.realized_pnl()
+        floating_pl = engine.floating_pnl()
+        return AccountBalance(
+            account_id=self.account_id,
+            market_id=self._market_id,
+            balance=engine.cash(),
+            trading_pl=trading_pl,
+            floating_pl=floating_pl,
+            total_pl=trading_pl + floating_pl,
+            ee=engine.buying_power(),
+            nav=engine.equity(),
+            withdrawable=max(0.0, engine.buying_power()),
+            fee=0,
+            interest=0,
+            commission=0
+        )
+
+    def max_buy_sell_qty(self, symbol, price, order_side) -> Union[MaxBuySellQty, None]:
+        engine = self._engine
+        price = price or engine.last_price(symbol)
+        if not price:
+            return None
+        power = engine.buying_power()
+        max_qty = int(max(0.0, power) // (price * engine.multiplier * engine.margin_rate))
+        if order_side == OrderSide.SELL and self._market_id == TradingMarket.STOCK:
+            max_qty = int(max(0.0, engine.position(symbol)))
+        return MaxBuySellQty(
+            account_id=self.account_id,
+            market_id=self._market_id,
+            symbol=symbol,
+            max_qty=max_qty,
+            power=power
+        )
+
+    def _position(self, symbol: str) -> StockPosition:
+        engine = self._engine
+        return StockPosition(
+            account_id=self.account_id,
+            market_id=self._market_id,
+            symbol=symbol,
+            position=engine.position(symbol),
+            trading_pl=engine.realized_pnl(symbol),
+            floating_pl=engine.floating_pnl(symbol),
+            market_price=engine.last_price(symbol),
+            avg_price=engine.avg_price(symbol)
+        )
+
+    def current_positions(self) -> Union[Dict[str, StockPosition], None]:
+        return {
+            symbol: self._position(symbol)
+            for symbol, position in self._engine.positions().items() if position != 0
+        }
+
+    def closed_positions(self) -> Union[Dict[str, StockPosition], None]:
+        return {
+            symbol: self._position(symbol)
+            for symbol, position in self._engine.positions().items() if position == 0
+        }
+
+    def order_history(self, order_status=None, start_date=None, end_date=None, page=1, page_size=50) -> Union[List[CreatedOrder], None]:
+        statuses = set(order_status.split(",")) if order_status else None
+        orders = [
+            copy.copy(order) for order in self._engine.orders()
+            if statuses is None or order.order_status in statuses
+        ]
+        for order in orders:
+            order.account_id = self.account_id
+            order.market_id = self._market_id
+        return orders
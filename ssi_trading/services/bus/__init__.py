@@ -0,0 +1,260 @@
+# Description: Shared memory market data bus.
+# One ingestion process owns the SSI connection and publishes every tick of its data streams into a named
+# shared memory segment per channel, strategy processes on the same host read it without network or pickling.
+#
+# Segment layout, all arrays are numpy views over the segment:
+#   header    | magic, version, n_symbols, capacity, record size
+#   symbols   | n_symbols x S16
+#   latest    | n_symbols x record, record starts with a seqlock counter
+#   counts    | n_symbols x uint64, ticks written per symbol
+#   ring      | n_symbols x capacity x record, last ticks of each symbol
+#
+# Latest records are guarded by a seqlock: the writer makes the counter odd, writes the record then makes it even,
+# a reader retries while the counter is odd or changed during its copy. Ring slots are published by the count.
+import dataclasses
+import logging
+from multiprocessing import shared_memory
+from typing import Dict, List, Union, Type
+
+import numpy as np
+from pandas import DataFrame
+
+from ssi_trading.config import BUS_NAME_PREFIX, BUS_RING_CAPACITY
+from ssi_trading.models.data import CurrentMarket, CurrentBar, CurrentIndex, CurrentForeignRoom
+from ssi_trading.models.definitions import DataChannel
+
+_MAGIC = 0x53534942  # SSIB
+_VERSION = 1
+_HEADER_DTYPE = np.dtype([
+    ("magic", "u4"), ("version", "u4"), ("n_symbols", "u4"), ("capacity", "u4"), ("record_size", "u4"),
+])
+_HEADER_SIZE = 64
+_SYMBOL_DTYPE = np.dtype("S16")
+_MAX_READ_RETRIES = 1000
+
+RECORD_TYPES: Dict[str, Type] = {
+    DataChannel.MARKET_DATA: CurrentMarket,
+    DataChannel.BAR_DATA: CurrentBar,
+    DataChannel.INDEX_DATA: CurrentIndex,
+    DataChannel.FR_ROOM_DATA: CurrentForeignRoom,
+}
+
+
+def record_dtype(record_type: Type) -> np.dtype:
+    """
+    Fixed size numpy record of a dataclass: float fields as float64, str fields as 16 bytes
+    :param record_type:
+    :return:
+    """
+    fields = [("seq", "u8")]
+    for f in dataclasses.fields(record_type):
+        fields.append((f.name, "f8" if f.type is float else "S16"))
+    return np.dtype(fields)
+
+
+def to_instance(record_type: Type, record: np.void):
+    """
+    Dataclass instance of a numpy record built by record_dtype
+    :param record_type:
+    :param record:
+    :return:
+    """
+    return record_type(**{
+        f.name: record[f.name].decode() if f.type is not float else float(record[f.name])
+        for f in dataclasses.fields(record_type)
+    })
+
+
+def _segment_name(prefix: str, channel: str) -> str:
+    return f"{prefix}_{channel}"
+
+
+class _Layout:
+    def __init__(self, buf, n_symbols: int, capacity: int, dtype: np.dtype):
+        offset = _HEADER_SIZE
+        self.header = np.ndarray((1,), _HEADER_DTYPE, buf, 0)
+        self.symbols = np.ndarray((n_symbols,), _SYMBOL_DTYPE, buf, offset)
+        offset += n_symbols * _SYMBOL_DTYPE.itemsize
+        self.latest = np.ndarray((n_symbols,), dtype, buf, offset)
+        offset += n_symbols * dtype.itemsize
+        self.counts = np.ndarray((n_symbols,), np.uint64, buf, offset)
+        offset += n_symbols * 8
+        self.ring = np.ndarray((n_symbols, capacity), dtype, buf, offset)
+
+    @staticmethod
+    def size(n_symbols: int, capacity: int, dtype: np.dtype) -> int:
+        return _HEADER_SIZE + n_symbols * (_SYMBOL_DTYPE.itemsize + dtype.itemsize + 8 + capacity * dtype.itemsize)
+
+
+class BusPublisher:
+    def __init__(self, stream, prefix: str = BUS_NAME_PREFIX, capacity: int = BUS_RING_CAPACITY):
+        """
+        Publish every tick of a data stream to a shared memory segment, the publisher owns the segment
+        :param stream: BaseDataStream, usually a live MarketDataStream
+        :param prefix: segment name prefix, readers must use the same prefix
+        :param capacity: ticks kept per symbol
+        """
+        self.channel = stream.channel_name
+        self.record_type = RECORD_TYPES[self.channel]
+        self.dtype = record_dtype(self.record_type)
+        self.name = _segment_name(prefix, self.channel)
+        self._symbols: List[str] = list(stream._names)
+        self._slots: Dict[str, int] = {symbol: i for i, symbol in enumerate(self._symbols)}
+        self._fields = [name for name in self.dtype.names if name != "seq"]
+
+        size = _Layout.size(len(self._symbols), capacity, self.dtype)
+        try:
+            self._shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        except FileExistsError:
+            # segment left by a crashed publisher
+            logging.warning(f"Shared memory {self.name} already exists, it is replaced.")
+            stale = shared_memory.SharedMemory(self.name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+
+        self._layout = _Layout(self._shm.buf, len(self._symbols), capacity, self.dtype)
+        self._layout.symbols[:] = [symbol.encode() for symbol in self._symbols]
+        self._layout.counts[:] = 0
+        self._capacity = capacity
+        header = self._layout.header[0]
+        header["n_symbols"], header["capacity"], header["record_size"] = len(self._symbols), capacity, self.dtype.itemsize
+        header["version"] = _VERSION
+        # readers check the magic last
+        header["magic"] = _MAGIC
+
+        self._stream = stream
+        stream.add_listener(self.publish)
+        logging.info(f"Publish channel {self.channel} of {len(self._symbols)} symbols to shared memory {self.name}")
+
+    def publish(self, symbol: str, current):
+        slot = self._slots.get(symbol)
+        if slot is None:
+            return
+        layout = self._layout
+        latest = layout.latest
+        seq = int(latest[slot]["seq"])
+        latest[slot]["seq"] = seq + 1
+        # the record is written at once, only the counter is written separately
+        latest[slot] = (seq + 1,) + tuple(getattr(current, name) for name in self._fields)
+        latest[slot]["seq"] = seq + 2
+
+        count = int(layout.counts[slot])
+        layout.ring[slot, count % self._capacity] = layout.latest[slot]
+        layout.counts[slot] = count + 1
+
+    def close(self):
+        self._stream.remove_listener(self.publish)
+        self._layout = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+class BusReader:
+    def __init__(self, channel: str = DataChannel.MARKET_DATA, prefix: str = BUS_NAME_PREFIX):
+        """
+        Read the latest state and the last ticks of a channel published by a BusPublisher of another process,
+        the reader has the get_current and get_dataframe methods of the data streams
+        :param channel: DataChannel
+        :param prefix: segment name prefix of the publisher
+        """
+        self.channel = channel
+        self.record_type = RECORD_TYPES[channel]
+        self.dtype = record_dtype(self.record_type)
+        self.name = _segment_name(prefix, channel)
+        self._shm = self._attach(self.name)
+
+        header = np.ndarray((1,), _HEADER_DTYPE, self._shm.buf, 0)[0]
+        if header["magic"] != _MAGIC or header["version"] != _VERSION or header["record_size"] != self.dtype.itemsize:
+            self._shm.close()
+            raise ValueError(f"Shared memory {self.name} is not a {channel} bus segment of version {_VERSION}.")
+        self._capacity = int(header["capacity"])
+        self._layout = _Layout(self._shm.buf, int(header["n_symbols"]), self._capacity, self.dtype)
+        self._slots: Dict[str, int] = {symbol.decode(): i for i, symbol in enumerate(self._layout.symbols)}
+        self._fields = [name for name in self.dtype.names if name != "seq"]
+
+    @staticmethod
+    def _attach(name: str) -> shared_memory.SharedMemory:
+        try:
+            # python 3.13+
+            return shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name)
+            # the segment belongs to the publisher, the resource tracker of the reader must not unlink it on exit
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception as ex:
+                logging.debug(f"Unable to unregister shared memory {name}: {ex}")
+            return shm
+
+    def symbols(self) -> List[str]:
+        return list(self._slots.keys())
+
+    def latest_view(self) -> np.ndarray:
+        """
+        Zero copy view of the latest records of all symbols, records may be torn while the publisher writes them
+        :return:
+        """
+        return self._layout.latest
+
+    def latest_record(self, symbol: str) -> Union[np.void, None]:
+        """
+        Consistent copy of the latest record of a symbol
+        :param symbol:
+        :return: numpy record, None if the symbol is not published
+        """
+        slot = self._slots.get(symbol)
+        if slot is None:
+            return None
+        latest = self._layout.latest
+        for _ in range(_MAX_READ_RETRIES):
+            seq = latest[slot]["seq"]
+            if seq & 1:
+                continue
+            record = latest[slot].copy()
+            if latest[slot]["seq"] == seq:
+                return record
+        logging.warning(f"Unable to read a consistent record of {symbol} from {self.name}.")
+        return None
+
+    def get_current(self, symbol):
+        record = self.latest_record(symbol)
+        if record is None or record["seq"] == 0:
+            return None
+        return to_instance(self.record_type, record)
+
+    def ticks(self, symbol: str, n: int = None) -> np.ndarray:
+        """
+        Last ticks of a symbol, oldest first
+        :param symbol:
+        :param n: default all ticks kept in the ring but the slot written next
+        :return: numpy structured array
+        """
+        slot = self._slots.get(symbol)
+        if slot is None:
+            return np.empty(0, self.dtype)
+        counts = self._layout.counts
+        ring = self._layout.ring[slot]
+        # the count is the seqlock of the ring, the copy is retried when a copied slot was written meanwhile
+        for _ in range(_MAX_READ_RETRIES):
+            end = int(counts[slot])
+            start = max(0, end - self._capacity + 1, end - n if n is not None else 0)
+            records = ring[np.arange(start, end) % self._capacity]
+            if int(counts[slot]) - self._capacity < start:
+                return records
+        logging.warning(f"Unable to read consistent ticks of {symbol} from {self.name}.")
+        return np.empty(0, self.dtype)
+
+    def get_dataframe(self, symbol) -> DataFrame:
+        records = self.ticks(symbol)
+        if len(records) == 0:
+            return DataFrame()
+        return DataFrame({
+            name: np.char.decode(records[name]) if records.dtype[name].kind == "S" else records[name]
+            for name in self._fields
+        })
+
+    def close(self):
+        self._layout = None
+        self._shm.close()
@@ -0,0 +1,329 @@
+# Description: Local pub/sub gateway of the stream data.
+# Decoded ticks of the data streams are encoded once and published on per topic channels "<channel>/<symbol>",
+# ex: "X/VN30F2407", "B/HPG", subscribers filter topics by prefix.
+# Transports: a Unix domain socket server (standard library) or a ZeroMQ PUB socket (pip install ssi_trading[gateway]).
+# Ingestion never waits on a subscriber: each subscriber of the Unix socket has its own outbox and sender thread,
+# a conflating outbox keeps only the latest record of each topic, a queued outbox drops the oldest records when full.
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+from collections import deque
+from typing import Dict, List, Tuple, Union, Iterator
+
+import numpy as np
+
+from ssi_trading.config import GATEWAY_SOCKET_PATH, GATEWAY_ZMQ_ENDPOINT, GATEWAY_QUEUE_SIZE
+from ssi_trading.services.bus import RECORD_TYPES, record_dtype, to_instance
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+# topic length, payload length
+_FRAME_HEADER = struct.Struct(">HI")
+
+
+class RecordCodec:
+    def __init__(self, codec: str = "struct"):
+        """
+        :param codec: struct, fixed size numpy records of the shared memory bus, or msgpack, list of field values
+        """
+        if codec not in ("struct", "msgpack"):
+            raise ValueError(f"Codec {codec} is not supported.")
+        if codec == "msgpack" and msgpack is None:
+            raise ImportError("msgpack is required for the msgpack codec: pip install ssi_trading[gateway]")
+        self.codec = codec
+        self._dtypes = {channel: record_dtype(record_type) for channel, record_type in RECORD_TYPES.items()}
+        self._fields = {channel: dtype.names[1:] for channel, dtype in self._dtypes.items()}
+
+    def encode(self, channel: str, current) -> bytes:
+        values = tuple(getattr(current, name) for name in self._fields[channel])
+        if self.codec == "msgpack":
+            return msgpack.packb(values)
+        return np.array([(0,) + values], dtype=self._dtypes[channel]).tobytes()
+
+    def decode(self, channel: str, payload: bytes):
+        record_type = RECORD_TYPES[channel]
+        if self.codec == "msgpack":
+            return record_type(*msgpack.unpackb(payload))
+        return to_instance(record_type, np.frombuffer(payload, dtype=self._dtypes[channel])[0])
+
+
+def _topic(channel: str, symbol: str) -> str:
+    return f"{channel}/{symbol}"
+
+
+def _channel_of(topic: str) -> str:
+    return topic.split("/", 1)[0]
+
+
+class _Subscriber:
+    def __init__(self, sock: socket.socket, topics: List[str], conflate: bool, queue_size: int):
+        self.sock = sock
+        self.topics = tuple(topics)
+        self.conflate = conflate
+        self.dropped = 0
+        self.closed = False
+        self._latest: Dict[str, bytes] = dict()
+        self._queue = deque(maxlen=queue_size)
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+
+    def matches(self, topic: str) -> bool:
+        return not self.topics or topic.startswith(self.topics)
+
+    def offer(self, topic: str, frame: bytes):
+        with self._lock:
+            if self.conflate:
+                if topic in self._latest:
+                    self.dropped += 1
+                self._latest[topic] = frame
+            else:
+                if len(self._queue) == self._queue.maxlen:
+                    self.dropped += 1
+                self._queue.append(frame)
+        self._event.set()
+
+    def run(self):
+        while not self.closed:
+            self._event.wait()
+            self._event.clear()
+            with self._lock:
+                if self.conflate:
+                    frames, self._latest = list(self._latest.values()), dict()
+                else:
+                    frames = list(self._queue)
+                    self._queue.clear()
+            if not frames:
+                continue
+            try:
+                self.sock.sendall(b"".join(frames))
+            except OSError:
+                self.close()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class GatewayPublisher:
+    def __init__(self, path: str = GATEWAY_SOCKET_PATH, codec: str = "struct", queue_size: int = GATEWAY_QUEUE_SIZE):
+        """
+        Publish stream data to subscribers of a Unix domain socket
+        :param path: socket path, a stale socket file is replaced
+        :param codec: struct or msgpack
+        :param queue_size: outbox size of subscribers without conflation
+        """
+        self.path = path
+        self.codec = RecordCodec(codec)
+        self.queue_size = queue_size
+        self._subscribers: List[_Subscriber] = []
+        self._lock = threading.Lock()
+        self._server: Union[socket.socket, None] = None
+        self._acceptor: Union[threading.Thread, None] = None
+
+    def attach(self, stream):
+        """
+        Publish each tick of a data stream
+        :param stream: BaseDataStream
+        :return:
+        """
+        channel = stream.channel_name
+        stream.add_listener(lambda symbol, current: self.publish(channel, symbol, current))
+        return self
+
+    def publish(self, channel: str, symbol: str, current):
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        topic = _topic(channel, symbol)
+        topic_bytes = topic.encode()
+        payload = self.codec.encode(channel, current)
+        # encoded once, shared by all subscribers
+        frame = _FRAME_HEADER.pack(len(topic_bytes), len(payload)) + topic_bytes + payload
+        for subscriber in subscribers:
+            if subscriber.matches(topic):
+                subscriber.offer(topic, frame)
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen()
+        self._acceptor = threading.Thread(target=self._accept, name="ssi-gateway-acceptor", daemon=True)
+        self._acceptor.start()
+        logging.info(f"Gateway publishes on {self.path} with codec {self.codec.codec}")
+        return self
+
+    def _accept(self):
+        while self._server is not None:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                break
+            try:
+                # subscription: one json line with topics and conflate, answered by the codec
+                request = json.loads(sock.makefile("rb").readline() or b"{}")
+                sock.sendall((json.dumps({"codec": self.codec.codec}) + "\n").encode())
+            except (OSError, ValueError) as ex:
+                logging.error(f"Invalid gateway subscription: {ex}")
+                sock.close()
+                continue
+            subscriber = _Subscriber(sock, request.get("topics") or [], request.get("conflate", True), self.queue_size)
+            threading.Thread(target=self._serve, args=(subscriber,), name="ssi-gateway-sender", daemon=True).start()
+
+    def _serve(self, subscriber: _Subscriber):
+        with self._lock:
+            self._subscribers = self._subscribers + [subscriber]
+        logging.info(f"Gateway subscriber connected, topics: {list(subscriber.topics) or 'all'}")
+        subscriber.run()
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscriber]
+        logging.info(f"Gateway subscriber disconnected, {subscriber.dropped} records dropped")
+
+    def stats(self) -> List[Dict]:
+        return [
+            {"topics": list(s.topics), "conflate": s.conflate, "dropped": s.dropped}
+            for s in self._subscribers
+        ]
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is not None:
+            server.close()
+        for subscriber in self._subscribers:
+            subscriber.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class GatewaySubscriber:
+    def __init__(self, path: str = GATEWAY_SOCKET_PATH, topics: List[str] = None, conflate: bool = True):
+        """
+        :param path: socket path of the publisher
+        :param topics: topic prefixes, ex: ["X/", "B/HPG"], default all topics
+        :param conflate: True to receive only the latest record of each topic when reading slower than the stream
+        """
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._file = self._sock.makefile("rb")
+        self._sock.sendall((json.dumps({"topics": topics or [], "conflate": conflate}) + "\n").encode())
+        self.codec = RecordCodec(json.loads(self._file.readline())["codec"])
+
+    def recv(self) -> Union[Tuple[str, object], None]:
+        """
+        Wait for the next record
+        :return: (topic, record), None when the publisher is closed
+        """
+        header = self._file.read(_FRAME_HEADER.size)
+        if len(header) < _FRAME_HEADER.size:
+            return None
+        topic_size, payload_size = _FRAME_HEADER.unpack(header)
+        topic = self._file.read(topic_size).decode()
+        payload = self._file.read(payload_size)
+        return topic, self.codec.decode(_channel_of(topic), payload)
+
+    def __iter__(self) -> Iterator[Tuple[str, object]]:
+        while True:
+            message = self.recv()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+class ZmqGatewayPublisher:
+    def __init__(self, endpoint: str = GATEWAY_ZMQ_ENDPOINT, codec: str = "struct", high_water_mark: int = GATEWAY_QUEUE_SIZE):
+        """
+        Publish stream data on a ZeroMQ PUB socket as [topic, payload] messages,
+        messages to a subscriber over the high water mark are dropped by zmq, the publisher never blocks
+        :param endpoint: ipc://, tcp:// or inproc:// endpoint
+        :param codec: struct or msgpack
+        :param high_water_mark: messages queued per subscriber
+        """
+        if zmq is None:
+            raise ImportError("pyzmq is required for the zmq gateway: pip install ssi_trading[gateway]")
+        self.endpoint = endpoint
+        self.codec = RecordCodec(codec)
+        self._context = zmq.Context.instance()
+        self._socket = self._context.socket(zmq.PUB)
+        self._socket.setsockopt(zmq.SNDHWM, high_water_mark)
+        self._socket.bind(endpoint)
+        # zmq sockets are not thread safe, streams publish from their own threads
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def attach(self, stream):
+        channel = stream.channel_name
+        stream.add_listener(lambda symbol, current: self.publish(channel, symbol, current))
+        return self
+
+    def publish(self, channel: str, symbol: str, current):
+        message = [_topic(channel, symbol).encode(), self.codec.encode(channel, current)]
+        with self._lock:
+            try:
+                self._socket.send_multipart(message, flags=zmq.NOBLOCK)
+            except zmq.Again:
+                self.dropped += 1
+
+    def close(self):
+        with self._lock:
+            self._socket.close(linger=0)
+
+
+class ZmqGatewaySubscriber:
+    def __init__(self, endpoint: str = GATEWAY_ZMQ_ENDPOINT, topics: List[str] = None, codec: str = "struct"):
+        """
+        :param endpoint: endpoint of the publisher
+        :param topics: topic prefixes, default all topics
+        :param codec: codec of the publisher
+        """
+        if zmq is None:
+            raise ImportError("pyzmq is required for the zmq gateway: pip install ssi_trading[gateway]")
+        self.codec = RecordCodec(codec)
+        self._socket = zmq.Context.instance().socket(zmq.SUB)
+        self._socket.connect(endpoint)
+        for topic in topics or [""]:
+            self._socket.setsockopt(zmq.SUBSCRIBE, topic.encode())
+
+    def recv(self, timeout_ms: int = None) -> Union[Tuple[str, object], None]:
+        """
+        :param timeout_ms: default wait forever
+        :return: (topic, record), None on timeout
+        """
+        if timeout_ms is not None and not self._socket.poll(timeout_ms):
+            return None
+        topic, payload = self._socket.recv_multipart()
+        topic = topic.decode()
+        return topic, self.codec.decode(_channel_of(topic), payload)
+
+    def latest(self) -> Dict[str, object]:
+        """
+        Conflated read: drain queued messages and keep the latest record of each topic
+        :return:
+        """
+        records = dict()
+        while self._socket.poll(0):
+            topic, record = self.recv()
+            records[topic] = record
+        return records
+
+    def close(self):
+        self._socket.close(linger=0)
@@ -1,37 +1,61 @@
+import logging
+import math
+import threading
 from abc import ABC, abstractmethod
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Iterator, Tuple, TYPE_CHECKING
 
-from ssi_fc_data.fc_md_client import MarketDataClient
-from ssi_fctrading import FCTradingClient
-from ssi_trading.config import TradingServiceConfig, DataServiceConfig
-from ssi_trading.factory import create_market_data_client
-from ssi_trading.models.data import StockPrice, DailyIndex, OHLCV
+from ssi_trading.config import (
+    TradingServiceConfig, DataServiceConfig, BATCH_MAX_WORKERS,
+    PAGE_SIZES, MAX_PAGE_INDEX, TRADING_MINUTES_PER_DAY, ORDER_HISTORY_PAGE_SIZE, ORDER_HISTORY_MAX_PAGES,
+)
+from ssi_trading.factory import (
+    create_market_data_client, create_trading_client, trading_request_lock, create_rate_limiter, device_id, user_agent
+)
+from ssi_trading.models.data import StockPrice, DailyIndex, OHLCV, BulkOHLCV, SecurityInfo
 from ssi_trading.models.definitions import OrderStatus, SecurityMarket
 from ssi_trading.models.trading import (
     CreatedOrder, AccountBalance, StockPosition, MaxBuySellQty,
 )
-import requests
+from ssi_trading.utils import run_concurrently, ensure_default_ssi_day_format, split_date_range, trading_days, page_size_for
+
+if TYPE_CHECKING:
+    # sdk clients, requests and pandas are imported by the services which use them
+    from ssi_fc_data.fc_md_client import MarketDataClient
+    from ssi_fctrading import FCTradingClient
 
 
 class BaseDataService(ABC):
     def __init__(self, config: DataServiceConfig):
         self._config: DataServiceConfig = config
-        self._client: MarketDataClient = create_market_data_client(self._config)
+        self._client: "MarketDataClient" = create_market_data_client(self._config)
+        self._limiter = create_rate_limiter(self._config.consumer_id)
+        self._batch_max_workers = BATCH_MAX_WORKERS
 
     @abstractmethod
     def stock_price(
             self,
             symbol: str,
             start_date=None, end_date=None,
-            page_index: int = 1, page_size: int = 10
+            page_index: int = 1, page_size: int = None,
+            market: str = ''
     ) -> Union[List[StockPrice], None]:
+        """
+        Daily price board of a symbol, or of a whole market when symbol is empty
+        :param symbol:
+        :param start_date: format dd/mm/yyyy
+        :param end_date: format dd/mm/yyyy
+        :param page_index: from 1 to 10
+        :param page_size: one of 10, 20, 50, 100, 1000, default the smallest one holding the range
+        :param market: HOSE, HNX, UPCOM, DER or empty for all
+        :return:
+        """
         raise NotImplementedError()
 
     @abstractmethod
     def daily_index(
             self, index_id: str,
             start_date=None, end_date=None,
-            page_index: int = 1, page_size: int = 10,
+            page_index: int = 1, page_size: int = None,
             order_by: str = "Tradingdate", ascending: bool = False
     ) -> Union[List[DailyIndex], None]:
         """
@@ -40,7 +64,7 @@ class BaseDataService(ABC):
         :param start_date:
         :param end_date:
         :param page_index:
-        :param page_size:
+        :param page_size: default the smallest one holding the range
         :param order_by:
         :param ascending:
         :return:
@@ -51,7 +75,7 @@ class BaseDataService(ABC):
     def intraday_ohlcv(
             self, symbol: str,
             start_date=None, end_date=None,
-            page_index: int = 1, page_size: int = 10,
+            page_index: int = 1, page_size: int = None,
             resolution: int = 1,
             ascending: bool = True
     ) -> Union[List[OHLCV], None]:
@@ -61,7 +85,7 @@ class BaseDataService(ABC):
         :param start_date: format dd/mm/yyyy
         :param end_date: format dd/mm/yyyy
         :param page_index: from 1 to 10
-        :param page_size: one of 10, 20, 50, 100, 1000
+        :param page_size: one of 10, 20, 50, 100, 1000, default the smallest one holding the range
         :param resolution: resample data to 1 eq 1m
         :param ascending:
         :return:
@@ -72,7 +96,7 @@ class BaseDataService(ABC):
     def daily_ohlcv(
             self, symbol: str,
             start_date=None, end_date=None,
-            page_index: int = 1, page_size: int = 10,
+            page_index: int = 1, page_size: int = None,
             ascending: bool = False
     ) -> Union[List[OHLCV], None]:
         """
@@ -81,7 +105,7 @@ class BaseDataService(ABC):
         :param start_date: format dd/mm/yyyy
         :param end_date: format dd/mm/yyyy
         :param page_index: from 1 to 10
-        :param page_size: one of 10, 20, 50, 100, 1000
+        :param page_size: one of 10, 20, 50, 100, 1000, default the smallest one holding the range
         :param ascending:
         :return:
         """
@@ -116,24 +140,165 @@ class BaseDataService(ABC):
         """
         raise NotImplementedError()
 
+    @abstractmethod
+    def list_securities(
+            self,
+            exchange: SecurityMarket.DEFAULT,
+            page_index: int = 1, page_size: int = 1000
+    ) -> Union[List[SecurityInfo], None]:
+        """
+        Get list of securities of a market
+        :param exchange: HOSE, HNX, UPCOM or DER
+        :param page_index: 1 to 10
+        :param page_size: 10; 20; 50; 100; 1000
+        :return:
+        """
+        raise NotImplementedError()
+
+    def iter_daily_ohlcv(
+            self, symbol: str,
+            start_date=None, end_date=None,
+            page_size: int = None
+    ) -> Iterator[Union[List[OHLCV], None]]:
+        """
+        Daily OHLCV of a date range page by page, oldest first, only one page is held at a time
+        :param symbol:
+        :param start_date: format dd/mm/yyyy
+        :param end_date: format dd/mm/yyyy
+        :param page_size: default the smallest page size holding the range, or 1000
+        :return: pages of records, a None page means the request failed and ends the iteration
+        """
+        return self._iter_ohlcv(
+            lambda start, end, page, size: self.daily_ohlcv(
+                symbol, start, end, page_index=page, page_size=size, ascending=True
+            ),
+            start_date, end_date, 1, page_size
+        )
+
+    def iter_intraday_ohlcv(
+            self, symbol: str,
+            start_date=None, end_date=None,
+            resolution: int = 1,
+            page_size: int = None
+    ) -> Iterator[Union[List[OHLCV], None]]:
+        """
+        Intraday OHLCV of a date range page by page, oldest first, only one page is held at a time
+        :param symbol:
+        :param start_date: format dd/mm/yyyy
+        :param end_date: format dd/mm/yyyy
+        :param resolution: resample data to 1 eq 1m
+        :param page_size: default the smallest page size holding the range, or 1000
+        :return: pages of records, a None page means the request failed and ends the iteration
+        """
+        return self._iter_ohlcv(
+            lambda start, end, page, size: self.intraday_ohlcv(
+                symbol, start, end, page_index=page, page_size=size, resolution=resolution, ascending=True
+            ),
+            start_date, end_date, math.ceil(TRADING_MINUTES_PER_DAY / resolution), page_size
+        )
+
+    @staticmethod
+    def _iter_ohlcv(fetch_page, start_date, end_date, rows_per_day: int, page_size: Union[int, None]):
+        start_date, end_date = ensure_default_ssi_day_format(start_date, end_date)
+        # a request series reads at most MAX_PAGE_INDEX pages, longer ranges are split by date
+        days_per_range = (page_size or PAGE_SIZES[-1]) * MAX_PAGE_INDEX // rows_per_day
+        # whole weeks, a range never holds more weekdays than a request series returns
+        max_days = days_per_range // 5 * 7 if days_per_range >= 5 else max(1, days_per_range)
+        for start, end in split_date_range(start_date, end_date, max_days):
+            size = page_size or page_size_for(trading_days(start, end) * rows_per_day)
+            for page in range(1, MAX_PAGE_INDEX + 1):
+                rows = fetch_page(start, end, page, size)
+                if rows is None:
+                    yield None
+                    return
+                if rows:
+                    yield rows
+                if len(rows) < size:
+                    break
+
+    def bulk_daily_ohlcv(
+            self, symbols: List[str],
+            start_date=None, end_date=None,
+            page_size: int = None
+    ) -> BulkOHLCV:
+        """
+        Daily OHLCV of many symbols, symbols are fetched concurrently under the shared rate limit
+        :param symbols:
+        :param start_date: format dd/mm/yyyy
+        :param end_date: format dd/mm/yyyy
+        :param page_size: one of 10, 20, 50, 100, 1000, default the smallest one holding the range
+        :return: long format data and failed symbols
+        """
+        return self._bulk_ohlcv(lambda symbol: self.iter_daily_ohlcv(symbol, start_date, end_date, page_size), symbols)
+
+    def bulk_intraday_ohlcv(
+            self, symbols: List[str],
+            start_date=None, end_date=None,
+            resolution: int = 1,
+            page_size: int = None
+    ) -> BulkOHLCV:
+        """
+        Intraday OHLCV of many symbols, symbols are fetched concurrently under the shared rate limit
+        :param symbols:
+        :param start_date: format dd/mm/yyyy
+        :param end_date: format dd/mm/yyyy
+        :param resolution: resample data to 1 eq 1m
+        :param page_size: one of 10, 20, 50, 100, 1000, default the smallest one holding the range
+        :return: long format data and failed symbols
+        """
+        return self._bulk_ohlcv(
+            lambda symbol: self.iter_intraday_ohlcv(symbol, start_date, end_date, resolution, page_size), symbols
+        )
+
+    def _bulk_ohlcv(self, iter_pages, symbols: List[str]) -> BulkOHLCV:
+        def fetch(symbol) -> Union[List[OHLCV], None]:
+            records = []
+            for rows in iter_pages(symbol):
+                if rows is None:
+                    return None
+                records.extend(rows)
+            return records
+
+        symbols = list(dict.fromkeys(symbols))
+        results = run_concurrently(fetch, symbols, self._batch_max_workers)
+
+        failed = [symbol for symbol, records in zip(symbols, results) if records is None]
+        if failed:
+            logging.error(f"Error while getting ohlcv of {len(failed)}/{len(symbols)} symbols: {failed}")
+        records = [record for records in results if records for record in records]
+        from pandas import DataFrame
+        data = DataFrame(records, columns=["symbol", "trading_time", "open", "high", "low", "close", "volume", "value"])
+        data = data.drop_duplicates(["symbol", "trading_time"]).sort_values(["symbol", "trading_time"], ignore_index=True)
+        return BulkOHLCV(data=data, failed=failed)
+
 
 class BaseTradingService(ABC):
     def __init__(self, config: TradingServiceConfig):
         self._config: TradingServiceConfig = config
         self.account_id: str = self._config.account_id.__str__().upper()
-        self._device_id: str = FCTradingClient.get_deviceid()
-        self._user_agent: str = FCTradingClient.get_user_agent()
+        self._device_id: str = device_id()
+        self._user_agent: str = user_agent()
         self._account_token = self._config.auth_token
         if not self._config.paper_trading:
-            self._client: FCTradingClient = FCTradingClient(
-                self._config.Url, self._config.ConsumerID,
-                self._config.ConsumerSecret, "",
-                self._config.TwoFAType
-            )
+            self._client: "FCTradingClient" = create_trading_client(self._config)
         else:
-            self._client = requests
+            import requests
+            # keep-alive session, pooled connections are reused by batch requests
+            self._client = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=BATCH_MAX_WORKERS)
+            self._client.mount("https://", adapter)
 
         self._market_id = None
+        self._limiter = create_rate_limiter(self._config.consumer_id)
+        self._batch_max_workers = BATCH_MAX_WORKERS
+        # the sdk writes the token and the signature of each request into the shared headers of the client,
+        # requests are sent one at a time, batches only overlap their preparation and their rate limit waits,
+        # the client is shared by every service and stream of the consumer so is the lock
+        self._request_lock = threading.Lock() if self._config.paper_trading else trading_request_lock(self._config)
+
+    def _request(self, fn, *args):
+        with self._request_lock:
+            return fn(*args)
 
     @abstractmethod
     def create_order(self, order: CreatedOrder) -> Union[CreatedOrder, None]:
@@ -167,11 +332,70 @@ class BaseTradingService(ABC):
     def order_history(self, order_status=None, start_date=None, end_date=None, page=1, page_size=50) -> Union[List[CreatedOrder], None]:
         raise NotImplementedError()
 
+    def create_orders(self, orders: List[CreatedOrder]) -> List[Union[CreatedOrder, None]]:
+        """
+        Submit many orders from a worker pool, the signed requests themselves are serialized by _request,
+        return one result per order in the same order, None if the order failed
+        :param orders:
+        :return:
+        """
+        return run_concurrently(self.create_order, orders, self._batch_max_workers)
+
+    def cancel_orders(self, orders: List[CreatedOrder]) -> List[Union[CreatedOrder, None]]:
+        """
+        Cancel many orders from a worker pool, the signed requests themselves are serialized by _request,
+        return one result per order in the same order, None if the cancel failed
+        :param orders:
+        :return:
+        """
+        return run_concurrently(self.cancel_order, orders, self._batch_max_workers)
+
+    def cancel_all(self, symbol: str = None) -> List[Union[CreatedOrder, None]]:
+        """
+        Cancel all working orders, optionally only orders of a symbol
+        :param symbol:
+        :return:
+        """
+        orders = self.pending_orders() or []
+        if symbol is not None:
+            orders = [order for order in orders if order.symbol == symbol]
+        return self.cancel_orders(orders)
+
+    def max_buy_sell_qtys(self, queries: List[Tuple[str, float, str]]) -> List[Union[MaxBuySellQty, None]]:
+        """
+        Query max buy/sell quantities of many symbols concurrently, return one result per query in the same order
+        :param queries: list of (symbol, price, order_side)
+        :return:
+        """
+        return run_concurrently(lambda query: self.max_buy_sell_qty(*query), queries, self._batch_max_workers)
+
     def pending_orders(self) -> Union[List[CreatedOrder], None]:
-        return self.order_history(order_status=",".join(OrderStatus.WORKING_ORDERS))
+        return self._orders_by_status(OrderStatus.WORKING_ORDERS)
 
     def filled_orders(self) -> Union[List[CreatedOrder], None]:
-        return self.order_history(order_status=",".join(OrderStatus.FILLED_ORDERS))
+        return self._orders_by_status(OrderStatus.FILLED_ORDERS)
+
+    def _orders_by_status(self, statuses: List[str]) -> Union[List[CreatedOrder], None]:
+        """
+        Orders of all history pages with one of the statuses, filtered here as some endpoints ignore order_status
+        :param statuses:
+        :return: None when the first page failed
+        """
+        orders: Dict[str, CreatedOrder] = dict()
+        for page in range(1, ORDER_HISTORY_MAX_PAGES + 1):
+            rows = self.order_history(order_status=",".join(statuses), page=page, page_size=ORDER_HISTORY_PAGE_SIZE)
+            if rows is None:
+                if page == 1:
+                    return None
+                logging.error(f"Error while reading order history page {page}, later pages are skipped.")
+                break
+            new_rows = [row for row in rows if row.order_id not in orders]
+            for row in new_rows:
+                orders[row.order_id] = row
+            # a short page is the last one, endpoints without paging return the same rows again
+            if len(rows) < ORDER_HISTORY_PAGE_SIZE or not new_rows:
+                break
+        return [order for order in orders.values() if order.order_status in statuses]
 
     def view_portfolio(self) -> Union[List[StockPosition], None]:
         position_dict = self.current_positions()
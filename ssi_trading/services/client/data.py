@@ -1,19 +1,25 @@
 import datetime
 import logging
+import math
 from typing import Union, List
 from ssi_fc_data import model
 
-from ssi_trading.config import DataServiceConfig
-from ssi_trading.models.data import OHLCV, DailyIndex, StockPrice
-from ssi_trading.models.definitions import SecurityMarket
+from ssi_trading.config import DataServiceConfig, PAGE_SIZES, TRADING_MINUTES_PER_DAY
+from ssi_trading.models.data import OHLCV, DailyIndex, StockPrice, SecurityInfo
+from ssi_trading.models.definitions import SecurityMarket, RequestPriority
 from ssi_trading.services.client import BaseDataService
-from ssi_trading.utils import ensure_default_ssi_day_format, generate_request_id
+from ssi_trading.utils import ensure_default_ssi_day_format, generate_request_id, trading_days, page_size_for
+from ssi_trading.limiter import rate_limited
 
 
 class MarketDataService(BaseDataService):
+    @rate_limited(RequestPriority.NORMAL)
     def stock_price(self, symbol: str, start_date=None, end_date=None, page_index: int = 1,
-                    page_size: int = 10) -> Union[List[StockPrice], None]:
+                    page_size: int = None, market: str = '') -> Union[List[StockPrice], None]:
         start_date, end_date = ensure_default_ssi_day_format(start_date, end_date)
+        if page_size is None:
+            # a market board has one row per symbol and day
+            page_size = page_size_for(trading_days(start_date, end_date)) if symbol else PAGE_SIZES[-1]
         try:
             req = model.daily_stock_price(
                 symbol=symbol,
@@ -21,7 +27,7 @@ class MarketDataService(BaseDataService):
                 toDate=end_date,
                 pageIndex=page_index,
                 pageSize=page_size,
-                market=''
+                market=market or ''
             )
             data = self._client.daily_stock_price(self._config, req)
             if data["status"].lower() == "success":
@@ -67,11 +73,13 @@ class MarketDataService(BaseDataService):
             logging.exception(f"Error while getting stock price: {ex}")
             return None
 
-    def daily_index(self, index_id: str, start_date=None, end_date=None, page_index: int = 1, page_size: int = 10,
+    @rate_limited(RequestPriority.HISTORY)
+    def daily_index(self, index_id: str, start_date=None, end_date=None, page_index: int = 1, page_size: int = None,
                     order_by: str = "Tradingdate", ascending: bool = False) -> Union[List[DailyIndex], None]:
         """
         """
         start_date, end_date = ensure_default_ssi_day_format(start_date, end_date)
+        page_size = page_size or page_size_for(trading_days(start_date, end_date))
         try:
             req = model.daily_index(
                 requestId=generate_request_id(),
@@ -117,6 +125,7 @@ class MarketDataService(BaseDataService):
             logging.exception(f"Error while getting daily index: {ex}")
             return None
 
+    @rate_limited(RequestPriority.NORMAL)
     def list_index_components(self, index_id: str, page_index: int = 1, page_size: int = 100) -> Union[List[str], None]:
         try:
             req = model.index_components(
@@ -134,6 +143,7 @@ class MarketDataService(BaseDataService):
             logging.exception(f"Error while getting list index components: {ex}")
             return None
 
+    @rate_limited(RequestPriority.NORMAL)
     def list_index_names(self, exchange: SecurityMarket.DEFAULT, page_index: int = 1,
                          page_size: int = 10) -> Union[List[str], None]:
         try:
@@ -150,14 +160,42 @@ class MarketDataService(BaseDataService):
             logging.exception(f"Error while getting list index names: {ex}")
             return None
 
-    def intraday_ohlcv(self, symbol: str, start_date=None, end_date=None, page_index: int = 1, page_size: int = 10,
+    @rate_limited(RequestPriority.NORMAL)
+    def list_securities(self, exchange: SecurityMarket.DEFAULT, page_index: int = 1,
+                        page_size: int = 1000) -> Union[List[SecurityInfo], None]:
+        try:
+            req = model.securities(
+                market=exchange or '',
+                pageIndex=page_index, pageSize=page_size
+            )
+            data = self._client.securities(self._config, req)
+            if data["status"].lower() == "success":
+                return [
+                    SecurityInfo(
+                        market=item.get("Market"),
+                        symbol=item.get("Symbol"),
+                        stock_name=item.get("StockName"),
+                        stock_en_name=item.get("StockEnName"),
+                    ) for item in data['data']
+                ]
+            else:
+                logging.error(f"Error while getting list securities: {data}")
+                return None
+        except Exception as ex:
+            logging.exception(f"Error while getting list securities: {ex}")
+            return None
+
+    @rate_limited(RequestPriority.HISTORY)
+    def intraday_ohlcv(self, symbol: str, start_date=None, end_date=None, page_index: int = 1, page_size: int = None,
                        resolution: int = 1, ascending: bool = True) -> Union[List[OHLCV], None]:
         start_date, end_date = ensure_default_ssi_day_format(start_date, end_date)
+        if page_size is None:
+            page_size = page_size_for(trading_days(start_date, end_date) * math.ceil(TRADING_MINUTES_PER_DAY / resolution))
         try:
             req = model.intraday_ohlc(
                 symbol=symbol,
                 fromDate=start_date, toDate=end_date,
-                pageSize=page_index, pageIndex=page_size,
+                pageIndex=page_index, pageSize=page_size,
                 ascending=ascending,
                 resolution=resolution
             )
@@ -182,10 +220,12 @@ class MarketDataService(BaseDataService):
             logging.exception(f"Error while getting intraday ohlcv: {ex}")
             return None
 
-    def daily_ohlcv(self, symbol: str, start_date=None, end_date=None, page_index: int = 1, page_size: int = 10,
+    @rate_limited(RequestPriority.HISTORY)
+    def daily_ohlcv(self, symbol: str, start_date=None, end_date=None, page_index: int = 1, page_size: int = None,
                     ascending: bool = False) -> Union[List[OHLCV], None]:
 
         start_date, end_date = ensure_default_ssi_day_format(start_date, end_date)
+        page_size = page_size or page_size_for(trading_days(start_date, end_date))
         try:
             req = model.daily_ohlc(symbol, start_date, end_date, page_index, page_size, ascending)
             data = self._client.daily_ohlc(self._config, req)
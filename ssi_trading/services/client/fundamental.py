@@ -1,5 +1,364 @@
+# Description: Stock trading client implementation.
+# One stock position request returns all holdings of the account, the snapshot and the max buy/sell quantities are
+# cached for TRADING_CACHE_TTL seconds so per symbol lookups and batches reuse them, orders invalidate the cache.
+import datetime
+import logging
+import threading
+import time
+from typing import Union, List, Dict, Tuple
+
+from ssi_trading.config import TradingServiceConfig, TRADING_CACHE_TTL
+from ssi_trading.models.trading import CreatedOrder, MaxBuySellQty, StockPosition, AccountBalance
+from ssi_fctrading.models import fcmodel_requests
 from ssi_trading.services.client import BaseTradingService
+from ssi_trading.utils import generate_request_id
+from ssi_trading.limiter import rate_limited
+from ssi_trading.models.definitions import RequestPriority, TradingMarket, OrderSide
 
 
 class FundamentalTradingService(BaseTradingService):
-    pass
+    def __init__(self, config: TradingServiceConfig, cache_ttl: float = TRADING_CACHE_TTL):
+        """
+        :param config:
+        :param cache_ttl: seconds positions and max quantities are reused, 0 to disable the cache
+        """
+        super().__init__(config)
+        self._market_id = TradingMarket.STOCK
+        self._cache_ttl = cache_ttl
+        # key -> (expiry, value), key is "positions" or (symbol, price, order_side)
+        self._cache: Dict[Union[str, Tuple], Tuple[float, object]] = dict()
+        self._cache_lock = threading.Lock()
+
+    # region cache
+    def _cached(self, key, fetch):
+        now = time.monotonic()
+        with self._cache_lock:
+            item = self._cache.get(key)
+            if item is not None and item[0] > now:
+                return item[1]
+        value = fetch()
+        # failed requests are never cached
+        if value is not None and self._cache_ttl > 0:
+            with self._cache_lock:
+                self._cache[key] = (now + self._cache_ttl, value)
+        return value
+
+    def invalidate_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+    # endregion
+
+    # region account
+    @rate_limited(RequestPriority.ACCOUNT)
+    def account_balance(self) -> Union[AccountBalance, None]:
+        """
+        {
+            "message": "Success",
+            "status": 200,
+            "data": {
+                "account": "0041691",
+                "cashBal": 99292902171,
+                "cashOnHold": 0,
+                "secureAmount": 0,
+                "withdrawable": 99292902171,
+                "receivingCashT1": 0,
+                "receivingCashT2": 0,
+                "matchedBuyVolume": 0,
+                "matchedSellVolume": 0,
+                "debt": 0,
+                "unMatchedBuyVolume": 0,
+                "paidCashT1": 0,
+                "paidCashT2": 0,
+                "cia": 0,
+                "purchasingPower": 99292902171,
+                "totalAssets": 101234567000
+            }
+        }
+        :return:
+        """
+        try:
+            fc_rq = fcmodel_requests.StockAccountBalance(self.account_id)
+            res = self._request(self._client.get_stock_account_balance, fc_rq)
+            if res['message'].lower() == 'success':
+                data = res['data']
+                return AccountBalance(
+                    account_id=self.account_id,
+                    market_id=self._market_id,
+                    balance=data['cashBal'],
+                    ee=data['purchasingPower'],
+                    nav=data.get('totalAssets'),
+                    withdrawable=data['withdrawable'],
+                    fee=0,
+                    interest=0,
+                    commission=0
+                )
+        except Exception as ex:
+            logging.error(f"Error while getting account balance: {ex}")
+            return None
+
+    def current_positions(self) -> Union[Dict[str, StockPosition], None]:
+        return self._cached("positions", self._fetch_positions)
+
+    @rate_limited(RequestPriority.ACCOUNT)
+    def _fetch_positions(self) -> Union[Dict[str, StockPosition], None]:
+        """
+        {
+            "message": "Success",
+            "status": 200,
+            "data": {
+                "account": "0041691",
+                "stockPositions": [
+                    {
+                        "marketID": "VN",
+                        "instrumentID": "SSI",
+                        "onHand": 1000,
+                        "block": 0,
+                        "bonus": 0,
+                        "buyT0": 0,
+                        "buyT1": 0,
+                        "buyT2": 100,
+                        "sellT0": 0,
+                        "sellT1": 0,
+                        "sellT2": 0,
+                        "avgPrice": 21500,
+                        "mortgage": 0,
+                        "sellableQty": 1000,
+                        "setOffQty": 0,
+                        "marketPrice": 22000
+                    }
+                ]
+            }
+        }
+        :return: holdings including unsettled buys, sold shares are excluded
+        """
+        try:
+            fc_rq = fcmodel_requests.StockPosition(self.account_id)
+            res = self._request(self._client.get_stock_position, fc_rq)
+            if res['message'].lower() == 'success':
+                positions = dict()
+                for position in res['data'].get('stockPositions') or []:
+                    qty = (
+                        position.get('onHand', 0) + position.get('block', 0) + position.get('mortgage', 0)
+                        + position.get('buyT0', 0) + position.get('buyT1', 0) + position.get('buyT2', 0)
+                    )
+                    if qty == 0:
+                        continue
+                    market_price = position.get('marketPrice', 0)
+                    avg_price = position.get('avgPrice', 0)
+                    positions[position['instrumentID']] = StockPosition(
+                        market_id=self._market_id,
+                        account_id=self.account_id,
+                        symbol=position['instrumentID'],
+                        position=qty,
+                        floating_pl=(market_price - avg_price) * qty if market_price else None,
+                        market_price=market_price,
+                        avg_price=avg_price
+                    )
+                return positions
+        except Exception as ex:
+            logging.error(f"Error while getting current positions: {ex}")
+            return None
+
+    def closed_positions(self) -> Union[Dict[str, StockPosition], None]:
+        # stock positions are settled into cash, there is no closed position report
+        return dict()
+
+    def max_buy_sell_qty(self, symbol, price, order_side) -> Union[MaxBuySellQty, None]:
+        return self._cached((symbol, price, order_side), lambda: self._fetch_max_qty(symbol, price, order_side))
+
+    @rate_limited(RequestPriority.ACCOUNT)
+    def _fetch_max_qty(self, symbol, price, order_side) -> Union[MaxBuySellQty, None]:
+        """
+        message: "Success",
+        status: 200,
+        data: {
+            account: "0041691",
+            maxBuyQty: 8241440,
+            marginRatio: "50%",
+            purchasingPower: 99292902171
+        }
+        :param symbol:
+        :param price:
+        :param order_side:
+        :return:
+        """
+        try:
+            if order_side == OrderSide.BUY:
+                res = self._request(self._client.get_max_buy_qty, fcmodel_requests.MaxBuyQty(self.account_id, symbol, price))
+            else:
+                res = self._request(self._client.get_max_sell_qty, fcmodel_requests.MaxSellQty(self.account_id, symbol, str(price)))
+            if res['message'].lower() == 'success':
+                data = res['data']
+                return MaxBuySellQty(
+                    symbol=symbol,
+                    max_qty=data.get('maxBuyQty') if order_side == OrderSide.BUY else data.get('maxSellQty'),
+                    power=data.get('purchasingPower'),
+                    market_id=self._market_id,
+                    account_id=self.account_id
+                )
+        except Exception as ex:
+            logging.error(f"Error while getting max {order_side} qty of {symbol}: {ex}")
+            return None
+
+    @rate_limited(RequestPriority.ACCOUNT)
+    def order_history(self, order_status=None, start_date=None, end_date=None, page=1, page_size=50) -> Union[List[CreatedOrder], None]:
+        """
+        message: "Success",
+        status: 200,
+        data: {
+            orderHistories: [
+                {
+                    orderID: "12626539",
+                    buySell: "B",
+                    price: 21000.0,
+                    quantity: 300,
+                    filledQty: 0,
+                    orderStatus: "QU",
+                    marketID: "VN",
+                    instrumentID: "SSI",
+                    orderType: "LO",
+                    cancelQty: 0,
+                    avgPrice: 0.0
+                }
+            ],
+            account: "0041691"
+        }
+        :param order_status: comma separated OrderStatus, default all orders
+        """
+        if start_date is None:
+            start_date = datetime.datetime.now().strftime("%d/%m/%Y")
+            end_date = (datetime.datetime.now() + datetime.timedelta(days=1)).strftime("%d/%m/%Y")
+        statuses = set(order_status.split(",")) if order_status else None
+
+        try:
+            fc_rq = fcmodel_requests.OrderHistory(self.account_id, start_date, end_date)
+            res = self._request(self._client.get_order_history, fc_rq)
+            if res['message'].lower() == 'success':
+                return [
+                    CreatedOrder(
+                        symbol=order['instrumentID'],
+                        market_id=self._market_id,
+                        account_id=self.account_id,
+                        order_side=order['buySell'],
+                        order_type=order['orderType'],
+                        order_price=order['price'],
+                        order_qty=order['quantity'],
+                        order_id=order['orderID'],
+                        order_status=order['orderStatus'],
+                        avg_price=order['avgPrice'],
+                        os_qty=order['quantity'] - order['filledQty'] - order.get('cancelQty', 0),
+                        filled_qty=order['filledQty']
+                    ) for order in res['data'].get('orderHistories') or []
+                    if statuses is None or order['orderStatus'] in statuses
+                ]
+        except Exception as ex:
+            logging.error(f"Error while getting order history: {ex}")
+            return None
+    # endregion
+
+    # region orders
+    @rate_limited(RequestPriority.ORDER)
+    def create_order(self, order: CreatedOrder) -> Union[CreatedOrder, None]:
+        """
+        {
+            message: "Success",
+            status: 200,
+            data: {
+                requestID: "1678195",
+                requestData: {
+                    instrumentID: "SSI",
+                    market: "VN",
+                    buySell: "B",
+                    orderType: "LO",
+                    channelID: "IW",
+                    price: 21000,
+                    quantity: 300,
+                    account: "0041691",
+                    stopOrder: false
+                }
+            }
+        }
+        :param order: stop fields are ignored, stock stop orders are kept by StopTriggerEngine
+        :return:
+        """
+        order.market_id = self._market_id
+        order.account_id = self.account_id
+        request_id = generate_request_id()
+        try:
+            fc_req = fcmodel_requests.NewOrder(
+                account=order.account_id,
+                requestID=request_id,
+                instrumentID=order.symbol,
+                market=order.market_id,
+                buySell=order.order_side,
+                orderType=order.order_type,
+                price=order.order_price,
+                quantity=order.order_qty,
+                deviceId=self._device_id,
+                userAgent=self._user_agent
+            )
+            res = self._request(self._client.new_order, fc_req)
+            self.invalidate_cache()
+            if res['message'].lower() != "success":
+                return None
+            order.request_id = str((res.get('data') or dict()).get('requestID') or request_id)
+            return order
+        except Exception as ex:
+            logging.error(f"Error while creating order: {ex}")
+            return None
+
+    @rate_limited(RequestPriority.ORDER)
+    def cancel_order(self, order) -> Union[CreatedOrder, None]:
+        order.market_id = self._market_id
+        order.account_id = self.account_id
+
+        fc_rq = fcmodel_requests.CancelOrder(
+            account=order.account_id,
+            requestID=generate_request_id(),
+            orderID=order.order_id,
+            marketID=order.market_id,
+            instrumentID=order.symbol,
+            buySell=order.order_side,
+            deviceId=self._device_id,
+            userAgent=self._user_agent
+        )
+        try:
+            res = self._request(self._client.cancle_order, fc_rq)
+            self.invalidate_cache()
+            return order if res['message'].lower() == "success" else None
+        except Exception as ex:
+            logging.error(f"Error while cancelling order: {ex}")
+            return None
+
+    @rate_limited(RequestPriority.ORDER)
+    def modify_order(self, order: CreatedOrder, new_qty: int = 0, new_price: float = 0) -> Union[CreatedOrder, None]:
+        # the order is only changed when the modification is accepted
+        price = new_price or order.order_price
+        qty = new_qty or order.order_qty
+        fc_rq = fcmodel_requests.ModifyOrder(
+            account=self.account_id,
+            requestID=generate_request_id(),
+            orderID=order.order_id,
+            marketID=self._market_id,
+            instrumentID=order.symbol,
+            price=price,
+            quantity=qty,
+            buySell=order.order_side,
+            orderType=order.order_type,
+            deviceId=self._device_id,
+            userAgent=self._user_agent
+        )
+        try:
+            res = self._request(self._client.modify_order, fc_rq)
+            self.invalidate_cache()
+            if res['message'].lower() != "success":
+                return None
+            order.order_price = price
+            order.order_qty = qty
+            order.market_id = self._market_id
+            order.account_id = self.account_id
+            return order
+        except Exception as ex:
+            logging.error(f"Error while modifying order: {ex}")
+            return None
+    # endregion
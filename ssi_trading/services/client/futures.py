@@ -9,10 +9,13 @@ from ssi_fctrading.models import fcmodel_requests
 import logging
 from ssi_trading.services.client import BaseTradingService
 from ssi_trading.utils import generate_request_id
+from ssi_trading.limiter import rate_limited
+from ssi_trading.models.definitions import RequestPriority, TradingMarket
 
 
 class FutureTradingService(BaseTradingService):
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def account_balance(self) -> Union[AccountBalance, None]:
         """
         {
@@ -74,7 +77,7 @@ class FutureTradingService(BaseTradingService):
         """
         try:
             fc_rq = fcmodel_requests.StockAccountBalance(self.account_id)
-            res = self._client.get_stock_account_balance(fc_rq)
+            res = self._request(self._client.get_stock_account_balance, fc_rq)
             data = res['data']
             if res['message'].lower() == 'success':
                 return AccountBalance(
@@ -96,6 +99,7 @@ class FutureTradingService(BaseTradingService):
             logging.error(f"Error while getting account balance: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def order_history(self, order_status=None, start_date=None, end_date=None, page=1, page_size=50) -> Union[List[CreatedOrder], None]:
         """
             message: "Success",
@@ -128,9 +132,11 @@ class FutureTradingService(BaseTradingService):
             start_date = datetime.datetime.now().strftime("%d/%m/%Y")
             end_date = (datetime.datetime.now() + datetime.timedelta(days=1)).strftime("%d/%m/%Y")
 
+        statuses = set(order_status.split(",")) if order_status else None
+
         try:
             fc_rq = fcmodel_requests.OrderHistory(self.account_id, start_date, end_date)
-            res = self._client.get_order_history(fc_rq)
+            res = self._request(self._client.get_order_history, fc_rq)
             if res['message'].lower() == 'success':
                 return [
                     CreatedOrder(
@@ -146,12 +152,14 @@ class FutureTradingService(BaseTradingService):
                         avg_price=order['avgPrice'],
                         os_qty=order['quantity'] - order['filledQty'],
                         filled_qty=order['filledQty']
-                    ) for order in res.get('orderHistories', [])
+                    ) for order in res['data'].get('orderHistories') or []
+                    if statuses is None or order['orderStatus'] in statuses
                 ]
         except Exception as ex:
             logging.error(f"Error while getting order history: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def current_positions(self) -> Union[Dict[str, StockPosition], None]:
         """
         message: "Success",
@@ -177,7 +185,7 @@ class FutureTradingService(BaseTradingService):
         """
         fc_rq = fcmodel_requests.DerivativePosition(self.account_id, True)
         try:
-            res = self._client.get_derivative_position(fc_rq)
+            res = self._request(self._client.get_derivative_position, fc_rq)
             if res['message'].lower() == 'success':
                 return {position['instrumentID']:  StockPosition(
                     market_id=self._market_id,
@@ -193,6 +201,7 @@ class FutureTradingService(BaseTradingService):
             logging.error(f"Error while getting closed positions: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def closed_positions(self) -> Union[Dict[str, StockPosition], None]:
         """
         message: "Success",
@@ -218,7 +227,7 @@ class FutureTradingService(BaseTradingService):
         """
         fc_rq = fcmodel_requests.DerivativePosition(self.account_id, True)
         try:
-            res = self._client.get_derivative_position(fc_rq)
+            res = self._request(self._client.get_derivative_position, fc_rq)
             if res['message'].lower() == 'success':
                 return {position['instrumentID']: StockPosition(
                     market_id=self._market_id, account_id=self.account_id,
@@ -233,6 +242,7 @@ class FutureTradingService(BaseTradingService):
             logging.error(f"Error while getting closed positions: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def max_buy_sell_qty(self, symbol, price, order_side) -> Union[MaxBuySellQty, None]:
         """
         message: "Success",
@@ -250,7 +260,7 @@ class FutureTradingService(BaseTradingService):
         """
         fc_rq = fcmodel_requests.MaxBuyQty(self.account_id, symbol, price)
         try:
-            res = self._client.get_max_buy_qty(fc_rq)
+            res = self._request(self._client.get_max_buy_qty, fc_rq)
             if res['message'].lower() == 'success':
                 data = res['data']
                 return MaxBuySellQty(
@@ -265,7 +275,9 @@ class FutureTradingService(BaseTradingService):
 
     def __init__(self, config: TradingServiceConfig):
         super().__init__(config)
+        self._market_id = TradingMarket.FUTURE
 
+    @rate_limited(RequestPriority.ORDER)
     def create_order(self, order: CreatedOrder) -> Union[CreatedOrder, None]:
         """
         {
@@ -297,10 +309,11 @@ class FutureTradingService(BaseTradingService):
         """
         order.market_id = self._market_id
         order.account_id = self.account_id
+        request_id = generate_request_id()
         try:
             fc_req = fcmodel_requests.NewOrder(
                 account=order.account_id,
-                requestID=generate_request_id(),
+                requestID=request_id,
                 instrumentID=order.symbol,
                 market=order.market_id,
                 buySell=order.order_side,
@@ -316,12 +329,16 @@ class FutureTradingService(BaseTradingService):
                 lossStep=order.loss_step,
                 profitStep=order.profit_step
             )
-            res = self._client.der_new_order(fc_req)
-            return order if res['message'].lower() == "success" else None
+            res = self._request(self._client.der_new_order, fc_req)
+            if res['message'].lower() != "success":
+                return None
+            order.request_id = str((res.get('data') or dict()).get('requestID') or request_id)
+            return order
         except Exception as ex:
             logging.error(f"Error while creating order: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ORDER)
     def cancel_order(self, order) -> Union[CreatedOrder, None]:
         """
         {
@@ -357,12 +374,13 @@ class FutureTradingService(BaseTradingService):
         )
 
         try:
-            res = self._client.der_cancle_order(fc_rq)
+            res = self._request(self._client.der_cancle_order, fc_rq)
             return order if res['message'].lower() == "success" else None
         except Exception as ex:
             logging.error(f"Error while cancelling order: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ORDER)
     def modify_order(self, order: CreatedOrder, new_qty: int = 0, new_price: float = 0) -> Union[CreatedOrder, None]:
         """
         {
@@ -387,27 +405,31 @@ class FutureTradingService(BaseTradingService):
         :param new_price:
         :return:
         """
-        order.order_price = order.order_price or new_price
-        order.order_qty = order.order_qty or new_qty
-        order.market_id = self._market_id
-        order.account_id = self.account_id
-
+        # the order is only changed when the modification is accepted
+        price = new_price or order.order_price
+        qty = new_qty or order.order_qty
         fc_rq = fcmodel_requests.ModifyOrder(
-            account=order.account_id,
+            account=self.account_id,
             requestID=generate_request_id(),
             orderID=order.order_id,
-            marketID=order.market_id,
+            marketID=self._market_id,
             instrumentID=order.symbol,
-            price=order.order_price,
-            quantity=order.order_qty,
+            price=price,
+            quantity=qty,
             buySell=order.order_side,
             orderType=order.order_type,
             deviceId=self._device_id,
             userAgent=self._user_agent
         )
         try:
-            res = self._client.der_modify_order(fc_rq)
-            return order if res['message'].lower() == "success" else None
+            res = self._request(self._client.der_modify_order, fc_rq)
+            if res['message'].lower() != "success":
+                return None
+            order.order_price = price
+            order.order_qty = qty
+            order.market_id = self._market_id
+            order.account_id = self.account_id
+            return order
         except Exception as ex:
             logging.error(f"Error while modifying order: {ex}")
             return None
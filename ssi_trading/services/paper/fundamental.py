@@ -2,11 +2,11 @@ import datetime
 import logging
 from typing import Union, Dict, List
 
-from langchain_community.chains.llm_requests import DEFAULT_HEADERS
-
-from ssi_trading.config import PAPER_BASE_URL, TradingServiceConfig
+from ssi_trading.config import PAPER_BASE_URL, PAPER_REQUEST_HEADERS, TradingServiceConfig
 from ssi_trading.models.trading import StockPosition, AccountBalance, CreatedOrder, MaxBuySellQty
 from ssi_trading.services.client import BaseTradingService
+from ssi_trading.limiter import rate_limited
+from ssi_trading.models.definitions import RequestPriority
 
 
 class PaperFundamentalTradingService(BaseTradingService):
@@ -15,7 +15,8 @@ class PaperFundamentalTradingService(BaseTradingService):
         super().__init__(config)
         # setup paper api
         self._base_url = PAPER_BASE_URL
-        self._request_headers = DEFAULT_HEADERS
+        # copied, the authorization header belongs to this account
+        self._request_headers = dict(PAPER_REQUEST_HEADERS)
         self._request_headers["Authorization"] = f"Bearer {self._account_token}"
 
         # create static url
@@ -27,6 +28,7 @@ class PaperFundamentalTradingService(BaseTradingService):
         self.position_url = f"{PAPER_BASE_URL}/demo-trading/stock-position"
         self.max_buy_sell_url = f"{PAPER_BASE_URL}/demo-trading/max-buy-sell"
 
+    @rate_limited(RequestPriority.ORDER)
     def create_order(self, order: CreatedOrder) -> Union[CreatedOrder, None]:
         order.market_id = self._market_id
         order.account_id = self.account_id
@@ -53,6 +55,7 @@ class PaperFundamentalTradingService(BaseTradingService):
             logging.exception(ex)
             return None
 
+    @rate_limited(RequestPriority.ORDER)
     def cancel_order(self, order) -> Union[CreatedOrder, None]:
         order.market_id = self._market_id
         order.account_id = self.account_id
@@ -73,6 +76,7 @@ class PaperFundamentalTradingService(BaseTradingService):
             logging.exception(ex)
             return None
 
+    @rate_limited(RequestPriority.ORDER)
     def modify_order(self, order: CreatedOrder, new_qty: int = 0, new_price: float = 0) -> Union[CreatedOrder, None]:
         order.order_price = order.order_price or new_price
         order.order_qty = order.order_qty or new_qty
@@ -100,6 +104,7 @@ class PaperFundamentalTradingService(BaseTradingService):
             logging.exception(f"Error while modifying order: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def account_balance(self) -> Union[AccountBalance, None]:
         params = {"account": self.account_id}
         response = self._client.get(self.account_balance_url, headers=self._request_headers, params=params)
@@ -123,6 +128,7 @@ class PaperFundamentalTradingService(BaseTradingService):
             logging.exception(ex)
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def current_positions(self) -> Union[Dict[str, StockPosition], None]:
         response = self._client.get(self.position_url, headers=self._request_headers,
                                     params={"account": self.account_id})
@@ -148,6 +154,7 @@ class PaperFundamentalTradingService(BaseTradingService):
     def closed_positions(self) -> Union[Dict[str, StockPosition], None]:
         return self.current_positions()
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def max_buy_sell_qty(self, symbol, price, order_side) -> Union[MaxBuySellQty, None]:
         params = {
             "stockSymbol": symbol,
@@ -170,6 +177,7 @@ class PaperFundamentalTradingService(BaseTradingService):
             logging.exception(f"Error while getting max buy sell qty: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def order_history(self, order_status=None, start_date=None, end_date=None, page=1, page_size=20) -> Union[
         List[CreatedOrder], None]:
         if start_date is None:
@@ -4,14 +4,14 @@ import datetime
 import logging
 from typing import Union, Dict, List
 
-from langchain_community.chains.llm_requests import DEFAULT_HEADERS
-
-from ssi_trading.config import TradingServiceConfig, PAPER_BASE_URL
+from ssi_trading.config import TradingServiceConfig, PAPER_BASE_URL, PAPER_REQUEST_HEADERS
 from ssi_trading.models.trading import (
     CreatedOrder, MaxBuySellQty, StockPosition,
     AccountBalance,
 )
 from ssi_trading.services.client import BaseTradingService
+from ssi_trading.limiter import rate_limited
+from ssi_trading.models.definitions import RequestPriority
 
 
 class PaperFutureTradingService(BaseTradingService):
@@ -20,7 +20,8 @@ class PaperFutureTradingService(BaseTradingService):
         super().__init__(config)
         # setup paper api
         self._base_url = PAPER_BASE_URL
-        self._request_headers = DEFAULT_HEADERS
+        # copied, the authorization header belongs to this account
+        self._request_headers = dict(PAPER_REQUEST_HEADERS)
         self._request_headers["Authorization"] = f"Bearer {self._account_token}"
 
         # create static url
@@ -32,6 +33,7 @@ class PaperFutureTradingService(BaseTradingService):
         self.position_url = f"{PAPER_BASE_URL}/demo-trading/stock-derivative"
         self.max_buy_sell_url = f"{PAPER_BASE_URL}/demo-trading/max-buy-sell"
 
+    @rate_limited(RequestPriority.ORDER)
     def create_order(self, order: CreatedOrder) -> Union[CreatedOrder, None]:
         order.market_id = self._market_id
         order.account_id = self.account_id
@@ -63,6 +65,7 @@ class PaperFutureTradingService(BaseTradingService):
             logging.exception(ex)
             return None
 
+    @rate_limited(RequestPriority.ORDER)
     def cancel_order(self, order) -> Union[CreatedOrder, None]:
         order.market_id = self._market_id
         order.account_id = self.account_id
@@ -83,6 +86,7 @@ class PaperFutureTradingService(BaseTradingService):
             logging.exception(ex)
             return None
 
+    @rate_limited(RequestPriority.ORDER)
     def modify_order(self, order: CreatedOrder, new_qty: int = 0, new_price: float = 0) -> Union[CreatedOrder, None]:
         order.order_price = order.order_price or new_price
         order.order_qty = order.order_qty or new_qty
@@ -110,6 +114,7 @@ class PaperFutureTradingService(BaseTradingService):
             logging.exception(f"Error while modifying order: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def account_balance(self) -> Union[AccountBalance, None]:
         params = {"account": self.account_id}
         response = self._client.get(self.account_balance_url, headers=self._request_headers, params=params)
@@ -133,6 +138,7 @@ class PaperFutureTradingService(BaseTradingService):
             logging.exception(ex)
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def current_positions(self) -> Union[Dict[str, StockPosition], None]:
         response = self._client.get(self.position_url, headers=self._request_headers, params={"account": self.account_id})
         response.raise_for_status()
@@ -154,6 +160,7 @@ class PaperFutureTradingService(BaseTradingService):
             logging.exception(f"Error while getting current positions: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def closed_positions(self) -> Union[Dict[str, StockPosition], None]:
         response = self._client.get(self.position_url, headers=self._request_headers, params={"account": self.account_id})
         response.raise_for_status()
@@ -176,6 +183,7 @@ class PaperFutureTradingService(BaseTradingService):
             logging.exception(f"Error while getting closed positions: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def max_buy_sell_qty(self, symbol, price, order_side) -> Union[MaxBuySellQty, None]:
         params = {
             "stockSymbol": symbol,
@@ -198,6 +206,7 @@ class PaperFutureTradingService(BaseTradingService):
             logging.exception(f"Error while getting max buy sell qty: {ex}")
             return None
 
+    @rate_limited(RequestPriority.ACCOUNT)
     def order_history(self, order_status=None, start_date=None, end_date=None, page=1, page_size=20) -> Union[List[CreatedOrder], None]:
         if start_date is None:
             start_date = datetime.datetime.now().strftime("%d/%m/%Y")
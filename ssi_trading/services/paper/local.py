@@ -0,0 +1,508 @@
+# Description: Local paper trading, orders are matched in memory against the market data stream.
+# No request is sent to the SSI demo-trading api, positions, balance and pnl are kept by a Ledger.
+import copy
+import itertools
+import logging
+import threading
+from typing import Union, Dict, List, Callable
+
+from ssi_trading.config import TradingServiceConfig
+from ssi_trading.ledger import Ledger
+from ssi_trading.models.data import CurrentMarket, MarketDepth
+from ssi_trading.models.definitions import TradingMarket, OrderSide, OrderStatus, OrderType, SecurityMarket
+from ssi_trading.models.trading import CreatedOrder, AccountBalance, StockPosition, MaxBuySellQty
+from ssi_trading.services.client import BaseTradingService
+from ssi_trading.services.stream import BaseDataStream
+from ssi_trading.utils import tick_size, lot_size
+
+# exchange name of the market data stream
+_EXCHANGES = {
+    "HOSE": SecurityMarket.HOSE,
+    "HNX": SecurityMarket.HNX,
+    "UPCOM": SecurityMarket.UPCOM,
+    "DERIVATIVES": SecurityMarket.DER,
+}
+
+
+class LocalMatchingEngine:
+    def __init__(self, ledger: Ledger, market: str = SecurityMarket.DER, markets: Dict[str, str] = None, allow_short: bool = True):
+        """
+        Match orders against the quotes of the market data stream, the engine is a price taker:
+        displayed volume is consumed by our orders but the book itself is never changed.
+        LO orders rest until the book or a trade crosses their price, MAK orders take the book and the rest is killed,
+        ATO orders fill at the open when the ATO session ends and ATC orders at the close when the ATC session ends.
+        :param ledger: cash and positions of the account
+        :param market: default SecurityMarket of symbols without exchange info, used for tick and lot checks
+        :param markets: SecurityMarket by symbol
+        :param allow_short: False for stock accounts, sell orders are limited by the position
+        """
+        self.ledger = ledger
+        self.market = market
+        self.allow_short = allow_short
+        self._markets: Dict[str, str] = dict(markets or {})
+
+        self._lock = threading.RLock()
+        self._order_ids = itertools.count(1)
+        self._orders: Dict[str, CreatedOrder] = dict()
+        self._working: Dict[str, List[CreatedOrder]] = dict()
+        self._quotes: Dict[str, CurrentMarket] = dict()
+        self._depth: Dict[str, MarketDepth] = dict()
+        # volume taken by our orders at each price of the current quote
+        self._taken: Dict[str, Dict[float, float]] = dict()
+        self._fills = []
+        self._listeners: List[Callable[[CreatedOrder], None]] = []
+
+    def add_listener(self, callback: Callable[[CreatedOrder], None]):
+        """
+        Register a callback called with a copy of the order after each status change or fill
+        :param callback:
+        :return:
+        """
+        self._listeners.append(callback)
+        return self
+
+    def _notify(self, orders: List[CreatedOrder]):
+        for order in orders:
+            for callback in self._listeners:
+                try:
+                    callback(order)
+                except Exception as ex:
+                    logging.exception(f"Error in order listener {callback}: {ex}")
+
+    # region market
+    def market_of(self, symbol: str) -> str:
+        return self._markets.get(symbol, self.market)
+
+    def last_price(self, symbol: str) -> float:
+        quote = self._quotes.get(symbol)
+        return quote.current_price if quote is not None else 0.0
+
+    def on_market(self, symbol: str, current: CurrentMarket, depth: MarketDepth = None):
+        """
+        Update the quote of a symbol and match its working orders
+        :param symbol:
+        :param current:
+        :param depth: full depth when available, top of book of current is used otherwise
+        :return:
+        """
+        with self._lock:
+            prev = self._quotes.get(symbol)
+            prev_session = prev.trading_session if prev is not None else ""
+            self._quotes[symbol] = current
+            self._depth[symbol] = depth
+            self._taken[symbol] = dict()
+            if depth is not None and depth.exchange in _EXCHANGES:
+                self._markets.setdefault(symbol, _EXCHANGES[depth.exchange])
+
+            updated = []
+            for order in list(self._working.get(symbol, [])):
+                filled = 0
+                if order.order_type == OrderType.LIMIT:
+                    # a resting order fills at its own price, once per tick either from the book or a trade
+                    filled = self._take(order, order.order_price, order.order_price)
+                    if not filled:
+                        filled = self._trade_through(order, current)
+                elif order.order_type == OrderType.ATO and current.trading_session != OrderType.ATO:
+                    filled = self._auction(order, current.open_price or current.current_price)
+                elif order.order_type == OrderType.ATC and prev_session == OrderType.ATC and current.trading_session != OrderType.ATC:
+                    filled = self._auction(order, current.current_price)
+                if filled:
+                    updated.append(copy.copy(order))
+        self._notify(updated)
+
+    def close_session(self, symbol: str = None):
+        """
+        End of day: auction orders are filled at the last price, other working orders expire
+        :param symbol: default all symbols
+        :return:
+        """
+        with self._lock:
+            updated = []
+            symbols = [symbol] if symbol is not None else list(self._working.keys())
+            for name in symbols:
+                for order in list(self._working.get(name, [])):
+                    if order.order_type in (OrderType.ATO, OrderType.ATC) and self.last_price(name):
+                        self._auction(order, self.last_price(name))
+                    else:
+                        order.order_status = OrderStatus._EXPIRED
+                        self._remove(order)
+                    updated.append(copy.copy(order))
+        self._notify(updated)
+    # endregion
+
+    # region orders
+    def submit(self, order: CreatedOrder) -> CreatedOrder:
+        """
+        Validate an order, match it against the current quote and keep the rest working
+        :param order:
+        :return: a copy of the order with order id and status
+        """
+        with self._lock:
+            order = copy.copy(order)
+            order.order_id = str(next(self._order_ids))
+            order.os_qty = order.order_qty
+            order.filled_qty = 0
+            order.avg_price = 0
+            self._orders[order.order_id] = order
+
+            if not self._validate(order):
+                order.order_status = OrderStatus._REJECTED
+            else:
+                order.order_status = OrderStatus._QUEUE_IN_EXCH
+                self._working.setdefault(order.symbol, []).append(order)
+                if order.order_type == OrderType.LIMIT:
+                    self._take(order, order.order_price)
+                elif order.order_type == OrderType.MARKET:
+                    quote = self._quotes[order.symbol]
+                    limit = quote.ceiling_price if order.order_side == OrderSide.BUY else quote.floor_price
+                    self._take(order, limit or None)
+                    if order.os_qty > 0:
+                        # immediate or cancel, the rest is killed
+                        self._kill(order)
+            result = copy.copy(order)
+        self._notify([result])
+        return result
+
+    def cancel(self, order_id: str) -> Union[CreatedOrder, None]:
+        with self._lock:
+            order = self._orders.get(order_id)
+            if order is None or order.order_status not in OrderStatus.WORKING_ORDERS:
+                return None
+            self._kill(order)
+            result = copy.copy(order)
+        self._notify([result])
+        return result
+
+    def modify(self, order_id: str, new_qty: int = 0, new_price: float = 0) -> Union[CreatedOrder, None]:
+        """
+        Change quantity or price of a working LO order, the order keeps its id and is matched again
+        :param order_id:
+        :param new_qty: total quantity, including the filled quantity
+        :param new_price:
+        :return:
+        """
+        with self._lock:
+            order = self._orders.get(order_id)
+            if order is None or order.order_status not in OrderStatus.WORKING_ORDERS or order.order_type != OrderType.LIMIT:
+                return None
+            new_qty = new_qty or order.order_qty
+            new_price = new_price or order.order_price
+            if new_qty <= order.filled_qty or not self._valid_price(order.symbol, new_price):
+                return None
+            if new_qty % lot_size(self.market_of(order.symbol)) != 0:
+                return None
+            order.order_qty = new_qty
+            order.order_price = new_price
+            order.os_qty = new_qty - order.filled_qty
+            self._take(order, order.order_price)
+            result = copy.copy(order)
+        self._notify([result])
+        return result
+
+    def orders(self) -> List[CreatedOrder]:
+        with self._lock:
+            return [copy.copy(order) for order in self._orders.values()]
+
+    def fills(self) -> List[tuple]:
+        """
+        :return: list of (trading_time, symbol, order_side, qty, price, order_id)
+        """
+        with self._lock:
+            return list(self._fills)
+
+    def pending_qty(self, symbol: str, order_side: str) -> float:
+        return sum(order.os_qty for order in self._working.get(symbol, []) if order.order_side == order_side)
+    # endregion
+
+    # region matching
+    def _valid_price(self, symbol: str, price: float) -> bool:
+        ticks = tick_size(price, self.market_of(symbol))
+        if price <= 0 or abs(price / ticks - round(price / ticks)) > 1e-6:
+            return False
+        quote = self._quotes.get(symbol)
+        if quote is not None and quote.floor_price and quote.ceiling_price:
+            return quote.floor_price <= price <= quote.ceiling_price
+        return True
+
+    def _validate(self, order: CreatedOrder) -> bool:
+        market = self.market_of(order.symbol)
+        if order.order_qty <= 0 or order.order_qty % lot_size(market) != 0:
+            return False
+        if order.order_type == OrderType.LIMIT and not self._valid_price(order.symbol, order.order_price):
+            return False
+        if order.order_type == OrderType.MARKET and order.symbol not in self._quotes:
+            return False
+
+        position = self.ledger.position(order.symbol)
+        if order.order_side == OrderSide.SELL and not self.allow_short:
+            return order.order_qty <= position - self.pending_qty(order.symbol, OrderSide.SELL)
+
+        # orders closing a position never need buying power
+        signed_qty = order.order_qty if order.order_side == OrderSide.BUY else -order.order_qty
+        if position * signed_qty < 0 and abs(signed_qty) <= abs(position):
+            return True
+        required = order.order_qty * self._order_price(order) * self.ledger.multiplier * self.ledger.margin_rate
+        return required <= self.buying_power()
+
+    def _order_price(self, order: CreatedOrder) -> float:
+        # orders without limit are valued at the ceiling for buys, the last price otherwise
+        if order.order_type == OrderType.LIMIT:
+            return order.order_price
+        price = self.last_price(order.symbol)
+        quote = self._quotes.get(order.symbol)
+        if quote is not None and order.order_side == OrderSide.BUY:
+            price = quote.ceiling_price or price
+        return price
+
+    def reserved_cash(self) -> float:
+        """
+        Buying power held by the working orders opening a position
+        :return:
+        """
+        reserved = 0.0
+        for symbol, orders in self._working.items():
+            position = self.ledger.position(symbol)
+            for order_side, sign in ((OrderSide.BUY, 1), (OrderSide.SELL, -1)):
+                # the part closing the current position needs no buying power
+                closing = max(0.0, -sign * position)
+                for order in orders:
+                    if order.order_side != order_side:
+                        continue
+                    qty = max(0.0, order.os_qty - closing)
+                    closing = max(0.0, closing - order.os_qty)
+                    reserved += qty * self._order_price(order) * self.ledger.multiplier * self.ledger.margin_rate
+        return reserved
+
+    def buying_power(self) -> float:
+        return self.ledger.buying_power(self.last_price) - self.reserved_cash()
+
+    def _levels(self, order: CreatedOrder):
+        depth = self._depth.get(order.symbol)
+        quote = self._quotes.get(order.symbol)
+        if order.order_side == OrderSide.BUY:
+            if depth is not None and depth.ask_prices:
+                return zip(depth.ask_prices, depth.ask_volumes)
+            return [(quote.ask_price_01, quote.ask_volume_01)] if quote is not None else []
+        if depth is not None and depth.bid_prices:
+            return zip(depth.bid_prices, depth.bid_volumes)
+        return [(quote.bid_price_01, quote.bid_volume_01)] if quote is not None else []
+
+    def _take(self, order: CreatedOrder, limit: Union[float, None], fill_price: float = None) -> float:
+        # take the opposite side of the book up to the limit price, None means no limit,
+        # fills are at the book prices unless fill_price is given
+        filled = 0
+        taken = self._taken.setdefault(order.symbol, dict())
+        for price, volume in self._levels(order):
+            if order.os_qty <= 0 or not price:
+                break
+            if limit is not None and (price > limit if order.order_side == OrderSide.BUY else price < limit):
+                break
+            # no volume means the stream has no depth, the level is not limited
+            available = volume - taken.get(price, 0.0) if volume else order.os_qty
+            qty = min(order.os_qty, int(available))
+            if qty <= 0:
+                continue
+            taken[price] = taken.get(price, 0.0) + qty
+            self._fill(order, qty, price if fill_price is None else fill_price)
+            filled += qty
+        return filled
+
+    def _trade_through(self, order: CreatedOrder, current: CurrentMarket) -> float:
+        # a trade at a worse price than a resting order means the order was reached in the queue
+        if order.os_qty <= 0 or not current.current_volume or not current.current_price:
+            return 0
+        if order.order_side == OrderSide.BUY and current.current_price >= order.order_price:
+            return 0
+        if order.order_side == OrderSide.SELL and current.current_price <= order.order_price:
+            return 0
+        qty = min(order.os_qty, int(current.current_volume))
+        if qty > 0:
+            self._fill(order, qty, order.order_price)
+        return qty
+
+    def _auction(self, order: CreatedOrder, price: float) -> float:
+        if not price:
+            return 0
+        qty = order.os_qty
+        self._fill(order, qty, price)
+        return qty
+
+    def _fill(self, order: CreatedOrder, qty: float, price: float):
+        price = float(price)
+        self.ledger.apply_fill(order.symbol, order.order_side, qty, price)
+        order.avg_price = (order.avg_price * order.filled_qty + price * qty) / (order.filled_qty + qty)
+        order.filled_qty += qty
+        order.os_qty -= qty
+        if order.os_qty <= 0:
+            order.order_status = OrderStatus._FULLY_FILLED
+            self._remove(order)
+        else:
+            order.order_status = OrderStatus._PARTIALLY_FILLED
+        quote = self._quotes.get(order.symbol)
+        self._fills.append((quote.trading_time if quote else "", order.symbol, order.order_side, qty, price, order.order_id))
+
+    def _kill(self, order: CreatedOrder):
+        order.order_status = OrderStatus._FULLY_FILLED_PARTIALLY_CANCELLED if order.filled_qty > 0 else OrderStatus._CANCELLED
+        order.os_qty = 0
+        self._remove(order)
+
+    def _remove(self, order: CreatedOrder):
+        working = self._working.get(order.symbol, [])
+        if order in working:
+            working.remove(order)
+    # endregion
+
+
+class LocalPaperTradingService(BaseTradingService):
+    def __init__(
+            self,
+            stream: BaseDataStream = None,
+            account_id: str = "LOCAL",
+            account_type: str = "future",
+            initial_cash: float = 1e9,
+            multiplier: float = 1.0,
+            margin_rate: float = 1.0,
+            fee_rate: float = 0.0
+    ):
+        """
+        Drop-in replacement of the paper trading services, orders never leave the process
+        :param stream: MarketDataStream or BacktestDataStream of the traded symbols, see attach
+        :param account_id:
+        :param account_type: fundamental or future
+        :param initial_cash:
+        :param multiplier: contract multiplier, 100000 for VN30F
+        :param margin_rate: initial margin rate of futures, 1 for stocks
+        :param fee_rate: fee on traded value
+        """
+        # paper trading config, the service never calls the network
+        super().__init__(TradingServiceConfig(
+            consumer_id="local",
+            consumer_secret="local",
+            account_id=account_id,
+            account_type=account_type,
+            paper_trading=True
+        ))
+        future = account_type == "future"
+        self._market_id = TradingMarket.FUTURE if future else TradingMarket.STOCK
+        self.ledger = Ledger(initial_cash, multiplier, margin_rate, fee_rate)
+        self.engine = LocalMatchingEngine(
+            self.ledger, market=SecurityMarket.DER if future else SecurityMarket.HOSE, allow_short=future
+        )
+        if stream is not None:
+            self.attach(stream)
+
+    def attach(self, stream: BaseDataStream):
+        """
+        Match orders on each tick of a market data stream
+        :param stream:
+        :return:
+        """
+        def on_tick(symbol, current):
+            if isinstance(current, CurrentMarket):
+                self.engine.on_market(symbol, current, stream.get_depth(symbol))
+
+        stream.add_listener(on_tick)
+        return self
+
+    def create_order(self, order: CreatedOrder) -> Union[CreatedOrder, None]:
+        order.market_id = self._market_id
+        order.account_id = self.account_id
+        created = self.engine.submit(order)
+        order.order_id = created.order_id
+        order.order_status = created.order_status
+        order.filled_qty = created.filled_qty
+        order.os_qty = created.os_qty
+        order.avg_price = created.avg_price
+        return order if created.order_status not in OrderStatus.REJECT_ORDERS else None
+
+    def cancel_order(self, order) -> Union[CreatedOrder, None]:
+        cancelled = self.engine.cancel(order.order_id)
+        if cancelled is None:
+            return None
+        order.order_status = cancelled.order_status
+        order.filled_qty = cancelled.filled_qty
+        order.os_qty = 0
+        return order
+
+    def modify_order(self, order: CreatedOrder, new_qty: int = 0, new_price: float = 0) -> Union[CreatedOrder, None]:
+        modified = self.engine.modify(order.order_id, new_qty, new_price)
+        if modified is None:
+            return None
+        order.order_qty = modified.order_qty
+        order.order_price = modified.order_price
+        order.order_status = modified.order_status
+        return order
+
+    def account_balance(self) -> Union[AccountBalance, None]:
+        last_price = self.engine.last_price
+        with self.engine._lock:
+            trading_pl = self.ledger.realized_pnl()
+            floating_pl = self.ledger.floating_pnl(last_price)
+            buying_power = self.engine.buying_power()
+            return AccountBalance(
+                account_id=self.account_id,
+                market_id=self._market_id,
+                balance=self.ledger.cash,
+                trading_pl=trading_pl,
+                floating_pl=floating_pl,
+                total_pl=trading_pl + floating_pl,
+                ee=buying_power,
+                nav=self.ledger.equity(last_price),
+                withdrawable=max(0.0, buying_power),
+                fee=0,
+                interest=0,
+                commission=0
+            )
+
+    def max_buy_sell_qty(self, symbol, price, order_side) -> Union[MaxBuySellQty, None]:
+        price = price or self.engine.last_price(symbol)
+        if not price:
+            return None
+        with self.engine._lock:
+            power = self.engine.buying_power()
+            if order_side == OrderSide.SELL and not self.engine.allow_short:
+                max_qty = self.ledger.position(symbol) - self.engine.pending_qty(symbol, OrderSide.SELL)
+            else:
+                max_qty = max(0.0, power) // (price * self.ledger.multiplier * self.ledger.margin_rate)
+        lot = lot_size(self.engine.market_of(symbol))
+        return MaxBuySellQty(
+            account_id=self.account_id,
+            market_id=self._market_id,
+            symbol=symbol,
+            max_qty=int(max(0, max_qty) // lot * lot),
+            power=power
+        )
+
+    def _position(self, symbol: str) -> StockPosition:
+        return StockPosition(
+            account_id=self.account_id,
+            market_id=self._market_id,
+            symbol=symbol,
+            position=self.ledger.position(symbol),
+            trading_pl=self.ledger.realized_pnl(symbol),
+            floating_pl=self.ledger.floating_pnl(self.engine.last_price, symbol),
+            market_price=self.engine.last_price(symbol),
+            avg_price=self.ledger.avg_price(symbol)
+        )
+
+    def current_positions(self) -> Union[Dict[str, StockPosition], None]:
+        with self.engine._lock:
+            return {
+                symbol: self._position(symbol)
+                for symbol, position in self.ledger.positions().items() if position != 0
+            }
+
+    def closed_positions(self) -> Union[Dict[str, StockPosition], None]:
+        with self.engine._lock:
+            return {
+                symbol: self._position(symbol)
+                for symbol, position in self.ledger.positions().items() if position == 0
+            }
+
+    def order_history(self, order_status=None, start_date=None, end_date=None, page=1, page_size=50) -> Union[List[CreatedOrder], None]:
+        statuses = set(order_status.split(",")) if order_status else None
+        orders = [order for order in self.engine.orders() if statuses is None or order.order_status in statuses]
+        for order in orders:
+            order.account_id = self.account_id
+            order.market_id = self._market_id
+        return orders
@@ -1,20 +1,37 @@
 import json
 import logging
-from typing import Union, List, Dict, Generic, TypeVar
+import queue
+import threading
+import time
+from typing import Union, List, Dict, Generic, TypeVar, Callable, Tuple, TYPE_CHECKING
 import sys
 
-from pandas import DataFrame
-from ssi_fc_data.fc_md_client import MarketDataClient
-from ssi_fc_data.fc_md_stream import MarketDataStream
-from ssi_fctrading import FCTradingClient, FCTradingStream
+from ssi_trading.config import TradingServiceConfig, DataServiceConfig, STREAM_RECONNECT_DELAY, STREAM_RECONNECT_MAX_DELAY
+from ssi_trading.factory import create_market_data_client, create_trading_client, trading_request_lock
+from ssi_trading.models.definitions import ConflationMode, StreamEvent
+from ssi_trading.services.stream.sequencer import Sequencer
 
-from ssi_trading.config import TradingServiceConfig, DataServiceConfig
-from ssi_trading.factory import create_market_data_client
+if TYPE_CHECKING:
+    # pandas and pyarrow are imported on the first read of the stored data, live streams only append rows
+    from pandas import DataFrame
+    # the sdk streams are imported on start, replayed streams never import them
+    from ssi_fc_data.fc_md_client import MarketDataClient
+    from ssi_fc_data.fc_md_stream import MarketDataStream
+    from ssi_fctrading import FCTradingClient, FCTradingStream
 
 
 T = TypeVar("T")
 
 
+class _ConflationPolicy:
+    def __init__(self, mode: str = ConflationMode.ALL, interval_ms: float = 100, fields: Tuple[str, ...] = ()):
+        if mode not in (ConflationMode.ALL, ConflationMode.INTERVAL, ConflationMode.ON_CHANGE):
+            raise ValueError(f"Conflation mode {mode} is not supported.")
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self.fields = tuple(fields)
+
+
 class BaseTradingStream(Generic[T]):
     def __init__(self, config: TradingServiceConfig):
         logging.debug(f"Init trading with config: {config}")
@@ -23,42 +40,152 @@ class BaseTradingStream(Generic[T]):
         self.account_id = self._config.account_id
         self.account_type = self._config.account_type
         if not self._config.paper_trading:
-            self._client = FCTradingClient(
-                self._config.Url, self._config.ConsumerID,
-                self._config.ConsumerSecret, self._config.PrivateKey,
-                self._config.TwoFAType
-            )
+            self._client: "FCTradingClient" = create_trading_client(self._config)
         else:
             logging.debug("Paper trading is not supported for trading stream.")
-        self._streamer: Union[FCTradingStream, None] = None
+        self._streamer: Union["FCTradingStream", None] = None
+
+        # last processed notification, the stream resumes from it after a reconnect
+        self._last_notify_id = int(self._config.NotifyId)
+        # decoded events are dispatched on their own thread, the connection thread never runs a listener
+        self._listeners: List[Tuple[Callable[[T], None], Union[frozenset, None]]] = []
+        self._events: "queue.Queue" = queue.Queue()
+        self._dispatcher: Union[threading.Thread, None] = None
+        self._reconnect_lock = threading.Lock()
+        self._reconnecting = False
+        self._stopped = False
+
+    @property
+    def last_notify_id(self) -> int:
+        return self._last_notify_id
+
+    def add_listener(self, callback: Callable[[T], None], events: List[str] = None):
+        """
+        Register a callback called with each decoded event, on the dispatch thread
+        :param callback:
+        :param events: TradingEvent types, default all events
+        :return:
+        """
+        self._listeners.append((callback, frozenset(events) if events else None))
+        return self
+
+    def remove_listener(self, callback: Callable[[T], None]):
+        self._listeners = [(cb, events) for cb, events in self._listeners if cb != callback]
+        return self
+
+    def decode(self, message) -> List[T]:
+        raise NotImplementedError("Method decode is not implemented yet.")
 
     def on_message(self, message):
-        logging.info(message)
+        logging.debug(f"Recv trading message: {message}")
+        try:
+            events = self.decode(message)
+        except Exception as ex:
+            logging.exception(f"Error while decoding trading message {message}: {ex}")
+            return
+        for event in events:
+            self._events.put(event)
+
+    def _dispatch(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            event_type = getattr(event, "EVENT_TYPE", None)
+            for callback, events in self._listeners:
+                if events is not None and event_type not in events:
+                    continue
+                try:
+                    callback(event)
+                except Exception as ex:
+                    logging.exception(f"Error in trading stream listener {callback}: {ex}")
 
     def on_error(self, error):
         logging.error(f"Stream {self._config.StreamURL} problem. Error while receiving message: {error}")
-        sys.exit(1)
+        self._reconnect()
+
+    def on_close(self):
+        if not self._stopped:
+            logging.warning(f"Trading stream of {self.account_id} is closed.")
+            self._reconnect()
+
+    def _reconnect(self):
+        with self._reconnect_lock:
+            if self._reconnecting or self._stopped:
+                return
+            self._reconnecting = True
+        threading.Thread(target=self._reconnect_loop, name=f"ssi-trading-reconnect-{self.account_id}", daemon=True).start()
+
+    def _reconnect_loop(self):
+        delay = STREAM_RECONNECT_DELAY
+        try:
+            while not self._stopped:
+                time.sleep(delay)
+                self._close_connection()
+                try:
+                    self._connect()
+                    logging.info(f"Trading stream of {self.account_id} reconnected from notify id {self._last_notify_id}")
+                    return
+                except Exception as ex:
+                    logging.error(f"Trading stream of {self.account_id} failed to reconnect: {ex}")
+                    delay = min(delay * 2, STREAM_RECONNECT_MAX_DELAY)
+        finally:
+            with self._reconnect_lock:
+                self._reconnecting = False
+
+    def _connect(self):
+        from ssi_fctrading import FCTradingStream
+        self._streamer = FCTradingStream(
+            fctrading_client=self._client,
+            stream_url=self._config.StreamURL,
+            last_notify_id=str(self._last_notify_id),
+            on_message=self.on_message,
+            on_error=self.on_error,
+            on_close=self.on_close
+        )
+        # start reads the token of the shared client, an expired one is renewed with the shared headers
+        with trading_request_lock(self._config):
+            self._client.get_access_token()
+        self._streamer.start()
+
+    def _close_connection(self):
+        streamer, self._streamer = self._streamer, None
+        connection = getattr(streamer, "connection", None)
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception as ex:
+                logging.debug(f"Error while closing trading stream connection: {ex}")
 
     def start_stream(self):
         if self._config.paper_trading:
             logging.warning("Paper trading is not supported for trading stream.")
         else:
             if self._streamer is None:
-                # stream channel
-                self._streamer = FCTradingStream(
-                    fctrading_client=self._client,
-                    stream_url=self._config.StreamURL,
-                    last_notify_id=self._config.NotifyId.__str__(),
-                    on_message=self.on_message,
-                    on_error=self.on_error
-                )
+                self._stopped = False
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(target=self._dispatch, name=f"ssi-trading-{self.account_id}", daemon=True)
+                    self._dispatcher.start()
                 logging.info(f"Start stream : {self._config.StreamURL}")
-                self._streamer.start()
+                self._connect()
             else:
-                logging.warning("Data stream is already started.")
+                logging.warning("Trading stream is already started.")
+
+    def stop_stream(self):
+        self._stopped = True
+        self._close_connection()
+        if self._dispatcher is not None:
+            self._events.put(None)
+            self._dispatcher.join()
+            self._dispatcher = None
 
 
 class BaseDataStream(Generic[T]):
+    # fields compared by the on change conflation
+    CHANGE_FIELDS: Tuple[str, ...] = ()
+    # events stored in the DataFrame
+    STORED_EVENTS: Tuple[str, ...] = (StreamEvent.TRADE, StreamEvent.QUOTE)
+
     def __init__(self, config: DataServiceConfig, names: List[str], channel_name: str):
         """
         :param config: DataServiceConfig instance
@@ -74,30 +201,164 @@ class BaseDataStream(Generic[T]):
             raise ValueError("Index names must be provided or not equal to 'ALL'")
 
         self.channel_name = channel_name
-        self._streamer: Union[MarketDataStream, None] = None
+        self._streamer: Union["MarketDataStream", None] = None
 
-        self._df: Dict[str, DataFrame] = dict()
+        # stored rows, the DataFrame is built on read from the rows appended since the last read,
+        # then the rows are trimmed to the last one which ON_CHANGE compares to, _read rows are already in the DataFrame
+        self._rows: Dict[str, List[T]] = dict()
+        self._read: Dict[str, int] = dict()
+        self._df: Dict[str, "DataFrame"] = dict()
         self._current: Dict[str, T] = dict()
         # init
         for index_name in self._names:
-            self._df[index_name] = DataFrame()
+            self._rows[index_name] = []
             self._current[index_name] = self.create_instance()
+        self._store_lock = threading.Lock()
+
+        # conflation of the stored rows, by symbol or default
+        self._conflation: Dict[Union[str, None], _ConflationPolicy] = {None: _ConflationPolicy()}
+        self._pending: Dict[str, T] = dict()
+        self._last_stored_at: Dict[str, float] = dict()
 
         # store message
         self._message_type = None
         self._message_content = None
+        # callbacks on each update of the current data, with the events they receive
+        self._listeners: List[Tuple[Callable[[str, T], None], Union[frozenset, None]]] = []
+        self._sequencer = Sequencer()
+        self._stored_events = frozenset(self.STORED_EVENTS)
+
+        # client is created on start, replayed streams never connect
+        self._client: Union["MarketDataClient", None] = None
 
-        self._client: MarketDataClient = create_market_data_client(self._config)
+    def set_conflation(self, mode: str = ConflationMode.ALL, interval_ms: float = 100, symbols: List[str] = None, fields: List[str] = None):
+        """
+        Set how ticks are stored, the current data is always updated and listeners always notified
+        :param mode: ConflationMode.ALL, INTERVAL (latest state at most once per interval_ms) or ON_CHANGE
+        :param interval_ms: interval of the INTERVAL mode
+        :param symbols: default all symbols without their own policy
+        :param fields: fields compared by the ON_CHANGE mode, default CHANGE_FIELDS of the stream
+        :return:
+        """
+        policy = _ConflationPolicy(mode, interval_ms, fields or self.CHANGE_FIELDS)
+        for symbol in symbols or [None]:
+            self._conflation[symbol] = policy
+        return self
+
+    def _store(self, symbol: str, current: T):
+        policy = self._conflation.get(symbol) or self._conflation[None]
+        with self._store_lock:
+            rows = self._rows.setdefault(symbol, [])
+            if policy.mode == ConflationMode.INTERVAL:
+                now = time.monotonic()
+                if now - self._last_stored_at.get(symbol, float("-inf")) < policy.interval:
+                    # kept until the interval ends or the data is read
+                    self._pending[symbol] = current
+                    return
+                self._last_stored_at[symbol] = now
+                self._pending.pop(symbol, None)
+            elif policy.mode == ConflationMode.ON_CHANGE and rows:
+                last = rows[-1]
+                if all(getattr(last, name) == getattr(current, name) for name in policy.fields):
+                    return
+            rows.append(current)
 
-    def get_dataframe(self, symbol) -> DataFrame:
-        return self._df.get(symbol, DataFrame())
+    def get_dataframe(self, symbol) -> "DataFrame":
+        import pandas as pd
+        if symbol not in self._rows:
+            return self._df.get(symbol, pd.DataFrame())
+        with self._store_lock:
+            pending = self._pending.pop(symbol, None)
+            if pending is not None:
+                self._rows[symbol].append(pending)
+            rows = self._rows[symbol]
+            read = self._read.get(symbol, 0)
+            df = self._df.get(symbol, pd.DataFrame())
+            if read < len(rows):
+                new_data = pd.DataFrame(rows[read:])
+                df = new_data if df.empty else pd.concat([df, new_data], ignore_index=True)
+                self._df[symbol] = df
+                del rows[:-1]
+                self._read[symbol] = len(rows)
+        return df
 
     def get_current(self, symbol) -> T:
         return self._current.get(symbol, None)
 
+    def to_arrow(self, symbol: str = None):
+        """
+        Stored data as an arrow table, requires pyarrow
+        :param symbol: default all symbols of the stream
+        :return: pyarrow.Table
+        """
+        import pandas as pd
+        from ssi_trading.arrow import to_arrow
+        if symbol is not None:
+            return to_arrow(self.get_dataframe(symbol))
+        frames = [self.get_dataframe(name) for name in self._names]
+        frames = [df for df in frames if not df.empty]
+        return to_arrow(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame())
+
+    def to_parquet(self, path: str, symbol: str = None, compression: str = "zstd"):
+        from ssi_trading.arrow import to_parquet
+        return to_parquet(self.to_arrow(symbol), path, compression)
+
+    def get_depth(self, symbol):
+        # order book levels, only available on the market data channel
+        return None
+
     def create_instance(self):
         raise NotImplementedError("Method create_instance is not implemented yet.")
 
+    def add_listener(self, callback: Callable[[str, T], None], events: List[str] = None):
+        """
+        Register a callback called with (symbol, current) after each update, on the stream thread
+        :param callback:
+        :param events: StreamEvent.TRADE and/or StreamEvent.QUOTE, default all updates
+        :return:
+        """
+        self._listeners.append((callback, frozenset(events) if events else None))
+        return self
+
+    def remove_listener(self, callback: Callable[[str, T], None]):
+        self._listeners = [(cb, events) for cb, events in self._listeners if cb != callback]
+        return self
+
+    def _notify(self, symbol: str, current: T, event: str = StreamEvent.TRADE):
+        for callback, events in self._listeners:
+            if events is not None and event not in events:
+                continue
+            try:
+                callback(symbol, current)
+            except Exception as ex:
+                logging.exception(f"Error in {self.channel_name} listener {callback}: {ex}")
+
+    def _update(self, symbol: str, current: T, event: str):
+        # current data is exact, rows are stored by event and conflation policy
+        self._current[symbol] = current
+        if event in self._stored_events:
+            self._store(symbol, current)
+        self._notify(symbol, current, event)
+
+    def set_stored_events(self, events: List[str]):
+        """
+        :param events: StreamEvent.TRADE and/or StreamEvent.QUOTE stored in the DataFrame
+        :return:
+        """
+        self._stored_events = frozenset(events)
+        return self
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: messages by StreamEvent and stored rows
+        """
+        counters = self._sequencer.counters()
+        with self._store_lock:
+            counters["stored"] = sum(
+                len(self._df.get(symbol, ())) + len(rows) - self._read.get(symbol, 0) for symbol, rows in self._rows.items()
+            )
+        return counters
+
     def on_message(self, message):
         logging.debug(f"Recv message: {message}")
         message = json.loads(message) if isinstance(message, str) else message
@@ -113,6 +374,9 @@ class BaseDataStream(Generic[T]):
             logging.warning("No symbol is provided. Skip starting price stream.")
         else:
             if self._streamer is None:
+                if self._client is None:
+                    self._client = create_market_data_client(self._config)
+                from ssi_fc_data.fc_md_stream import MarketDataStream
                 # stream channel
                 self._streamer = MarketDataStream(self._config, self._client)
                 channel = f"{self.channel_name}:{'-'.join(self._names)}"
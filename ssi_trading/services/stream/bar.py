@@ -1,13 +1,11 @@
-import logging
-
-import pandas as pd
-
-from ssi_trading.models.definitions import DataChannel
+from ssi_trading.models.definitions import DataChannel, StreamEvent
 from ssi_trading.models.data import CurrentBar
 from ssi_trading.services.stream import BaseDataStream
 
 
 class BarDataStream(BaseDataStream[CurrentBar]):
+    CHANGE_FIELDS = ("close", "volume")
+
     def __init__(self, config):
         # the bar stream will receive OHLCV, example:
         """
@@ -25,7 +23,14 @@ class BarDataStream(BaseDataStream[CurrentBar]):
         super().on_message(message)
         # process message
         symbol = self._message_content["Symbol"]
-        prev = self._current[symbol]
+        # the volume of a bar is not cumulative, bars are keyed by time and OHLCV
+        event = self._sequencer.classify(
+            symbol, self._message_content["Time"], None,
+            (self._message_content["Open"], self._message_content["High"], self._message_content["Low"],
+             self._message_content["Close"], self._message_content["Volume"])
+        )
+        if event == StreamEvent.DUPLICATE:
+            return
         current = CurrentBar(
             trading_time=self._message_content["Time"],
             symbol=symbol,
@@ -37,11 +42,4 @@ class BarDataStream(BaseDataStream[CurrentBar]):
             value=self._message_content["Value"]
         )
 
-        # update current data
-        self._current[symbol] = current
-        if current.volume > prev.volume:
-            # merge data to dataframe
-            new_data = pd.DataFrame([current])
-            self._df[symbol] = pd.concat([self._df[symbol], new_data], ignore_index=True)
-        else:
-            logging.warning("Duplicate or empty index data...")
+        self._update(symbol, current, event)
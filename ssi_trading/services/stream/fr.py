@@ -1,13 +1,11 @@
-import logging
-
-import pandas as pd
-
-from ssi_trading.models.definitions import DataChannel
+from ssi_trading.models.definitions import DataChannel, StreamEvent
 from ssi_trading.models.data import CurrentForeignRoom
 from ssi_trading.services.stream import BaseDataStream
 
 
 class ForeignRoomDataStream(BaseDataStream[CurrentForeignRoom]):
+    CHANGE_FIELDS = ("current_room", "buy_volume", "sell_volume")
+
     def __init__(self, config):
         # the bar stream will receive OHLCV, example:
         """
@@ -27,7 +25,12 @@ class ForeignRoomDataStream(BaseDataStream[CurrentForeignRoom]):
         super().on_message(message)
         # process message
         symbol = self._message_content["Symbol"]
-        prev = self._current[symbol]
+        event = self._sequencer.classify(
+            symbol, self._message_content["Time"], self._message_content["BuyVol"] + self._message_content["SellVol"],
+            (self._message_content["CurrentRoom"],)
+        )
+        if event == StreamEvent.DUPLICATE:
+            return
         current = CurrentForeignRoom(
             trading_time=self._message_content["Time"],
             symbol=symbol,
@@ -39,11 +42,4 @@ class ForeignRoomDataStream(BaseDataStream[CurrentForeignRoom]):
             sell_value=self._message_content["SellVal"],
         )
 
-        # update current data
-        self._current[symbol] = current
-        if current.buy_volume > prev.buy_volume and current.sell_volume > prev.sell_volume:
-            # merge data to dataframe
-            new_data = pd.DataFrame([current])
-            self._df[symbol] = pd.concat([self._df[symbol], new_data], ignore_index=True)
-        else:
-            logging.warning("Duplicate or empty index data...")
+        self._update(symbol, current, event)
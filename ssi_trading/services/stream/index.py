@@ -1,13 +1,11 @@
-import logging
-
-import pandas as pd
-
-from ssi_trading.models.definitions import DataChannel
+from ssi_trading.models.definitions import DataChannel, StreamEvent
 from ssi_trading.models.data import CurrentIndex
 from ssi_trading.services.stream import BaseDataStream
 
 
 class IndexDataStream(BaseDataStream[CurrentIndex]):
+    CHANGE_FIELDS = ("current_value",)
+
     def __init__(self, config):
         # the index stream will receive tick data of each market, example:
         """
@@ -28,7 +26,12 @@ class IndexDataStream(BaseDataStream[CurrentIndex]):
         super().on_message(message)
         # process message
         index_name = self._message_content["IndexName"]
-        prev = self._current[index_name]
+        event = self._sequencer.classify(
+            index_name, self._message_content["Time"], self._message_content["TotalQtty"],
+            (self._message_content["IndexValue"],)
+        )
+        if event == StreamEvent.DUPLICATE:
+            return
         current = CurrentIndex(
             trading_time=self._message_content["Time"],
             name=index_name,
@@ -40,11 +43,4 @@ class IndexDataStream(BaseDataStream[CurrentIndex]):
             change_percent=self._message_content["RatioChange"]
         )
 
-        # update current data
-        self._current[index_name] = current
-        if current.total_volume > prev.total_volume:
-            # merge data to dataframe
-            new_data = pd.DataFrame([current])
-            self._df[index_name] = pd.concat([self._df[index_name], new_data], ignore_index=True)
-        else:
-            logging.warning("Duplicate or empty index data...")
+        self._update(index_name, current, event)
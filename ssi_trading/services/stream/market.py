@@ -1,13 +1,13 @@
-import logging
+from typing import Dict, Union
 
-import pandas as pd
-
-from ssi_trading.models.definitions import DataChannel
-from ssi_trading.models.data import CurrentMarket
+from ssi_trading.models.definitions import DataChannel, StreamEvent
+from ssi_trading.models.data import CurrentMarket, MarketDepth
 from ssi_trading.services.stream import BaseDataStream
 
 
 class MarketDataStream(BaseDataStream[CurrentMarket]):
+    CHANGE_FIELDS = ("current_price", "bid_price_01", "ask_price_01")
+
     def __init__(self, config):
         # the price stream will receive tick data of each symbol, example:
         """
@@ -23,6 +23,7 @@ class MarketDataStream(BaseDataStream[CurrentMarket]):
         "Change":-6.099999999999909,"RatioChange":-0.47,"EstMatchedPrice":1283.9,"Side":null,"CloseQtty":0.0}'}
         """
         super().__init__(config, config.symbols, DataChannel.MARKET_DATA)
+        self._depth: Dict[str, MarketDepth] = {name: MarketDepth(symbol=name) for name in self._names}
 
     def create_instance(self) -> CurrentMarket:
         return CurrentMarket()
@@ -32,7 +33,13 @@ class MarketDataStream(BaseDataStream[CurrentMarket]):
         super().on_message(message)
         # process message
         symbol = self._message_content["Symbol"]
-        prev = self._current[symbol]
+        depth = self._parse_depth(symbol)
+        event = self._sequencer.classify(
+            symbol, self._message_content["Time"], self._message_content["TotalVol"],
+            (tuple(depth.bid_prices), tuple(depth.bid_volumes), tuple(depth.ask_prices), tuple(depth.ask_volumes))
+        )
+        if event == StreamEvent.DUPLICATE:
+            return
         current = CurrentMarket(
             trading_time=self._message_content["Time"],
             symbol=symbol,
@@ -51,14 +58,24 @@ class MarketDataStream(BaseDataStream[CurrentMarket]):
             ask_price_01=self._message_content["AskPrice1"],
             ask_volume_01=self._message_content["AskVol1"],
             price_change=self._message_content["Change"],
-            change_percent=self._message_content["RatioChange"]
+            change_percent=self._message_content["RatioChange"],
+            trading_session=self._message_content.get("TradingSession") or ""
         )
+        self._depth[symbol] = depth
+        self._update(symbol, current, event)
+
+    def _parse_depth(self, symbol: str) -> MarketDepth:
+        content = self._message_content
+        depth = MarketDepth(symbol=symbol, trading_time=content["Time"], exchange=content.get("Exchange") or "")
+        for level in range(1, 11):
+            bid_price, ask_price = content.get(f"BidPrice{level}"), content.get(f"AskPrice{level}")
+            if bid_price:
+                depth.bid_prices.append(bid_price)
+                depth.bid_volumes.append(content.get(f"BidVol{level}") or 0.0)
+            if ask_price:
+                depth.ask_prices.append(ask_price)
+                depth.ask_volumes.append(content.get(f"AskVol{level}") or 0.0)
+        return depth
 
-        # update current data
-        self._current[symbol] = current
-        if current.total_volume > prev.total_volume and current.current_volume != 0:
-            # merge data to dataframe
-            new_data = pd.DataFrame([current])
-            self._df[symbol] = pd.concat([self._df[symbol], new_data], ignore_index=True)
-        else:
-            logging.warning("Duplicate or empty tick data...")
+    def get_depth(self, symbol) -> Union[MarketDepth, None]:
+        return self._depth.get(symbol, None)
@@ -0,0 +1,53 @@
+# Description: Sequencing of the data stream messages.
+# Each message is keyed by (time, cumulative volume, book key) per symbol: an unchanged key is a duplicate,
+# a changed cumulative volume is a trade, any other change is a quote. Checks are O(1) and counted, not logged.
+# Messages without cumulative volume (bars, their volume is per bar) are keyed by time and book only, each new one is a trade.
+from typing import Dict, Tuple, Hashable, Union
+
+from ssi_trading.models.definitions import StreamEvent
+
+
+class Sequencer:
+    def __init__(self):
+        self._last: Dict[str, Tuple] = dict()
+        self._sequences: Dict[str, int] = dict()
+        self._counters: Dict[str, int] = {StreamEvent.TRADE: 0, StreamEvent.QUOTE: 0, StreamEvent.DUPLICATE: 0}
+
+    def classify(self, symbol: str, time: str, volume: Union[float, None], book: Hashable = None) -> str:
+        """
+        :param symbol:
+        :param time: exchange time of the message
+        :param volume: cumulative volume of the day, None if the message has none
+        :param book: hashable key of the prices of the message, ex: tuple of the order book levels
+        :return: StreamEvent
+        """
+        # the key keeps the book itself, equal hashes of different books are not duplicates
+        key = (time, volume, book)
+        last = self._last.get(symbol)
+        if last == key:
+            event = StreamEvent.DUPLICATE
+        else:
+            self._last[symbol] = key
+            self._sequences[symbol] = self._sequences.get(symbol, 0) + 1
+            event = StreamEvent.TRADE if last is None or volume is None or last[1] != volume else StreamEvent.QUOTE
+        self._counters[event] += 1
+        return event
+
+    def sequence(self, symbol: str) -> int:
+        """
+        :param symbol:
+        :return: number of non duplicate messages of the symbol
+        """
+        return self._sequences.get(symbol, 0)
+
+    def counters(self) -> Dict[str, int]:
+        return dict(self._counters)
+
+    def reset(self, symbol: str = None):
+        # a new trading day restarts the cumulative volumes
+        if symbol is None:
+            self._last.clear()
+            self._sequences.clear()
+        else:
+            self._last.pop(symbol, None)
+            self._sequences.pop(symbol, None)
@@ -1,5 +1,138 @@
+# Description: Trading stream of an account.
+# Notifications of the FastConnect trading hub are decoded into OrderEvent, FillEvent, OrderErrorEvent and
+# PositionEvent. Fills are derived from the cumulative filled quantity of the order events, so a notification
+# replayed after a reconnect never produces a fill twice, notifications up to the last notify id are skipped.
+#
+# {"type": "orderEvent", "notifyID": 1024, "data": {"account": "0901358", "orderID": "12658867",
+#  "instrumentID": "VN30F2106", "marketID": "VNFE", "buySell": "B", "orderType": "LO", "price": 1410.0,
+#  "quantity": 2, "filledQty": 1, "avgPrice": 1410.0, "cancelQty": 0, "orderStatus": "PF"}}
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Union
+
+from ssi_trading.config import STREAM_TERMINAL_ORDERS
+from ssi_trading.models.definitions import TradingEvent, OrderStatus
+from ssi_trading.models.trading import (
+    CreatedOrder, StockPosition, OrderEvent, FillEvent, OrderErrorEvent, PositionEvent
+)
 from ssi_trading.services.stream import BaseTradingStream
 
+TradingStreamEvent = Union[OrderEvent, FillEvent, OrderErrorEvent, PositionEvent]
+
+
+def _notify_id(message: dict, data: dict) -> Union[int, None]:
+    for source in (message, data):
+        for key in ("notifyID", "notifyId", "NotifyId"):
+            if source.get(key) is not None:
+                return int(source[key])
+    return None
+
+
+class TradingStream(BaseTradingStream[TradingStreamEvent]):
+    def __init__(self, config):
+        super().__init__(config)
+        # order id -> (filled quantity, filled value) of the working orders
+        self._fills: Dict[str, Tuple[float, float]] = dict()
+        # same for the last terminal orders, least recently updated first
+        self._terminal: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._decode_lock = threading.Lock()
+
+    def decode(self, message) -> List[TradingStreamEvent]:
+        message = json.loads(message) if isinstance(message, str) else message
+        data = message.get("data") or dict()
+        data = json.loads(data) if isinstance(data, str) else data
+        notify_id = _notify_id(message, data)
+        event_type = message.get("type")
+
+        with self._decode_lock:
+            if notify_id is not None:
+                if notify_id <= self._last_notify_id:
+                    logging.debug(f"Skip replayed notification {notify_id} of {self.account_id}")
+                    return []
+                self._last_notify_id = notify_id
+                self._config.NotifyId = notify_id
+            if event_type == TradingEvent.ORDER:
+                return self._order_events(data, -1 if notify_id is None else notify_id)
+        notify_id = -1 if notify_id is None else notify_id
+        if event_type == TradingEvent.ORDER_ERROR:
+            return [OrderErrorEvent(
+                account_id=self._account(data),
+                order_id=data.get("orderID"),
+                message=data.get("message") or data.get("errorMessage") or json.dumps(data),
+                notify_id=notify_id
+            )]
+        if event_type == TradingEvent.POSITION:
+            return [PositionEvent(position=self._position(data), notify_id=notify_id)]
+        logging.debug(f"Unknown trading notification {event_type}: {message}")
+        return []
+
+    def _account(self, data: dict) -> str:
+        # same case as the account id of the trading services
+        return str(data.get("account") or self.account_id).upper()
+
+    def _order_events(self, data: dict, notify_id: int) -> List[TradingStreamEvent]:
+        filled = float(data.get("filledQty") or 0)
+        quantity = data.get("quantity") or 0
+        order = CreatedOrder(
+            symbol=data.get("instrumentID"),
+            market_id=data.get("marketID"),
+            account_id=self._account(data),
+            order_side=data.get("buySell"),
+            order_type=data.get("orderType"),
+            order_price=data.get("price") or 0,
+            order_qty=quantity,
+            order_id=data.get("orderID"),
+            order_status=data.get("orderStatus"),
+            request_id=data.get("requestID"),
+            avg_price=data.get("avgPrice") or 0,
+            os_qty=quantity - filled - (data.get("cancelQty") or 0),
+            filled_qty=filled
+        )
+        events: List[TradingStreamEvent] = [OrderEvent(order=order, notify_id=notify_id)]
+
+        # fill of this notification: change of the filled quantity and of the filled value
+        prev_filled, prev_value = self._fills.get(order.order_id) or self._terminal.get(order.order_id) or (0.0, 0.0)
+        value = (order.avg_price or order.order_price) * filled
+        if filled > prev_filled:
+            qty = filled - prev_filled
+            events.append(FillEvent(
+                account_id=order.account_id,
+                order_id=order.order_id,
+                symbol=order.symbol,
+                order_side=order.order_side,
+                qty=qty,
+                price=(value - prev_value) / qty,
+                notify_id=notify_id
+            ))
+        fills = (max(filled, prev_filled), max(value, prev_value))
+        if order.order_status in OrderStatus.WORKING_ORDERS:
+            self._fills[order.order_id] = fills
+        else:
+            # a repeated terminal notification must not fill again
+            self._fills.pop(order.order_id, None)
+            self._terminal[order.order_id] = fills
+            self._terminal.move_to_end(order.order_id)
+            if len(self._terminal) > STREAM_TERMINAL_ORDERS:
+                self._terminal.popitem(last=False)
+        return events
 
-class TradingStream(BaseTradingStream):
-    pass
+    def _position(self, data: dict) -> StockPosition:
+        # derivative positions have long and short quantities, stock positions an on hand quantity
+        if "longQty" in data or "net" in data:
+            position = data.get("net", (data.get("longQty") or 0) - (data.get("shortQty") or 0))
+            avg_price = data.get("tradePrice")
+        else:
+            position = data.get("onHand") or 0
+            avg_price = data.get("avgPrice")
+        return StockPosition(
+            symbol=data.get("instrumentID"),
+            market_id=data.get("marketID"),
+            account_id=self._account(data),
+            position=position,
+            trading_pl=data.get("tradingPL"),
+            floating_pl=data.get("floatingPL"),
+            market_price=data.get("marketPrice"),
+            avg_price=avg_price
+        )
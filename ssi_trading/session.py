@@ -0,0 +1,214 @@
+# Description: Token and session lifecycle manager.
+# One client is authenticated per consumer and shared by every service and stream of that consumer.
+# A background thread refreshes access tokens before the SDK clients consider them expired,
+# so requests on the hot path never wait on authentication.
+# The sdk clients write the token (and the signature) of each request into shared headers, every request of a
+# shared client is sent under the request lock of its session.
+import datetime
+import logging
+import threading
+from typing import Dict, Tuple, Callable, Union, List, TYPE_CHECKING
+
+from ssi_trading.config import (
+    DataServiceConfig, TradingServiceConfig,
+    TOKEN_REFRESH_BEFORE_EXPIRY, TOKEN_REFRESH_CHECK_INTERVAL,
+)
+
+if TYPE_CHECKING:
+    # the sdk clients are imported on first authentication
+    from ssi_fc_data.fc_md_client import MarketDataClient
+    from ssi_fctrading import FCTradingClient
+
+
+class _Session:
+    def __init__(self, config, create: Callable, refresh: Callable, expires_at: Callable):
+        self.config = config
+        self.client = None
+        self.lock = threading.Lock()
+        self.request_lock = threading.RLock()
+        self._create = create
+        self._refresh = refresh
+        self._expires_at = expires_at
+        self.two_fa_code: Union[str, None] = None
+
+    def get_client(self):
+        # clients authenticate in their constructor
+        if self.client is None:
+            with self.lock:
+                if self.client is None:
+                    self.client = self._create(self.config)
+        return self.client
+
+    def expires_at(self) -> Union[datetime.datetime, None]:
+        return self._expires_at(self) if self.client is not None else None
+
+    def refresh(self, threshold: datetime.datetime):
+        # only the tokens expiring before threshold are refreshed
+        with self.lock:
+            self._refresh(self, threshold)
+
+
+def _token_expire_at(token_model) -> Union[datetime.datetime, None]:
+    # AccessTokenModel of both SDKs stores the expiry decoded from the jwt
+    return getattr(token_model, "_token_expire_at", None) if token_model is not None else None
+
+
+def _create_market_data_client(config: DataServiceConfig) -> "MarketDataClient":
+    from ssi_fc_data.fc_md_client import MarketDataClient
+    return MarketDataClient(config)
+
+
+def _refresh_market_data_token(session: _Session, threshold: datetime.datetime):
+    # authenticate on a fresh client then swap the token, requests in flight keep using the old one
+    fresh = _create_market_data_client(session.config)
+    session.client._access_token = fresh._access_token
+
+
+def _market_data_expires_at(session: _Session) -> Union[datetime.datetime, None]:
+    return _token_expire_at(session.client._access_token)
+
+
+def _create_trading_client(config: TradingServiceConfig) -> "FCTradingClient":
+    from ssi_fctrading import FCTradingClient
+    return FCTradingClient(
+        config.Url, config.ConsumerID,
+        config.ConsumerSecret, config.PrivateKey,
+        config.TwoFAType
+    )
+
+
+def _expires_before(token_model, threshold: datetime.datetime) -> bool:
+    expire_at = _token_expire_at(token_model)
+    return expire_at is not None and expire_at <= threshold
+
+
+def _refresh_trading_token(session: _Session, threshold: datetime.datetime):
+    # reader and writer tokens expire independently
+    if _expires_before(session.client._read_access_token, threshold):
+        fresh = _create_trading_client(session.config)
+        session.client._read_access_token = fresh._read_access_token
+    if session.two_fa_code is not None and _expires_before(session.client._write_access_token, threshold):
+        with session.request_lock:
+            session.client.verifyCode(session.two_fa_code)
+
+
+def _trading_expires_at(session: _Session) -> Union[datetime.datetime, None]:
+    # a writer token verified by OTP can't be refreshed, it only counts when a PIN is stored
+    tokens = [session.client._read_access_token]
+    if session.two_fa_code is not None:
+        tokens.append(session.client._write_access_token)
+    expires = [_token_expire_at(token) for token in tokens]
+    expires = [expire for expire in expires if expire is not None]
+    return min(expires) if len(expires) > 0 else None
+
+
+class CredentialManager:
+    def __init__(
+            self,
+            refresh_before_expiry: float = TOKEN_REFRESH_BEFORE_EXPIRY,
+            check_interval: float = TOKEN_REFRESH_CHECK_INTERVAL
+    ):
+        """
+        :param refresh_before_expiry: seconds before expiry a token is refreshed
+        :param check_interval: seconds between two checks of the refresher thread
+        """
+        self._refresh_before_expiry = refresh_before_expiry
+        self._check_interval = check_interval
+        self._sessions: Dict[Tuple, _Session] = dict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresher: Union[threading.Thread, None] = None
+
+    def _get_session(self, key: Tuple, config, create, refresh, expires_at) -> _Session:
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = _Session(config, create, refresh, expires_at)
+                self._sessions[key] = session
+        self.start()
+        return session
+
+    def market_data_client(self, config: DataServiceConfig) -> "MarketDataClient":
+        key = ("data", config.url, config.consumer_id, config.consumer_secret)
+        return self._get_session(
+            key, config, _create_market_data_client, _refresh_market_data_token, _market_data_expires_at
+        ).get_client()
+
+    def trading_client(self, config: TradingServiceConfig) -> "FCTradingClient":
+        key = ("trading", config.Url, config.consumer_id, config.consumer_secret, config.secret_key)
+        return self._get_session(
+            key, config, _create_trading_client, _refresh_trading_token, _trading_expires_at
+        ).get_client()
+
+    def trading_request_lock(self, config: TradingServiceConfig) -> threading.RLock:
+        """
+        Lock held by every request of the trading client of a consumer, shared by its services and streams
+        :param config:
+        :return:
+        """
+        key = ("trading", config.Url, config.consumer_id, config.consumer_secret, config.secret_key)
+        return self._get_session(key, config, _create_trading_client, _refresh_trading_token, _trading_expires_at).request_lock
+
+    def verify_code(self, config: TradingServiceConfig, code: str) -> str:
+        """
+        Get the writer token of a trading client, a PIN (TwoFAType 0) is kept to refresh the writer token later
+        :param config:
+        :param code: PIN or OTP
+        :return: writer access token
+        """
+        key = ("trading", config.Url, config.consumer_id, config.consumer_secret, config.secret_key)
+        session = self._get_session(key, config, _create_trading_client, _refresh_trading_token, _trading_expires_at)
+        client = session.get_client()
+        with session.request_lock:
+            token = client.verifyCode(code)
+        if config.TwoFAType == 0:
+            session.two_fa_code = code
+        return token
+
+    def refresh_expiring(self) -> List[Tuple]:
+        """
+        Refresh all tokens which expire within refresh_before_expiry seconds
+        :return: keys of refreshed sessions
+        """
+        threshold = datetime.datetime.now() + datetime.timedelta(seconds=self._refresh_before_expiry)
+        with self._lock:
+            sessions = list(self._sessions.items())
+
+        refreshed = []
+        for key, session in sessions:
+            expires_at = session.expires_at()
+            if expires_at is None or expires_at > threshold:
+                continue
+            try:
+                session.refresh(threshold)
+                refreshed.append(key)
+                logging.info(f"Refreshed access token of {key[0]} consumer {key[2][:4]}..., expired at {expires_at}")
+            except Exception as ex:
+                logging.exception(f"Error while refreshing access token of {key[0]} consumer {key[2][:4]}...: {ex}")
+        return refreshed
+
+    def _run(self):
+        while not self._stop_event.wait(self._check_interval):
+            self.refresh_expiring()
+
+    def start(self):
+        if self._refresher is None or not self._refresher.is_alive():
+            with self._lock:
+                if self._refresher is None or not self._refresher.is_alive():
+                    self._stop_event.clear()
+                    self._refresher = threading.Thread(target=self._run, name="ssi-token-refresher", daemon=True)
+                    self._refresher.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+
+
+_credential_manager = CredentialManager()
+
+
+def credential_manager() -> CredentialManager:
+    return _credential_manager
@@ -1,11 +1,17 @@
-# import all streams
-from ssi_trading.services.stream import BaseDataStream, BaseTradingStream
+from ssi_trading.lazy import lazy_attributes
 
-# data stream
-from ssi_trading.services.stream.fr import ForeignRoomDataStream
-from ssi_trading.services.stream.market import MarketDataStream
-from ssi_trading.services.stream.bar import BarDataStream
-from ssi_trading.services.stream.index import IndexDataStream
+# streams are imported on first access
+__getattr__, __dir__ = lazy_attributes(__name__, {
+    # import all streams
+    "BaseDataStream": "ssi_trading.services.stream",
+    "BaseTradingStream": "ssi_trading.services.stream",
 
-# trading stream: account, order, portfolio, trading, etc.
-from ssi_trading.services.stream.trading import TradingStream
+    # data stream
+    "ForeignRoomDataStream": "ssi_trading.services.stream.fr",
+    "MarketDataStream": "ssi_trading.services.stream.market",
+    "BarDataStream": "ssi_trading.services.stream.bar",
+    "IndexDataStream": "ssi_trading.services.stream.index",
+
+    # trading stream: account, order, portfolio, trading, etc.
+    "TradingStream": "ssi_trading.services.stream.trading",
+})
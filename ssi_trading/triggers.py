@@ -0,0 +1,375 @@
+# Description: Local stop, OCO and trailing orders.
+# Conditional orders (CreatedOrder with stop_type) are kept in memory and evaluated on the trades of the market
+# data stream, the triggered order is sent by create_order, so stops work the same for stocks and futures.
+# Each symbol has two books, one for orders triggered by a falling price and one for a rising price (prices negated),
+# fixed levels are kept in a heap and checked against the top only, trailing orders are grouped by the extreme price
+# since their creation: a new extreme merges groups instead of moving every order, so a tick costs O(log n).
+# Cancelled and superseded entries are dropped lazily and the heaps are compacted when they double in size.
+import copy
+import heapq
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union, Callable
+
+from ssi_trading.models.data import CurrentMarket
+from ssi_trading.models.definitions import OrderSide, OrderType, OrderStatus, StopOrderType, StreamEvent
+from ssi_trading.models.trading import CreatedOrder
+
+# heap entries of a book before the first compaction
+_COMPACT_MIN = 64
+
+
+class _Trigger:
+    def __init__(self, trigger_id: str, order: CreatedOrder):
+        self.trigger_id = trigger_id
+        self.order = order
+        self.active = True
+
+
+class _Group:
+    # trailing triggers sharing the same extreme, min heap of (step, seq, trigger)
+    def __init__(self, extreme: float):
+        self.extreme = extreme
+        self.steps = []
+        self.version = 0
+        self.alive = True
+
+
+class _Book:
+    def __init__(self):
+        """
+        Triggers firing when x <= level, x is the price for falling triggers and minus the price for rising ones
+        """
+        # max heap of levels: (-level, seq, trigger or group, version)
+        self._levels = []
+        # min heap of trailing groups by extreme: (extreme, seq, group, version)
+        self._extremes = []
+        self._seq = itertools.count()
+        self._compact_at = _COMPACT_MIN
+
+    def add(self, trigger: _Trigger, level: float):
+        heapq.heappush(self._levels, (-level, next(self._seq), trigger, 0))
+        self._compact()
+
+    def add_trailing(self, trigger: _Trigger, x: float, step: float):
+        group = _Group(x)
+        heapq.heappush(group.steps, (step, next(self._seq), trigger))
+        self._push_group(group)
+
+    def _push_group(self, group: _Group):
+        group.version += 1
+        heapq.heappush(self._levels, (-(group.extreme - group.steps[0][0]), next(self._seq), group, group.version))
+        heapq.heappush(self._extremes, (group.extreme, next(self._seq), group, group.version))
+        self._compact()
+
+    def _compact(self):
+        # drop the stale entries once the heaps doubled since the last compaction, stale entries passed live ones
+        if len(self._levels) + len(self._extremes) <= self._compact_at:
+            return
+        levels = []
+        for entry in self._levels:
+            item, version = entry[2], entry[3]
+            if isinstance(item, _Trigger):
+                if item.active:
+                    levels.append(entry)
+                continue
+            if not item.alive or version != item.version:
+                continue
+            # the level of the group only moves down, its entry is checked again when reached
+            item.steps = [step for step in item.steps if step[2].active]
+            heapq.heapify(item.steps)
+            if item.steps:
+                levels.append(entry)
+            else:
+                item.alive = False
+        self._levels = levels
+        heapq.heapify(self._levels)
+        self._extremes = [entry for entry in self._extremes if entry[2].alive and entry[3] == entry[2].version]
+        heapq.heapify(self._extremes)
+        self._compact_at = max(_COMPACT_MIN, 2 * (len(self._levels) + len(self._extremes)))
+
+    def on_price(self, x: float) -> List[_Trigger]:
+        # groups left behind by a new extreme are merged, the smaller group into the larger one
+        merged = None
+        while self._extremes and self._extremes[0][0] < x:
+            _, _, group, version = heapq.heappop(self._extremes)
+            if not group.alive or version != group.version:
+                continue
+            if merged is None:
+                merged = group
+                continue
+            if len(group.steps) > len(merged.steps):
+                merged, group = group, merged
+            for item in group.steps:
+                heapq.heappush(merged.steps, item)
+            group.alive = False
+        if merged is not None:
+            merged.extreme = x
+            self._push_group(merged)
+
+        fired = []
+        while self._levels and -self._levels[0][0] >= x:
+            _, _, item, version = heapq.heappop(self._levels)
+            if isinstance(item, _Trigger):
+                if item.active:
+                    fired.append(item)
+                continue
+            if not item.alive or version != item.version:
+                continue
+            # cancelled triggers are dropped when they reach the top
+            while item.steps and (not item.steps[0][2].active or item.extreme - item.steps[0][0] >= x):
+                _, _, trigger = heapq.heappop(item.steps)
+                if trigger.active:
+                    fired.append(trigger)
+            if item.steps:
+                self._push_group(item)
+            else:
+                item.alive = False
+        return fired
+
+
+class StopTriggerEngine:
+    def __init__(self, services, stream=None):
+        """
+        Evaluate stop orders locally and send the triggered orders
+        :param services: SSIServices or a trading service, create_order is called when an order is triggered
+        :param stream: MarketDataStream of the symbols, see attach
+        """
+        self._services = services
+        self._trigger_ids = itertools.count(1)
+        self._triggers: Dict[str, _Trigger] = dict()
+        # symbol -> (falling book, rising book)
+        self._books: Dict[str, tuple] = dict()
+        self._last_prices: Dict[str, float] = dict()
+        # trailing orders waiting for the first price of their symbol
+        self._waiting: Dict[str, List[_Trigger]] = dict()
+        # bull bear orders sent, waiting for their fill: ("order" or "request", account id, id) -> (order, keys)
+        self._brackets: Dict[tuple, tuple] = dict()
+        self._listeners: List[Callable[[str, CreatedOrder], None]] = []
+        self._lock = threading.Lock()
+        # orders are sent in trigger order, never on the stream thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ssi-stop")
+        if stream is not None:
+            self.attach(stream)
+
+    # region setup
+    def attach(self, stream):
+        """
+        Evaluate the orders on each trade of a MarketDataStream
+        :param stream:
+        :return:
+        """
+        stream.add_listener(self.on_market, [StreamEvent.TRADE])
+        return self
+
+    def add_listener(self, callback: Callable[[str, CreatedOrder], None]):
+        """
+        Register a callback called with (trigger id, order) after a triggered order is sent, order is None on failure
+        :param callback:
+        :return:
+        """
+        self._listeners.append(callback)
+        return self
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+    # endregion
+
+    # region orders
+    def submit(self, order: CreatedOrder) -> Union[str, None]:
+        """
+        Keep a stop order until it is triggered
+        DOWN: price <= stop_price, UP: price >= stop_price,
+        TRAILING_DOWN: price <= highest price since submit - stop_step, TRAILING_UP: price >= lowest price + stop_step,
+        OCO: take profit at stop_price +/- profit_step and stop loss at stop_price -/+ loss_step (sell closes a long),
+        BULL_BEAR: the order is sent now, an OCO on the filled quantity is kept once filled, see on_order_update
+        :param order: the triggered order is a copy without stop fields, LO orders without price use the last price
+        :return: trigger id, order id or request id of the entry for BULL_BEAR, None when the order is invalid, rejected
+        or the entry can't be tracked
+        """
+        if not self._validate(order):
+            return None
+        if order.stop_type == StopOrderType.BULL_BEAR:
+            return self._send_bracket(order)
+
+        with self._lock:
+            trigger = _Trigger(str(next(self._trigger_ids)), copy.copy(order))
+            self._triggers[trigger.trigger_id] = trigger
+            self._add(trigger)
+        return trigger.trigger_id
+
+    def cancel(self, trigger_id: str) -> bool:
+        with self._lock:
+            trigger = self._triggers.pop(trigger_id, None)
+            if trigger is None:
+                return False
+            trigger.active = False
+            return True
+
+    def pending(self, symbol: str = None) -> Dict[str, CreatedOrder]:
+        with self._lock:
+            return {
+                trigger_id: copy.copy(trigger.order) for trigger_id, trigger in self._triggers.items()
+                if symbol is None or trigger.order.symbol == symbol
+            }
+
+    def _validate(self, order: CreatedOrder) -> bool:
+        stop_type = order.stop_type
+        if stop_type in (StopOrderType.DOWN, StopOrderType.UP):
+            valid = (order.stop_price or 0) > 0
+        elif stop_type in (StopOrderType.TRAILING_DOWN, StopOrderType.TRAILING_UP):
+            valid = (order.stop_step or 0) > 0
+        elif stop_type in (StopOrderType.OCO, StopOrderType.BULL_BEAR):
+            valid = (order.profit_step or 0) > 0 or (order.loss_step or 0) > 0
+            valid = valid and (stop_type == StopOrderType.BULL_BEAR or (order.stop_price or 0) > 0)
+        else:
+            logging.error(f"Stop type {stop_type!r} of {order.symbol} is not supported.")
+            return False
+        if not valid or order.order_qty <= 0:
+            logging.error(f"Invalid {stop_type} stop order of {order.symbol}: {order}")
+        return valid and order.order_qty > 0
+
+    def _books_of(self, symbol: str) -> tuple:
+        books = self._books.get(symbol)
+        if books is None:
+            books = self._books[symbol] = (_Book(), _Book())
+        return books
+
+    def _add(self, trigger: _Trigger):
+        order = trigger.order
+        falling, rising = self._books_of(order.symbol)
+        if order.stop_type == StopOrderType.DOWN:
+            falling.add(trigger, order.stop_price)
+        elif order.stop_type == StopOrderType.UP:
+            rising.add(trigger, -order.stop_price)
+        elif order.stop_type == StopOrderType.OCO:
+            # both levels share the trigger, the first one reached deactivates the other
+            profit_step, loss_step = order.profit_step or 0, order.loss_step or 0
+            if order.order_side == OrderSide.SELL:
+                profit, loss = order.stop_price + profit_step, order.stop_price - loss_step
+                if profit_step:
+                    rising.add(trigger, -profit)
+                if loss_step:
+                    falling.add(trigger, loss)
+            else:
+                profit, loss = order.stop_price - profit_step, order.stop_price + loss_step
+                if profit_step:
+                    falling.add(trigger, profit)
+                if loss_step:
+                    rising.add(trigger, -loss)
+        else:
+            last_price = self._last_prices.get(order.symbol)
+            if last_price is None:
+                self._waiting.setdefault(order.symbol, []).append(trigger)
+            elif order.stop_type == StopOrderType.TRAILING_DOWN:
+                falling.add_trailing(trigger, last_price, order.stop_step)
+            else:
+                rising.add_trailing(trigger, -last_price, order.stop_step)
+    # endregion
+
+    # region bull bear
+    @staticmethod
+    def _bracket_keys(order: CreatedOrder) -> List[tuple]:
+        # the entry is known by its order id or, until the trading stream reports it, by its request id
+        keys = []
+        if order.order_id is not None:
+            keys.append(("order", order.account_id, str(order.order_id)))
+        if order.request_id is not None:
+            keys.append(("request", order.account_id, str(order.request_id)))
+        return keys
+
+    def _send_bracket(self, order: CreatedOrder) -> Union[str, None]:
+        entry = self._strip(order, order.order_price)
+        result = self._services.create_order(entry)
+        if result is None:
+            return None
+        keys = self._bracket_keys(result)
+        if not keys:
+            logging.warning(f"Bull bear entry of {order.symbol} sent but untracked: no order or request id, no OCO is armed.")
+            return None
+        with self._lock:
+            bracket = (copy.copy(order), keys)
+            for key in keys:
+                self._brackets[key] = bracket
+        # filled when sent, ex: the local matching engine
+        if result.order_status is not None and result.order_status not in OrderStatus.WORKING_ORDERS:
+            self.on_order_update(result)
+        return None if result.order_status in OrderStatus.REJECT_ORDERS else str(result.order_id or result.request_id)
+
+    def on_order_update(self, order: CreatedOrder):
+        """
+        Order update from the trading stream or the local matching engine, a filled bull bear entry arms its OCO
+        :param order:
+        :return:
+        """
+        keys = self._bracket_keys(order)
+        if order.order_status in OrderStatus.WORKING_ORDERS or not any(key in self._brackets for key in keys):
+            return
+        with self._lock:
+            bracket = next((self._brackets[key] for key in keys if key in self._brackets), None)
+            if bracket is None:
+                return
+            for key in bracket[1]:
+                self._brackets.pop(key, None)
+        bracket = bracket[0]
+        if not order.filled_qty:
+            return
+        # closing side on the filled quantity, around the average fill price
+        oco = copy.copy(bracket)
+        oco.order_side = OrderSide.SELL if bracket.order_side == OrderSide.BUY else OrderSide.BUY
+        oco.order_qty = int(order.filled_qty)
+        oco.stop_type = StopOrderType.OCO
+        oco.stop_price = order.avg_price or bracket.order_price
+        # sent at the triggering price
+        oco.order_price = 0
+        self.submit(oco)
+    # endregion
+
+    # region evaluation
+    def on_market(self, symbol: str, current: CurrentMarket):
+        price = current.current_price
+        if not price:
+            return
+        with self._lock:
+            self._last_prices[symbol] = price
+            waiting = self._waiting.pop(symbol, None)
+            for trigger in waiting or []:
+                self._add(trigger)
+            books = self._books.get(symbol)
+            if books is None:
+                return
+            fired = books[0].on_price(price) + books[1].on_price(-price)
+            for trigger in fired:
+                trigger.active = False
+                self._triggers.pop(trigger.trigger_id, None)
+        for trigger in fired:
+            logging.info(f"Stop order {trigger.trigger_id} {trigger.order.stop_type} of {symbol} triggered at {price}")
+            self._executor.submit(self._send, trigger, price)
+
+    @staticmethod
+    def _strip(order: CreatedOrder, price: float) -> CreatedOrder:
+        sent = copy.copy(order)
+        sent.stop_order = False
+        sent.stop_price = 0
+        sent.stop_type = StopOrderType.DEFAULT
+        sent.stop_step = 0
+        sent.loss_step = 0
+        sent.profit_step = 0
+        if sent.order_type == OrderType.LIMIT and not sent.order_price:
+            sent.order_price = price
+        return sent
+
+    def _send(self, trigger: _Trigger, price: float):
+        try:
+            result = self._services.create_order(self._strip(trigger.order, price))
+        except Exception as ex:
+            logging.error(f"Triggered order {trigger.trigger_id} of {trigger.order.symbol} failed: {ex}")
+            result = None
+        for callback in self._listeners:
+            try:
+                callback(trigger.trigger_id, result)
+            except Exception as ex:
+                logging.exception(f"Error in stop order listener {callback}: {ex}")
+    # endregion
@@ -1,8 +1,12 @@
 import logging
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from dateutil import parser
+from typing import Callable, Iterable, List, Any, Tuple
+
+from ssi_trading.config import PAGE_SIZES
+from ssi_trading.models.definitions import SecurityMarket, PriceBand, LotSize
 
 DEFAULT_DATE_FORMAT = "%d/%m/%Y"
 
@@ -29,13 +33,153 @@ def ensure_default_ssi_day_format(start_date, end_date):
         start_date = datetime.now().strftime(DEFAULT_DATE_FORMAT)
         end_date = (datetime.now() + timedelta(days=1)).strftime(DEFAULT_DATE_FORMAT)
     else:
-        if isinstance(start_date, str):
-            start_date = parser.parse(start_date)
+        start_date = _parse_date(start_date).strftime(DEFAULT_DATE_FORMAT)
+        end_date = _parse_date(end_date).strftime(DEFAULT_DATE_FORMAT)
 
-        if isinstance(end_date, str):
-            end_date = parser.parse(end_date)
+    return start_date, end_date
 
-        start_date = start_date.strftime(DEFAULT_DATE_FORMAT)
-        end_date = end_date.strftime(DEFAULT_DATE_FORMAT)
 
-    return start_date, end_date
+def _parse_date(value):
+    # dd/mm/yyyy first, other formats (ex: ISO 2024-07-01) are parsed without dayfirst
+    if not isinstance(value, str):
+        return value
+    try:
+        return datetime.strptime(value, DEFAULT_DATE_FORMAT)
+    except ValueError:
+        from dateutil import parser
+        return parser.parse(value)
+
+
+def _to_date(value):
+    return datetime.strptime(value, DEFAULT_DATE_FORMAT).date() if isinstance(value, str) else value
+
+
+def trading_days(start_date, end_date) -> int:
+    """
+    Weekdays of a date range, both ends included, holidays are counted
+    :param start_date: date or dd/mm/yyyy
+    :param end_date: date or dd/mm/yyyy
+    :return:
+    """
+    start_date, end_date = _to_date(start_date), _to_date(end_date)
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        return 0
+    weeks, rest = divmod(days, 7)
+    weekdays = weeks * 5
+    for i in range(rest):
+        if (start_date.weekday() + i) % 7 < 5:
+            weekdays += 1
+    return weekdays
+
+
+def page_size_for(expected_rows: int) -> int:
+    """
+    Smallest valid page size holding the expected rows in one page, the largest one when no page size does
+    :param expected_rows:
+    :return: one of PAGE_SIZES
+    """
+    for size in PAGE_SIZES:
+        if size >= expected_rows:
+            return size
+    return PAGE_SIZES[-1]
+
+
+def split_date_range(start_date, end_date, max_days: int) -> List[Tuple[str, str]]:
+    """
+    Split a date range in consecutive ranges of at most max_days calendar days, oldest first
+    :param start_date: date or dd/mm/yyyy
+    :param end_date: date or dd/mm/yyyy
+    :param max_days:
+    :return: (start, end) in dd/mm/yyyy
+    """
+    start_date, end_date = _to_date(start_date), _to_date(end_date)
+    ranges = []
+    while start_date <= end_date:
+        chunk_end = min(end_date, start_date + timedelta(days=max_days - 1))
+        ranges.append((start_date.strftime(DEFAULT_DATE_FORMAT), chunk_end.strftime(DEFAULT_DATE_FORMAT)))
+        start_date = chunk_end + timedelta(days=1)
+    return ranges
+
+
+def tick_size(price, market: str = SecurityMarket.HOSE):
+    """
+    Tick size of a price: HOSE 10/50/100 VND by price range, HNX and UPCOM 100 VND, derivatives 0.1 point
+    :param price: float or numpy array
+    :param market: SecurityMarket
+    :return: float or numpy array
+    """
+    # numpy is imported by the first price computation, not by the services
+    import numpy as np
+    price = np.asarray(price, dtype=float)
+    if market == SecurityMarket.HOSE:
+        ticks = np.where(price < 10000, 10.0, np.where(price < 50000, 50.0, 100.0))
+    elif market == SecurityMarket.DER:
+        ticks = np.full(price.shape, 0.1)
+    else:
+        ticks = np.full(price.shape, 100.0)
+    return ticks if ticks.ndim else float(ticks)
+
+
+def round_to_tick(price, market: str = SecurityMarket.HOSE, mode: str = "nearest"):
+    """
+    :param price: float or numpy array
+    :param market: SecurityMarket
+    :param mode: nearest, down or up
+    :return: float or numpy array
+    """
+    import numpy as np
+    price = np.asarray(price, dtype=float)
+    ticks = np.asarray(tick_size(price, market))
+    steps = price / ticks
+    if mode == "down":
+        steps = np.floor(steps + 1e-9)
+    elif mode == "up":
+        steps = np.ceil(steps - 1e-9)
+    else:
+        steps = np.round(steps)
+    rounded = np.round(steps * ticks, 1)
+    return rounded if rounded.ndim else float(rounded)
+
+
+def price_band(ref_price, market: str = SecurityMarket.HOSE):
+    """
+    Floor and ceiling price of a session from the reference price
+    :param ref_price: float or numpy array
+    :param market: SecurityMarket
+    :return: (floor, ceiling)
+    """
+    import numpy as np
+    band = getattr(PriceBand, market or SecurityMarket.HOSE, PriceBand.HOSE)
+    ref_price = np.asarray(ref_price, dtype=float)
+    return round_to_tick(ref_price * (1 - band), market, "up"), round_to_tick(ref_price * (1 + band), market, "down")
+
+
+def lot_size(market: str = SecurityMarket.HOSE) -> int:
+    return getattr(LotSize, market or SecurityMarket.HOSE, LotSize.HOSE)
+
+
+def run_concurrently(fn: Callable[[Any], Any], items: Iterable[Any], max_workers: int = 8) -> List[Any]:
+    """
+    Run fn over items on a bounded thread pool, results are returned in the same order as items.
+    An exception raised by fn is logged and its result is None, so one failed item never aborts the batch.
+    :param fn:
+    :param items:
+    :param max_workers:
+    :return:
+    """
+    def _safe_call(item):
+        try:
+            return fn(item)
+        except Exception as ex:
+            logging.exception(f"Error while running {getattr(fn, '__name__', fn)} on {item}: {ex}")
+            return None
+
+    items = list(items)
+    if len(items) == 0:
+        return []
+    if len(items) == 1 or max_workers <= 1:
+        return [_safe_call(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(_safe_call, items))
@@ -3,13 +3,9 @@ import time
 
 from dotenv import load_dotenv
 
-from ssi_trading.config import TradingServiceConfig, DataServiceConfig
+from ssi_trading.config import TradingServiceConfig, DataServiceConfig, BootstrapConfig
+from ssi_trading.models.definitions import DataChannel
 from ssi_trading.server import SSIServices
-from ssi_trading.services.client.data import MarketDataService
-from ssi_trading.services.paper.futures import PaperFutureTradingService
-from ssi_trading.services.stream.bar import BarDataStream
-from ssi_trading.services.stream.index import IndexDataStream
-from ssi_trading.services.stream.market import MarketDataStream
 import os
 
 
@@ -58,20 +54,18 @@ if __name__ == "__main__":
         account_type="future"
     )
 
-    ssis = SSIServices().add_trading_service(
-        service=PaperFutureTradingService(trading_config)
-    ).add_data_stream(
-        stream=MarketDataStream(market_config)
-    ).add_data_stream(
-        stream=IndexDataStream(index_config)
-    ).add_data_stream(
-        stream=BarDataStream(fr_config)
-    ).add_data_service(
-        service=MarketDataService(data_config)
-    )
-
-    ssis.start_data_stream()
-    ssis.start_trading_stream()
+    # clients are authenticated concurrently, then the services are built and the streams started
+    ssis = SSIServices.bootstrap(BootstrapConfig(
+        data_service=data_config,
+        data_streams={
+            DataChannel.MARKET_DATA: market_config,
+            DataChannel.INDEX_DATA: index_config,
+            DataChannel.BAR_DATA: bar_config,
+        },
+        trading_services=[trading_config],
+        start_streams=True
+    ))
+    logging.info(f"Startup timings : {ssis.startup_timings}")
 
     while True:
         time.sleep(60)